@@ -1,58 +1,280 @@
-import json
-import os
+import argparse
+import sys
+import time
+from calendar import monthcalendar
 from datetime import datetime, timedelta
 import tkinter as tk
-from tkinter import ttk, messagebox, simpledialog
-from tkcalendar import Calendar
+from tkinter import ttk, messagebox, simpledialog, filedialog
+
+from core import (CONFLICT_LIMIT, DB_FILE, PRIORITIES, SQLITE_FILE, StudentDayCore, ValidationError, event_row,
+                  note_row, open_repository, span_text, task_row, today)
+from instrumentation import recorder, span
+from recurrence import REPEATS
+from reminders import ReminderQueue, load_watermark, save_watermark
+from search import SearchScheduler
+from treeview import TreeViewModel, VirtualTreeView
+from storage import KINDS
+from transfer import detect_format
+
+
+# Типы записей вкладок в порядке их следования; у вкладок календаря, статистики и диагностики своего типа нет
+TAB_KINDS = ("tasks", "events", "notes", None, None, None)
+
+MONTH_NAMES = ("Январь", "Февраль", "Март", "Апрель", "Май", "Июнь",
+               "Июль", "Август", "Сентябрь", "Октябрь", "Ноябрь", "Декабрь")
+WEEKDAY_NAMES = ("Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс")
+
+# Значение списка повтора для разового события
+NO_REPEAT = "Нет"
+
+# Сетка месяца: шесть недель покрывают любой месяц
+CALENDAR_CELLS = 6 * 7
+
+# Целевое время от запуска до первых строк в активной вкладке, мс
+FIRST_PAINT_TARGET_MS = 300
+
+# Период проверки изменений, сделанных другими запущенными копиями приложения, мс
+SYNC_INTERVAL_MS = 1000
+
+# Период проверки задержки цикла событий Tk и обновления вкладки диагностики, мс
+IDLE_PROBE_MS = 100
+DIAGNOSTICS_INTERVAL_MS = 1000
+
+IMPORT_FILE_TYPES = (("CSV", "*.csv"), ("iCalendar", "*.ics"), ("Выгрузка JSON", "*.json"), ("Все файлы", "*.*"))
+EXPORT_FILE_TYPES = (("CSV", "*.csv"), ("iCalendar", "*.ics"), ("Выгрузка JSON", "*.json"))
+
+
+def calendar_widget(parent):
+    """Календарь выбора даты; tkcalendar импортируется при первом открытии диалога, а не при запуске"""
+    from tkcalendar import Calendar
+    return Calendar(parent, selectmode="day", date_pattern="yyyy-mm-dd")
 
 
 class StudentDayApp:
-    def __init__(self, root):
+    def __init__(self, root, storage_mode="json", columnar=False):
+        self.started = time.perf_counter()
+        self.startup_times = {}
         self.root = root
         self.root.title("День студента 25")
         self.root.geometry("800x600")
 
         # Инициализация базы данных
-        self.db_file = "student_tasks.json"
-        self.tasks = []
-        self.events = []
-        self.notes = []
-
+        self.db_file = DB_FILE
+        self.sqlite_file = SQLITE_FILE
+        self.reminder_file = "student_reminders.json"
+        self.storage_mode = storage_mode
+        self.columnar = columnar
+        self.core = None
+        self.repo = None
+
+        # Записи, проверка, поиск и статистика живут в ядре; окно только показывает их.
+        # Поисковые индексы ядра строятся в фоне при первом показе вкладки
         self.load_data()
-
-        # Создание интерфейса
+        self.midnight_job = None
+
+        # Напоминания хранятся в куче по времени срабатывания, ждет всегда один таймер
+        self.reminders = ReminderQueue(load_watermark(self.reminder_file))
+        self.reminder_job = None
+        self.reminder_time = None
+        self.repo.subscribe(self.on_record_change)
+
+        # Поиск при наборе текста откладывается и при больших объемах уходит в фоновый поток
+        self.search_scheduler = SearchScheduler(self.root)
+
+        # Типы, чьи записи уже приняты интерфейсом, и вкладки, списки которых заполнены
+        self.installed = set()
+        self.shown = set()
+        self.load_job = None
+        self.sync_job = None
+        # Статистика и таймер напоминаний обновляются один раз после серии изменений
+        self.change_job = None
+        # Календарь перерисовывается после изменений задач и событий, только если он открыт
+        self.calendar_dirty = True
+        # Замеры вкладки диагностики: проба задержки цикла Tk и обновление таблицы
+        self.idle_job = None
+        self.idle_expected = None
+        self.diagnostics_job = None
+
+        # Окно создается сразу, записи загружаются в фоне: сначала активная вкладка
         self.create_widgets()
+        self.notebook.bind("<<NotebookTabChanged>>", self.on_tab_changed)
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.root.update_idletasks()
+        self.mark_startup("window")
+        if recorder.enabled:
+            self.start_diagnostics()
 
-        # Обновление интерфейса
-        self.update_task_list()
-        self.update_event_list()
-        self.update_note_list()
+        self.core.load()
+        self.load_job = self.root.after(10, self.poll_loading)
 
     def load_data(self):
-        """Загрузка данных из JSON файла"""
-        if os.path.exists(self.db_file):
-            with open(self.db_file, "r", encoding="utf-8") as f:
-                data = json.load(f)
-                self.tasks = data.get("tasks", [])
-                self.events = data.get("events", [])
-                self.notes = data.get("notes", [])
+        """Подключение хранилища данных: снимок с журналом (JSON или двоичный) или SQLite"""
+        self.core = StudentDayCore(open_repository(self.storage_mode, self.db_file, self.sqlite_file,
+                                                   self.columnar))
+        self.repo = self.core.repo
+
+    def poll_loading(self):
+        """Прием загруженных типов записей в интерфейс"""
+        self.load_job = None
+        if self.repo.load_error is not None:
+            messagebox.showerror("Ошибка", f"Не удалось загрузить данные: {self.repo.load_error}")
+            return
+        for kind in KINDS:
+            if kind not in self.installed and self.repo.is_loaded(kind):
+                self.install_kind(kind)
+        if len(self.installed) < len(KINDS):
+            self.load_job = self.root.after(10, self.poll_loading)
+        else:
+            self.mark_startup("loaded")
+            self.sync_job = self.root.after(SYNC_INTERVAL_MS, self.poll_changes)
+
+    def poll_changes(self):
+        """Прием изменений из других копий приложения: обновляются только затронутые списки"""
+        try:
+            changed = self.repo.sync()
+        except OSError:
+            # Файл мог быть недоступен в момент проверки, повтор через период
+            changed = set()
+        for kind in changed:
+            self.refresh_kind(kind)
+        self.sync_job = self.root.after(SYNC_INTERVAL_MS, self.poll_changes)
+
+    def reinstall_kind(self, kind):
+        """Повторный подсчет статистики, напоминаний и индекса типа, если неизвестно, что изменилось"""
+        records = self.core.reinstall(kind)
+        self.show_stats()
+        self.refresh_calendar(kind)
+        if kind == "events":
+            self.reminders = ReminderQueue(self.reminders.watermark)
+            self.reminders.build(records)
+            self.schedule_reminder()
+        if kind in self.shown:
+            self.build_search_index(kind)
+
+    def install_kind(self, kind):
+        """Учет загруженных записей в статистике и напоминаниях; список заполняется, если вкладка открыта"""
+        records = self.core.install(kind)
+        self.installed.add(kind)
+        self.show_stats()
+        self.refresh_calendar(kind)
+
+        if kind == "events":
+            self.reminders.build(records)
+            # Напоминания, пропущенные пока приложение было закрыто, показываются сразу
+            self.schedule_reminder()
+        if kind == self.current_kind():
+            self.show_kind(kind)
+
+    def current_kind(self):
+        """Тип записей открытой вкладки"""
+        return TAB_KINDS[self.notebook.index("current")]
+
+    def on_tab_changed(self, event=None):
+        """Открытая вкладка загружается первой, ее список заполняется при первом показе"""
+        kind = self.current_kind()
+        if kind is None:
+            if self.calendar_visible():
+                # Календарю нужны задачи и события, они загружаются раньше заметок
+                for calendar_kind in ("tasks", "events"):
+                    if calendar_kind not in self.installed:
+                        self.repo.prioritize(calendar_kind)
+                if self.calendar_dirty:
+                    self.show_calendar()
+            return
+        if kind not in self.installed:
+            self.repo.prioritize(kind)
+        elif kind not in self.shown:
+            self.show_kind(kind)
+
+    def show_kind(self, kind):
+        """Первое заполнение списка вкладки и запуск построения ее поискового индекса"""
+        self.shown.add(kind)
+        self.build_search_index(kind)
+        self.refresh_kind(kind)
+        if len(self.shown) == 1:
+            self.root.update_idletasks()
+            self.mark_startup("first_paint")
+
+    def refresh_kind(self, kind):
+        """Обновление списка вкладки по разнице со строками в Treeview"""
+        if kind == "tasks":
+            self.update_task_list()
+        elif kind == "events":
+            self.update_event_list()
         else:
-            self.tasks = []
-            self.events = []
-            self.notes = []
-
-    def save_data(self):
-        """Сохранение данных в JSON файл"""
-        data = {
-            "tasks": self.tasks,
-            "events": self.events,
-            "notes": self.notes
-        }
-        with open(self.db_file, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=4)
+            self.update_note_list()
+
+    def build_search_index(self, kind):
+        """Построение индекса в фоновом потоке по записям на момент запуска"""
+        records = self.repo.all(kind)
+
+        def build(cancelled):
+            index = self.core.new_search_index(kind)
+            index.build(records)
+            return index
+
+        self.search_scheduler.run_in_background(("index", kind), build,
+                                                lambda index: self.core.install_search_index(kind, index))
+
+    def mark_startup(self, stage):
+        """Запоминание времени от запуска до этапа загрузки, мс"""
+        self.startup_times[stage] = (time.perf_counter() - self.started) * 1000
+        recorder.record(f"startup.{stage}", self.startup_times[stage] / 1000, self.started)
+
+    def on_record_change(self, kind, op, payload):
+        """Показ статистики и перепланирование напоминаний после изменения записи (ядро уже учло его)"""
+        if op == "reload":
+            self.reinstall_kind(kind)
+            return
+
+        if kind == "events":
+            if op == "put":
+                self.reminders.put(payload, datetime.now())
+            else:
+                self.reminders.remove(payload)
+        if kind in self.core.date_indexes:
+            self.calendar_dirty = True
+        # Массовый импорт дает тысячи изменений подряд, а подписи обновляются один раз
+        if self.change_job is None:
+            self.change_job = self.root.after_idle(self.after_changes)
+
+    def after_changes(self):
+        """Показ статистики и перепланирование напоминаний после серии изменений"""
+        self.change_job = None
+        self.show_stats()
+        self.schedule_reminder()
+        if self.calendar_dirty and self.calendar_visible():
+            self.show_calendar()
+
+    def on_close(self):
+        """Закрытие приложения с дожиданием записи данных"""
+        self.search_scheduler.shutdown()
+        if self.midnight_job is not None:
+            self.root.after_cancel(self.midnight_job)
+        if self.load_job is not None:
+            self.root.after_cancel(self.load_job)
+        if self.sync_job is not None:
+            self.root.after_cancel(self.sync_job)
+        if self.change_job is not None:
+            self.root.after_cancel(self.change_job)
+        self.stop_diagnostics()
+        recorder.stop_profile()
+        if self.reminder_job is not None:
+            self.root.after_cancel(self.reminder_job)
+        save_watermark(self.reminder_file, self.reminders.watermark)
+        self.core.close()
+        self.root.destroy()
 
     def create_widgets(self):
         """Создание элементов интерфейса"""
+        # Меню обмена данными с другими программами
+        menu = tk.Menu(self.root)
+        file_menu = tk.Menu(menu, tearoff=0)
+        file_menu.add_command(label="Импорт...", command=self.import_dialog)
+        file_menu.add_command(label="Экспорт...", command=self.export_dialog)
+        menu.add_cascade(label="Файл", menu=file_menu)
+        self.root.config(menu=menu)
+
         # Панель вкладок
         self.notebook = ttk.Notebook(self.root)
         self.notebook.pack(fill=tk.BOTH, expand=True)
@@ -72,11 +294,21 @@ class StudentDayApp:
         self.notebook.add(self.notes_tab, text="Заметки")
         self.create_notes_tab()
 
+        # Вкладка календаря
+        self.calendar_tab = ttk.Frame(self.notebook)
+        self.notebook.add(self.calendar_tab, text="Календарь")
+        self.create_calendar_tab()
+
         # Вкладка статистики
         self.stats_tab = ttk.Frame(self.notebook)
         self.notebook.add(self.stats_tab, text="Статистика")
         self.create_stats_tab()
 
+        # Вкладка диагностики
+        self.diagnostics_tab = ttk.Frame(self.notebook)
+        self.notebook.add(self.diagnostics_tab, text="Диагностика")
+        self.create_diagnostics_tab()
+
     def create_tasks_tab(self):
         """Создание вкладки задач"""
         # Панель управления задачами
@@ -88,6 +320,9 @@ class StudentDayApp:
         ttk.Button(task_control_frame, text="Удалить", command=self.delete_task).pack(side=tk.LEFT, padx=2)
         ttk.Button(task_control_frame, text="Отметить выполненной", command=self.mark_task_completed).pack(side=tk.LEFT,
                                                                                                            padx=2)
+        ttk.Button(task_control_frame, text="Приоритет...", command=self.set_priority_dialog).pack(side=tk.LEFT, padx=2)
+        ttk.Button(task_control_frame, text="Перенести срок...",
+                   command=lambda: self.reschedule_dialog("tasks")).pack(side=tk.LEFT, padx=2)
 
         # Фильтры задач
         filter_frame = ttk.Frame(self.tasks_tab)
@@ -111,7 +346,8 @@ class StudentDayApp:
         self.task_list_frame.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
 
         columns = ("id", "title", "priority", "due_date", "completed")
-        self.task_tree = ttk.Treeview(self.task_list_frame, columns=columns, show="headings", selectmode="browse")
+        # Выделение нескольких строк для действий над всеми сразу
+        self.task_tree = ttk.Treeview(self.task_list_frame, columns=columns, show="headings", selectmode="extended")
 
         self.task_tree.heading("id", text="ID")
         self.task_tree.heading("title", text="Название")
@@ -125,8 +361,9 @@ class StudentDayApp:
         self.task_tree.column("due_date", width=100, anchor=tk.CENTER)
         self.task_tree.column("completed", width=100, anchor=tk.CENTER)
 
-        scrollbar = ttk.Scrollbar(self.task_list_frame, orient=tk.VERTICAL, command=self.task_tree.yview)
-        self.task_tree.configure(yscroll=scrollbar.set)
+        # Полоса прокрутки управляется виртуальным списком
+        scrollbar = ttk.Scrollbar(self.task_list_frame, orient=tk.VERTICAL)
+        self.task_view = VirtualTreeView(self.task_tree, scrollbar, task_row)
 
         self.task_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
@@ -137,7 +374,7 @@ class StudentDayApp:
 
         ttk.Label(search_frame, text="Поиск:").pack(side=tk.LEFT)
         self.task_search_var = tk.StringVar()
-        self.task_search_var.trace("w", lambda *args: self.update_task_list())
+        self.task_search_var.trace("w", lambda *args: self.schedule_task_list())
         ttk.Entry(search_frame, textvariable=self.task_search_var).pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
 
     def create_events_tab(self):
@@ -150,6 +387,8 @@ class StudentDayApp:
                                                                                                      padx=2)
         ttk.Button(event_control_frame, text="Редактировать", command=self.edit_event).pack(side=tk.LEFT, padx=2)
         ttk.Button(event_control_frame, text="Удалить", command=self.delete_event).pack(side=tk.LEFT, padx=2)
+        ttk.Button(event_control_frame, text="Перенести...",
+                   command=lambda: self.reschedule_dialog("events")).pack(side=tk.LEFT, padx=2)
 
         # Фильтры событий
         filter_frame = ttk.Frame(self.events_tab)
@@ -170,23 +409,27 @@ class StudentDayApp:
         self.event_list_frame = ttk.Frame(self.events_tab)
         self.event_list_frame.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
 
-        columns = ("id", "title", "date", "time", "reminder")
-        self.event_tree = ttk.Treeview(self.event_list_frame, columns=columns, show="headings", selectmode="browse")
+        columns = ("id", "title", "date", "time", "repeat", "reminder")
+        # Выделение нескольких строк для действий над всеми сразу
+        self.event_tree = ttk.Treeview(self.event_list_frame, columns=columns, show="headings", selectmode="extended")
 
         self.event_tree.heading("id", text="ID")
         self.event_tree.heading("title", text="Название")
         self.event_tree.heading("date", text="Дата")
         self.event_tree.heading("time", text="Время")
+        self.event_tree.heading("repeat", text="Повтор")
         self.event_tree.heading("reminder", text="Напоминание")
 
         self.event_tree.column("id", width=50, anchor=tk.CENTER)
         self.event_tree.column("title", width=200)
         self.event_tree.column("date", width=100, anchor=tk.CENTER)
-        self.event_tree.column("time", width=100, anchor=tk.CENTER)
+        self.event_tree.column("time", width=80, anchor=tk.CENTER)
+        self.event_tree.column("repeat", width=150, anchor=tk.CENTER)
         self.event_tree.column("reminder", width=100, anchor=tk.CENTER)
 
-        scrollbar = ttk.Scrollbar(self.event_list_frame, orient=tk.VERTICAL, command=self.event_tree.yview)
-        self.event_tree.configure(yscroll=scrollbar.set)
+        # Полоса прокрутки управляется виртуальным списком
+        scrollbar = ttk.Scrollbar(self.event_list_frame, orient=tk.VERTICAL)
+        self.event_view = VirtualTreeView(self.event_tree, scrollbar, event_row)
 
         self.event_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
@@ -197,7 +440,7 @@ class StudentDayApp:
 
         ttk.Label(search_frame, text="Поиск:").pack(side=tk.LEFT)
         self.event_search_var = tk.StringVar()
-        self.event_search_var.trace("w", lambda *args: self.update_event_list())
+        self.event_search_var.trace("w", lambda *args: self.schedule_event_list())
         ttk.Entry(search_frame, textvariable=self.event_search_var).pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
 
     def create_notes_tab(self):
@@ -215,7 +458,8 @@ class StudentDayApp:
         self.note_list_frame.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
 
         columns = ("id", "title", "created", "updated")
-        self.note_tree = ttk.Treeview(self.note_list_frame, columns=columns, show="headings", selectmode="browse")
+        # Выделение нескольких строк для действий над всеми сразу
+        self.note_tree = ttk.Treeview(self.note_list_frame, columns=columns, show="headings", selectmode="extended")
 
         self.note_tree.heading("id", text="ID")
         self.note_tree.heading("title", text="Название")
@@ -227,8 +471,9 @@ class StudentDayApp:
         self.note_tree.column("created", width=150, anchor=tk.CENTER)
         self.note_tree.column("updated", width=150, anchor=tk.CENTER)
 
-        scrollbar = ttk.Scrollbar(self.note_list_frame, orient=tk.VERTICAL, command=self.note_tree.yview)
-        self.note_tree.configure(yscroll=scrollbar.set)
+        # Полоса прокрутки управляется виртуальным списком
+        scrollbar = ttk.Scrollbar(self.note_list_frame, orient=tk.VERTICAL)
+        self.note_view = VirtualTreeView(self.note_tree, scrollbar, note_row)
 
         self.note_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
@@ -239,29 +484,180 @@ class StudentDayApp:
 
         ttk.Label(search_frame, text="Поиск:").pack(side=tk.LEFT)
         self.note_search_var = tk.StringVar()
-        self.note_search_var.trace("w", lambda *args: self.update_note_list())
+        self.note_search_var.trace("w", lambda *args: self.schedule_note_list())
         ttk.Entry(search_frame, textvariable=self.note_search_var).pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
 
+    def create_calendar_tab(self):
+        """Создание вкладки календаря: сетка месяца с отметкой занятых дней и дела выбранного дня"""
+        now = datetime.now()
+        self.calendar_month = (now.year, now.month)
+        self.calendar_day = today()
+
+        control_frame = ttk.Frame(self.calendar_tab)
+        control_frame.pack(fill=tk.X, padx=5, pady=5)
+
+        ttk.Button(control_frame, text="◀", width=3, command=lambda: self.shift_month(-1)).pack(side=tk.LEFT, padx=2)
+        self.month_var = tk.StringVar()
+        ttk.Label(control_frame, textvariable=self.month_var, width=16, anchor=tk.CENTER,
+                  font=("Arial", 12, "bold")).pack(side=tk.LEFT, padx=5)
+        ttk.Button(control_frame, text="▶", width=3, command=lambda: self.shift_month(1)).pack(side=tk.LEFT, padx=2)
+        ttk.Button(control_frame, text="Сегодня", command=self.show_today).pack(side=tk.LEFT, padx=2)
+
+        # Занятые дни выделяются жирным шрифтом, выбранный день - цветом
+        style = ttk.Style(self.root)
+        style.configure("Busy.TButton", font=("Arial", 9, "bold"))
+        style.configure("Selected.TButton", font=("Arial", 9, "bold"), foreground="blue")
+
+        # Сетка создается один раз, при смене месяца меняются только подписи кнопок
+        grid_frame = ttk.Frame(self.calendar_tab)
+        grid_frame.pack(fill=tk.X, padx=5, pady=5)
+        for column, name in enumerate(WEEKDAY_NAMES):
+            ttk.Label(grid_frame, text=name, anchor=tk.CENTER).grid(row=0, column=column, sticky="ew")
+            grid_frame.columnconfigure(column, weight=1)
+
+        self.day_buttons = []
+        self.cell_days = [None] * CALENDAR_CELLS
+        # Последние переданные в Tk параметры кнопок, чтобы не менять неизменившиеся
+        self.cell_views = [None] * CALENDAR_CELLS
+        for index in range(CALENDAR_CELLS):
+            button = ttk.Button(grid_frame, width=12, command=lambda index=index: self.select_day(index))
+            button.grid(row=index // 7 + 1, column=index % 7, sticky="nsew", padx=1, pady=1)
+            self.day_buttons.append(button)
+
+        # Дела выбранного дня
+        self.agenda_var = tk.StringVar()
+        ttk.Label(self.calendar_tab, textvariable=self.agenda_var).pack(anchor=tk.W, padx=5)
+
+        agenda_frame = ttk.Frame(self.calendar_tab)
+        agenda_frame.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+
+        # Первый столбец - ключ строки (тип и id записи), он не показывается
+        columns = ("key", "kind", "time", "title", "status")
+        self.agenda_tree = ttk.Treeview(agenda_frame, columns=columns, displaycolumns=columns[1:], show="headings",
+                                        selectmode="browse")
+        self.agenda_tree.heading("kind", text="Тип")
+        self.agenda_tree.heading("time", text="Время")
+        self.agenda_tree.heading("title", text="Название")
+        self.agenda_tree.heading("status", text="Состояние")
+
+        self.agenda_tree.column("kind", width=120)
+        self.agenda_tree.column("time", width=80, anchor=tk.CENTER)
+        self.agenda_tree.column("title", width=300)
+        self.agenda_tree.column("status", width=120, anchor=tk.CENTER)
+
+        scrollbar = ttk.Scrollbar(agenda_frame, orient=tk.VERTICAL, command=self.agenda_tree.yview)
+        self.agenda_tree.configure(yscrollcommand=scrollbar.set)
+        self.agenda_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.agenda_model = TreeViewModel(self.agenda_tree)
+
+    def calendar_visible(self):
+        """Открыта ли вкладка календаря"""
+        return self.notebook.index("current") == self.notebook.index(self.calendar_tab)
+
+    def refresh_calendar(self, kind):
+        """Перерисовка открытого календаря после загрузки или пересчета задач и событий"""
+        if kind not in self.core.date_indexes:
+            return
+        self.calendar_dirty = True
+        if self.calendar_visible():
+            self.show_calendar()
+
+    def show_calendar(self):
+        """Вывод месяца: занятые дни берутся из индекса дат ядра только за этот месяц"""
+        self.calendar_dirty = False
+        year, month = self.calendar_month
+        with span("update_calendar"):
+            start = f"{year:04d}-{month:02d}-01"
+            stop = f"{year + month // 12:04d}-{month % 12 + 1:02d}-01"
+            busy = self.core.busy_days(start, stop)
+            current_day = today()
+            self.month_var.set(f"{MONTH_NAMES[month - 1]} {year}")
+
+            numbers = [number for week in monthcalendar(year, month) for number in week]
+            numbers += [0] * (CALENDAR_CELLS - len(numbers))
+            for index, number in enumerate(numbers):
+                if not number:
+                    day = None
+                    view = ("", tk.DISABLED, "TButton")
+                else:
+                    day = f"{year:04d}-{month:02d}-{number:02d}"
+                    label = f"{number} •" if day == current_day else str(number)
+                    counts = busy.get(day)
+                    if counts:
+                        events, tasks = counts
+                        parts = ([f"{events} соб."] if events else []) + ([f"{tasks} зад."] if tasks else [])
+                        label += "\n" + ", ".join(parts)
+                    style = "Selected.TButton" if day == self.calendar_day else "Busy.TButton" if counts else "TButton"
+                    view = (label, tk.NORMAL, style)
+                self.cell_days[index] = day
+                if self.cell_views[index] != view:
+                    self.cell_views[index] = view
+                    self.day_buttons[index].configure(text=view[0], state=view[1], style=view[2])
+            self.show_agenda()
+
+    def show_agenda(self):
+        """Список событий и задач выбранного дня"""
+        items = self.core.day_items(self.calendar_day)
+        rows = []
+        for kind, record in items:
+            if kind == "events":
+                rows.append((f"events-{record.id}", "Событие", record.time_display, record.title,
+                             record.reminder_display))
+            else:
+                rows.append((f"tasks-{record.id}", f"Задача ({record.priority})", "", record.title,
+                             record.status_display))
+        self.agenda_model.apply(rows)
+        year, month, number = self.calendar_day.split("-")
+        self.agenda_var.set(f"Дела на {number}.{month}.{year}: {len(rows) if rows else 'нет'}")
+
+    def select_day(self, index):
+        """Выбор дня в сетке месяца"""
+        day = self.cell_days[index]
+        if day is None or day == self.calendar_day:
+            return
+        self.calendar_day = day
+        self.show_calendar()
+
+    def shift_month(self, step):
+        """Переход на соседний месяц; выбирается его первое число"""
+        year, month = self.calendar_month
+        month += step
+        year, month = year + (month - 1) // 12, (month - 1) % 12 + 1
+        self.calendar_month = (year, month)
+        self.calendar_day = f"{year:04d}-{month:02d}-01"
+        self.show_calendar()
+
+    def show_today(self):
+        """Переход к текущему месяцу и сегодняшнему дню"""
+        now = datetime.now()
+        self.calendar_month = (now.year, now.month)
+        self.calendar_day = today()
+        self.show_calendar()
+
     def create_stats_tab(self):
         """Создание вкладки статистики"""
         stats_frame = ttk.Frame(self.stats_tab)
         stats_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
 
+        # Подписи привязаны к переменным и меняются без пересоздания вкладки
+        self.stats_vars = {}
+
+        def stat_label(parent, kind, key, template):
+            var = tk.StringVar()
+            self.stats_vars[key] = (kind, var, template)
+            ttk.Label(parent, textvariable=var).pack(anchor=tk.W)
+
         # Статистика по задачам
         ttk.Label(stats_frame, text="Статистика задач", font=("Arial", 12, "bold")).pack(pady=5)
 
         task_stats_frame = ttk.Frame(stats_frame)
         task_stats_frame.pack(fill=tk.X, pady=5)
 
-        total_tasks = len(self.tasks)
-        completed_tasks = len([t for t in self.tasks if t.get("completed", False)])
-        active_tasks = total_tasks - completed_tasks
-        high_priority = len([t for t in self.tasks if t.get("priority", "Средний") == "Высокий"])
-
-        ttk.Label(task_stats_frame, text=f"Всего задач: {total_tasks}").pack(anchor=tk.W)
-        ttk.Label(task_stats_frame, text=f"Завершено: {completed_tasks}").pack(anchor=tk.W)
-        ttk.Label(task_stats_frame, text=f"Активных: {active_tasks}").pack(anchor=tk.W)
-        ttk.Label(task_stats_frame, text=f"Высокий приоритет: {high_priority}").pack(anchor=tk.W)
+        stat_label(task_stats_frame, "tasks", "total_tasks", "Всего задач: {}")
+        stat_label(task_stats_frame, "tasks", "completed_tasks", "Завершено: {}")
+        stat_label(task_stats_frame, "tasks", "active_tasks", "Активных: {}")
+        stat_label(task_stats_frame, "tasks", "high_priority", "Высокий приоритет: {}")
 
         # Статистика по событиям
         ttk.Label(stats_frame, text="\nСтатистика событий", font=("Arial", 12, "bold")).pack(pady=5)
@@ -269,14 +665,9 @@ class StudentDayApp:
         event_stats_frame = ttk.Frame(stats_frame)
         event_stats_frame.pack(fill=tk.X, pady=5)
 
-        total_events = len(self.events)
-        today = datetime.now().date()
-        upcoming_events = len([e for e in self.events if datetime.strptime(e["date"], "%Y-%m-%d").date() >= today])
-        past_events = total_events - upcoming_events
-
-        ttk.Label(event_stats_frame, text=f"Всего событий: {total_events}").pack(anchor=tk.W)
-        ttk.Label(event_stats_frame, text=f"Предстоящие: {upcoming_events}").pack(anchor=tk.W)
-        ttk.Label(event_stats_frame, text=f"Прошедшие: {past_events}").pack(anchor=tk.W)
+        stat_label(event_stats_frame, "events", "total_events", "Всего событий: {}")
+        stat_label(event_stats_frame, "events", "upcoming_events", "Предстоящие: {}")
+        stat_label(event_stats_frame, "events", "past_events", "Прошедшие: {}")
 
         # Статистика по заметкам
         ttk.Label(stats_frame, text="\nСтатистика заметок", font=("Arial", 12, "bold")).pack(pady=5)
@@ -284,9 +675,301 @@ class StudentDayApp:
         note_stats_frame = ttk.Frame(stats_frame)
         note_stats_frame.pack(fill=tk.X, pady=5)
 
-        total_notes = len(self.notes)
+        stat_label(note_stats_frame, "notes", "total_notes", "Всего заметок: {}")
+
+        self.show_stats()
+        self.schedule_midnight_recount()
+
+    def create_diagnostics_tab(self):
+        """Создание вкладки диагностики: замеры горячих участков, трасса и cProfile"""
+        control_frame = ttk.Frame(self.diagnostics_tab)
+        control_frame.pack(fill=tk.X, padx=5, pady=5)
+
+        self.diagnostics_var = tk.BooleanVar(value=recorder.enabled)
+        ttk.Checkbutton(control_frame, text="Записывать замеры", variable=self.diagnostics_var,
+                        command=self.toggle_diagnostics).pack(side=tk.LEFT, padx=2)
+        ttk.Button(control_frame, text="Сбросить", command=self.reset_diagnostics).pack(side=tk.LEFT, padx=2)
+        ttk.Button(control_frame, text="Сохранить трассу...", command=self.export_trace).pack(side=tk.LEFT, padx=2)
+        self.profile_button = ttk.Button(control_frame, text="Запустить cProfile", command=self.toggle_profile)
+        self.profile_button.pack(side=tk.LEFT, padx=2)
+
+        self.latency_var = tk.StringVar()
+        ttk.Label(self.diagnostics_tab, textvariable=self.latency_var).pack(anchor=tk.W, padx=5)
+
+        # Таблица замеров: участок, число вызовов и время в миллисекундах
+        metrics_frame = ttk.Frame(self.diagnostics_tab)
+        metrics_frame.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+
+        columns = ("name", "calls", "total", "avg", "max", "last")
+        self.metrics_tree = ttk.Treeview(metrics_frame, columns=columns, show="headings", selectmode="browse")
+        self.metrics_tree.heading("name", text="Участок")
+        self.metrics_tree.heading("calls", text="Вызовов")
+        self.metrics_tree.heading("total", text="Всего, мс")
+        self.metrics_tree.heading("avg", text="Среднее, мс")
+        self.metrics_tree.heading("max", text="Макс., мс")
+        self.metrics_tree.heading("last", text="Последний, мс")
+
+        self.metrics_tree.column("name", width=220)
+        for column in columns[1:]:
+            self.metrics_tree.column(column, width=90, anchor=tk.E)
+
+        scrollbar = ttk.Scrollbar(metrics_frame, orient=tk.VERTICAL, command=self.metrics_tree.yview)
+        self.metrics_tree.configure(yscrollcommand=scrollbar.set)
+        self.metrics_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.metrics_model = TreeViewModel(self.metrics_tree)
+
+        # Начало отчета cProfile после остановки профилирования
+        self.profile_text = tk.Text(self.diagnostics_tab, height=10)
+        self.profile_text.pack(fill=tk.X, padx=5, pady=5)
+
+        self.show_diagnostics()
+
+    def show_diagnostics(self):
+        """Вывод накопленных замеров, начиная с самых затратных участков"""
+        metrics = recorder.snapshot()
+        rows = []
+        for name, (calls, total, longest, last) in sorted(metrics.items(), key=lambda item: -item[1][1]):
+            rows.append((name, calls, f"{total * 1000:.1f}", f"{total / calls * 1000:.2f}",
+                         f"{longest * 1000:.2f}", f"{last * 1000:.2f}"))
+        self.metrics_model.apply(rows)
+
+        latency = metrics.get("tk.latency")
+        if not recorder.enabled:
+            text = "Замеры выключены"
+        elif latency is None:
+            text = "Задержка цикла событий: нет данных"
+        else:
+            text = f"Задержка цикла событий: {latency[3] * 1000:.1f} мс, наибольшая {latency[2] * 1000:.1f} мс"
+        # Время до первых строк известно и без замеров; промах мимо цели отмечается
+        first_paint = self.startup_times.get("first_paint")
+        if first_paint is not None:
+            text += f". Первые строки за {first_paint:.0f} мс"
+            if first_paint > FIRST_PAINT_TARGET_MS:
+                text += f" (цель {FIRST_PAINT_TARGET_MS} мс)"
+        if self.latency_var.get() != text:
+            self.latency_var.set(text)
+
+    def toggle_diagnostics(self):
+        """Включение и выключение замеров флажком вкладки"""
+        if self.diagnostics_var.get():
+            recorder.enable()
+            self.start_diagnostics()
+        else:
+            recorder.enable(False)
+            self.stop_diagnostics()
+        self.show_diagnostics()
+
+    def start_diagnostics(self):
+        """Запуск пробы задержки цикла Tk и периодического обновления таблицы"""
+        if self.idle_job is None:
+            self.schedule_idle_probe()
+        if self.diagnostics_job is None:
+            self.diagnostics_job = self.root.after(DIAGNOSTICS_INTERVAL_MS, self.poll_diagnostics)
+
+    def stop_diagnostics(self):
+        for job in (self.idle_job, self.diagnostics_job):
+            if job is not None:
+                self.root.after_cancel(job)
+        self.idle_job = None
+        self.diagnostics_job = None
+
+    def schedule_idle_probe(self):
+        """Таймер, опоздание которого показывает, насколько занят цикл событий"""
+        self.idle_expected = time.perf_counter() + IDLE_PROBE_MS / 1000
+        self.idle_job = self.root.after(IDLE_PROBE_MS, self.on_idle_probe)
+
+    def on_idle_probe(self):
+        recorder.record("tk.latency", max(0.0, time.perf_counter() - self.idle_expected))
+        self.schedule_idle_probe()
+
+    def poll_diagnostics(self):
+        """Обновление таблицы замеров, пока открыта вкладка диагностики"""
+        if self.notebook.index("current") == self.notebook.index(self.diagnostics_tab):
+            self.show_diagnostics()
+        self.diagnostics_job = self.root.after(DIAGNOSTICS_INTERVAL_MS, self.poll_diagnostics)
+
+    def reset_diagnostics(self):
+        recorder.reset()
+        self.show_diagnostics()
+
+    def export_trace(self):
+        """Сохранение трассы замеров для chrome://tracing или Perfetto"""
+        path = filedialog.asksaveasfilename(parent=self.root, title="Сохранить трассу",
+                                            filetypes=(("Trace Event JSON", "*.json"),), defaultextension=".json")
+        if not path:
+            return
+        try:
+            count = recorder.export_trace(path)
+        except OSError as e:
+            messagebox.showerror("Ошибка", f"Не удалось сохранить трассу: {e}")
+            return
+        messagebox.showinfo("Трасса", f"Сохранено замеров: {count}")
+
+    def toggle_profile(self):
+        """Запуск и остановка cProfile; профилируется поток интерфейса"""
+        if not recorder.profiling:
+            recorder.start_profile()
+            self.profile_button.configure(text="Остановить cProfile")
+            return
+        path = filedialog.asksaveasfilename(parent=self.root, title="Сохранить профиль (можно отменить)",
+                                            filetypes=(("cProfile", "*.prof"),), defaultextension=".prof")
+        try:
+            report = recorder.stop_profile(path or None)
+        except OSError as e:
+            messagebox.showerror("Ошибка", f"Не удалось сохранить профиль: {e}")
+            report = ""
+        self.profile_button.configure(text="Запустить cProfile")
+        self.profile_text.delete("1.0", tk.END)
+        self.profile_text.insert(tk.END, report)
+
+    def show_stats(self):
+        """Передача текущих счетчиков в подписи вкладки статистики"""
+        for key, value in self.core.stats.values().items():
+            kind, var, template = self.stats_vars[key]
+            text = template.format(value if kind in self.installed else "…")
+            if var.get() != text:
+                var.set(text)
+
+    def schedule_midnight_recount(self):
+        """Планирование пересчета предстоящих событий на начало следующих суток"""
+        now = datetime.now()
+        midnight = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+        # Секунда запаса, чтобы таймер не сработал чуть раньше смены даты
+        delay = int((midnight - now).total_seconds() * 1000) + 1000
+        self.midnight_job = self.root.after(delay, self.on_midnight)
+
+    def on_midnight(self):
+        """Смена даты: часть предстоящих событий становится прошедшими"""
+        self.midnight_job = None
+        if self.core.stats.roll_over(today()):
+            self.show_stats()
+            # Фильтры предстоящих и прошедших событий и отметка сегодняшнего дня тоже зависят от текущей даты
+            self.update_event_list()
+            self.refresh_calendar("events")
+        self.schedule_midnight_recount()
 
-        ttk.Label(note_stats_frame, text=f"Всего заметок: {total_notes}").pack(anchor=tk.W)
+    def schedule_reminder(self):
+        """Перезапуск таймера на ближайшее напоминание, если оно изменилось"""
+        next_time = self.reminders.next_time()
+        if next_time == self.reminder_time and self.reminder_job is not None:
+            return
+        if self.reminder_job is not None:
+            self.root.after_cancel(self.reminder_job)
+            self.reminder_job = None
+        self.reminder_time = next_time
+        if next_time is None:
+            return
+
+        # Длинные ожидания дробятся, чтобы перевод часов или сон компьютера не сдвигали срабатывание
+        delay = (next_time - datetime.now()).total_seconds()
+        delay = int(min(max(delay, 0), 3600) * 1000)
+        self.reminder_job = self.root.after(delay, self.on_reminder)
+
+    def on_reminder(self):
+        """Показ наступивших напоминаний"""
+        self.reminder_job = None
+        self.reminder_time = None
+        now = datetime.now()
+        due = self.reminders.pop_due(now)
+        if due:
+            save_watermark(self.reminder_file, self.reminders.watermark)
+            lines = []
+            for event_id, when in due:
+                event = self.repo.get("events", event_id)
+                if event is not None:
+                    # У серии показывается дата наступающего повторения
+                    start = when + timedelta(minutes=event.reminder or 0)
+                    lines.append(f"{event.title}: {start.strftime('%Y-%m-%d')} {event.time_display}")
+            if lines:
+                messagebox.showinfo("Напоминание", "\n".join(lines))
+        self.schedule_reminder()
+
+    # Импорт и экспорт
+    def import_dialog(self):
+        """Импорт записей из CSV (в тип открытой вкладки), iCalendar или выгрузки JSON"""
+        path = filedialog.askopenfilename(parent=self.root, title="Импорт", filetypes=IMPORT_FILE_TYPES)
+        if not path:
+            return
+        kind = self.current_kind() or "tasks"
+        errors = []
+        self.root.config(cursor="watch")
+        self.root.update_idletasks()
+        try:
+            counts = self.core.import_file(path, kind, lambda number, error: errors.append(f"{number}: {error}"))
+        except (ValidationError, ValueError, OSError) as e:
+            messagebox.showerror("Ошибка", f"Не удалось импортировать файл: {e}")
+            return
+        finally:
+            self.root.config(cursor="")
+
+        # Списки обновляются один раз после всего импорта
+        for changed_kind in KINDS:
+            if counts[changed_kind]:
+                self.refresh_kind(changed_kind)
+        message = f"Добавлено: задач {counts['tasks']}, событий {counts['events']}, заметок {counts['notes']}"
+        if errors:
+            message += f"\nПропущено неверных записей: {len(errors)}\n" + "\n".join(errors[:10])
+        messagebox.showinfo("Импорт", message)
+
+    def export_dialog(self):
+        """Экспорт: CSV записей открытой вкладки, iCalendar задач и событий или JSON всех записей"""
+        path = filedialog.asksaveasfilename(parent=self.root, title="Экспорт", filetypes=EXPORT_FILE_TYPES,
+                                            defaultextension=".csv")
+        if not path:
+            return
+        file_format = detect_format(path)
+        try:
+            if file_format == "csv":
+                self.core.export_csv(path, self.current_kind() or "tasks")
+            elif file_format == "ics":
+                self.core.export_ics(path)
+            else:
+                self.core.export(path)
+        except OSError as e:
+            messagebox.showerror("Ошибка", f"Не удалось выгрузить данные: {e}")
+
+    def selected_ids(self, view):
+        """id выделенных строк списка; без выделения - строки в фокусе"""
+        selected = view.selection()
+        if not selected and view.focus():
+            selected = (view.focus(),)
+        return sorted(int(iid) for iid in selected)
+
+    def reschedule_dialog(self, kind):
+        """Перенос срока выбранных задач или даты выбранных событий на один день"""
+        view = self.task_view if kind == "tasks" else self.event_view
+        record_ids = self.selected_ids(view)
+        if not record_ids:
+            messagebox.showwarning("Предупреждение", "Выберите записи для переноса")
+            return
+
+        dialog = tk.Toplevel(self.root)
+        dialog.title(f"Перенос ({len(record_ids)})")
+        dialog.geometry("300x330")
+        dialog.transient(self.root)
+        dialog.grab_set()
+
+        ttk.Label(dialog, text="Новый срок:" if kind == "tasks" else "Новая дата:").pack(pady=(10, 0))
+        cal_frame = ttk.Frame(dialog)
+        cal_frame.pack(pady=5)
+        cal = calendar_widget(cal_frame)
+        cal.pack()
+
+        no_due_var = tk.BooleanVar(value=False)
+        if kind == "tasks":
+            ttk.Checkbutton(dialog, text="Без срока", variable=no_due_var).pack()
+
+        def save_date():
+            try:
+                self.core.reschedule(kind, record_ids, "" if no_due_var.get() else cal.get_date())
+            except ValidationError as e:
+                messagebox.showerror("Ошибка", str(e))
+                return
+            self.refresh_kind(kind)
+            dialog.destroy()
+
+        ttk.Button(dialog, text="Сохранить", command=save_date).pack(pady=10)
 
     # Методы для работы с задачами
     def add_task_dialog(self):
@@ -320,30 +1003,11 @@ class StudentDayApp:
             priority = priority_var.get()
             due_date = due_entry.get().strip()
 
-            if not title:
-                messagebox.showerror("Ошибка", "Название задачи обязательно!")
-                return
-
             try:
-                if due_date:
-                    datetime.strptime(due_date, "%Y-%m-%d")
-            except ValueError:
-                messagebox.showerror("Ошибка", "Неверный формат даты! Используйте ГГГГ-ММ-ДД")
+                self.core.add_task(title, description, priority, due_date)
+            except ValidationError as e:
+                messagebox.showerror("Ошибка", str(e))
                 return
-
-            task_id = max([t.get("id", 0) for t in self.tasks], default=0) + 1
-            new_task = {
-                "id": task_id,
-                "title": title,
-                "description": description,
-                "priority": priority,
-                "due_date": due_date if due_date else None,
-                "completed": False,
-                "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            }
-
-            self.tasks.append(new_task)
-            self.save_data()
             self.update_task_list()
             dialog.destroy()
 
@@ -351,14 +1015,13 @@ class StudentDayApp:
 
     def edit_task(self):
         """Редактирование выбранной задачи"""
-        selected = self.task_tree.focus()
+        selected = self.task_view.focus()
         if not selected:
             messagebox.showwarning("Предупреждение", "Выберите задачу для редактирования")
             return
 
-        item = self.task_tree.item(selected)
-        task_id = int(item["values"][0])
-        task = next((t for t in self.tasks if t["id"] == task_id), None)
+        task_id = int(selected)
+        task = self.repo.get("tasks", task_id)
 
         if not task:
             messagebox.showerror("Ошибка", "Задача не найдена")
@@ -372,25 +1035,25 @@ class StudentDayApp:
 
         ttk.Label(dialog, text="Название задачи:").pack(pady=(10, 0))
         title_entry = ttk.Entry(dialog)
-        title_entry.insert(0, task["title"])
+        title_entry.insert(0, task.title)
         title_entry.pack(fill=tk.X, padx=10, pady=5)
 
         ttk.Label(dialog, text="Описание:").pack()
         desc_entry = tk.Text(dialog, height=5)
-        desc_entry.insert("1.0", task.get("description", ""))
+        desc_entry.insert("1.0", task.description)
         desc_entry.pack(fill=tk.X, padx=10, pady=5)
 
         ttk.Label(dialog, text="Приоритет:").pack()
-        priority_var = tk.StringVar(value=task.get("priority", "Средний"))
+        priority_var = tk.StringVar(value=task.priority)
         ttk.Combobox(dialog, textvariable=priority_var, values=["Низкий", "Средний", "Высокий"]).pack(fill=tk.X,
                                                                                                       padx=10, pady=5)
 
         ttk.Label(dialog, text="Срок выполнения (ГГГГ-ММ-ДД):").pack()
         due_entry = ttk.Entry(dialog)
-        due_entry.insert(0, task.get("due_date", ""))
+        due_entry.insert(0, task.due_date or "")
         due_entry.pack(fill=tk.X, padx=10, pady=5)
 
-        completed_var = tk.BooleanVar(value=task.get("completed", False))
+        completed_var = tk.BooleanVar(value=task.completed)
         ttk.Checkbutton(dialog, text="Завершено", variable=completed_var).pack()
 
         def save_changes():
@@ -400,101 +1063,97 @@ class StudentDayApp:
             due_date = due_entry.get().strip()
             completed = completed_var.get()
 
-            if not title:
-                messagebox.showerror("Ошибка", "Название задачи обязательно!")
-                return
-
             try:
-                if due_date:
-                    datetime.strptime(due_date, "%Y-%m-%d")
-            except ValueError:
-                messagebox.showerror("Ошибка", "Неверный формат даты! Используйте ГГГГ-ММ-ДД")
+                self.core.update_task(task, title, description, priority, due_date, completed)
+            except ValidationError as e:
+                messagebox.showerror("Ошибка", str(e))
                 return
-
-            task["title"] = title
-            task["description"] = description
-            task["priority"] = priority
-            task["due_date"] = due_date if due_date else None
-            task["completed"] = completed
-            task["updated_at"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-            self.save_data()
             self.update_task_list()
             dialog.destroy()
 
         ttk.Button(dialog, text="Сохранить", command=save_changes).pack(pady=10)
 
     def delete_task(self):
-        """Удаление выбранной задачи"""
-        selected = self.task_tree.focus()
-        if not selected:
+        """Удаление выбранных задач"""
+        task_ids = self.selected_ids(self.task_view)
+        if not task_ids:
             messagebox.showwarning("Предупреждение", "Выберите задачу для удаления")
             return
 
-        item = self.task_tree.item(selected)
-        task_id = int(item["values"][0])
-
-        if messagebox.askyesno("Подтверждение", "Вы уверены, что хотите удалить эту задачу?"):
-            self.tasks = [t for t in self.tasks if t["id"] != task_id]
-            self.save_data()
+        question = ("Вы уверены, что хотите удалить эту задачу?" if len(task_ids) == 1
+                    else f"Вы уверены, что хотите удалить выбранные задачи ({len(task_ids)})?")
+        if messagebox.askyesno("Подтверждение", question):
+            self.core.delete_many("tasks", task_ids)
             self.update_task_list()
 
     def mark_task_completed(self):
-        """Отметка задачи как выполненной"""
-        selected = self.task_tree.focus()
-        if not selected:
+        """Отметка выбранных задач как выполненных"""
+        task_ids = self.selected_ids(self.task_view)
+        if not task_ids:
             messagebox.showwarning("Предупреждение", "Выберите задачу для отметки")
             return
 
-        item = self.task_tree.item(selected)
-        task_id = int(item["values"][0])
-        task = next((t for t in self.tasks if t["id"] == task_id), None)
+        if self.core.complete_tasks(task_ids):
+            self.update_task_list()
+
+    def set_priority_dialog(self):
+        """Смена приоритета выбранных задач"""
+        task_ids = self.selected_ids(self.task_view)
+        if not task_ids:
+            messagebox.showwarning("Предупреждение", "Выберите задачи для смены приоритета")
+            return
+
+        dialog = tk.Toplevel(self.root)
+        dialog.title(f"Приоритет задач ({len(task_ids)})")
+        dialog.geometry("300x130")
+        dialog.transient(self.root)
+        dialog.grab_set()
+
+        ttk.Label(dialog, text="Приоритет:").pack(pady=(10, 0))
+        priority_var = tk.StringVar(value="Высокий")
+        ttk.Combobox(dialog, textvariable=priority_var, values=PRIORITIES, state="readonly").pack(fill=tk.X, padx=10,
+                                                                                                  pady=5)
 
-        if task:
-            task["completed"] = True
-            task["updated_at"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            self.save_data()
+        def save_priority():
+            try:
+                self.core.set_priority(task_ids, priority_var.get())
+            except ValidationError as e:
+                messagebox.showerror("Ошибка", str(e))
+                return
             self.update_task_list()
+            dialog.destroy()
+
+        ttk.Button(dialog, text="Сохранить", command=save_priority).pack(pady=10)
 
     def update_task_list(self):
         """Обновление списка задач"""
-        for item in self.task_tree.get_children():
-            self.task_tree.delete(item)
+        if "tasks" not in self.shown:
+            return
+        with span("update_task_list"):
+            self.search_scheduler.run_now("tasks", self.task_query(), self.show_task_rows)
+
+    def schedule_task_list(self):
+        """Отложенное обновление списка задач при вводе в поле поиска"""
+        if "tasks" not in self.shown:
+            return
+        self.search_scheduler.schedule("tasks", self.task_query(), self.show_task_rows, self.repo.count("tasks"))
 
-        search_text = self.task_search_var.get().lower()
+    def task_query(self):
+        """Запрос строк списка задач с текущими фильтром и поиском"""
+        search_text = self.task_search_var.get()
         filter_type = self.task_filter.get()
+        return lambda cancelled: self.core.find("tasks", filter_type, search_text, cancelled)
 
-        for task in sorted(self.tasks, key=lambda x: x.get("due_date", "9999-99-99")):
-            # Применение фильтра
-            if filter_type == "Активные" and task.get("completed", False):
-                continue
-            if filter_type == "Завершенные" and not task.get("completed", False):
-                continue
-            if filter_type == "Высокий" and task.get("priority", "") != "Высокий":
-                continue
-
-            # Применение поиска
-            task_text = (task["title"] + " " + task.get("description", "")).lower()
-            if search_text and search_text not in task_text:
-                continue
-
-            due_date = task.get("due_date", "")
-            status = "Завершено" if task.get("completed", False) else "Активно"
-
-            self.task_tree.insert("", tk.END, values=(
-                task["id"],
-                task["title"],
-                task.get("priority", "Средний"),
-                due_date if due_date else "Нет срока",
-                status
-            ))
+    def show_task_rows(self, tasks):
+        """Вывод задач в виртуальный список: создаются только видимые строки"""
+        self.task_view.set_items(tasks)
 
     # Методы для работы с событиями
     def add_event_dialog(self):
         """Диалог добавления нового события"""
         dialog = tk.Toplevel(self.root)
         dialog.title("Добавить событие")
-        dialog.geometry("400x350")
+        dialog.geometry("400x610")
         dialog.transient(self.root)
         dialog.grab_set()
 
@@ -510,51 +1169,39 @@ class StudentDayApp:
         ttk.Label(dialog, text="Дата события:").pack()
         cal_frame = ttk.Frame(dialog)
         cal_frame.pack(pady=5)
-        cal = Calendar(cal_frame, selectmode="day", date_pattern="yyyy-mm-dd")
+        cal = calendar_widget(cal_frame)
         cal.pack()
 
         ttk.Label(dialog, text="Время (ЧЧ:ММ):").pack()
         time_entry = ttk.Entry(dialog)
         time_entry.pack(fill=tk.X, padx=10, pady=5)
 
+        ttk.Label(dialog, text="Длительность (минуты):").pack()
+        duration_entry = ttk.Entry(dialog)
+        duration_entry.pack(fill=tk.X, padx=10, pady=5)
+
         ttk.Label(dialog, text="Напоминание (минуты до события):").pack()
         reminder_entry = ttk.Entry(dialog)
         reminder_entry.pack(fill=tk.X, padx=10, pady=5)
 
+        repeat_fields = self.repeat_fields(dialog)
+
         def save_event():
             title = title_entry.get().strip()
             description = desc_entry.get("1.0", tk.END).strip()
             date = cal.get_date()
             time = time_entry.get().strip()
             reminder = reminder_entry.get().strip()
-
-            if not title:
-                messagebox.showerror("Ошибка", "Название события обязательно!")
-                return
+            duration = duration_entry.get().strip()
 
             try:
-                datetime.strptime(date, "%Y-%m-%d")
-                if time:
-                    datetime.strptime(time, "%H:%M")
-                if reminder:
-                    int(reminder)
-            except ValueError:
-                messagebox.showerror("Ошибка", "Неверный формат данных!")
+                new_event = self.core.new_event(title, description, date, time, reminder, *repeat_fields(), duration)
+            except ValidationError as e:
+                messagebox.showerror("Ошибка", str(e))
                 return
-
-            event_id = max([e.get("id", 0) for e in self.events], default=0) + 1
-            new_event = {
-                "id": event_id,
-                "title": title,
-                "description": description,
-                "date": date,
-                "time": time if time else None,
-                "reminder": int(reminder) if reminder else None,
-                "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            }
-
-            self.events.append(new_event)
-            self.save_data()
+            if not self.confirm_conflicts(new_event, dialog):
+                return
+            self.core.save_event(new_event)
             self.update_event_list()
             dialog.destroy()
 
@@ -562,14 +1209,13 @@ class StudentDayApp:
 
     def edit_event(self):
         """Редактирование выбранного события"""
-        selected = self.event_tree.focus()
+        selected = self.event_view.focus()
         if not selected:
             messagebox.showwarning("Предупреждение", "Выберите событие для редактирования")
             return
 
-        item = self.event_tree.item(selected)
-        event_id = int(item["values"][0])
-        event = next((e for e in self.events if e["id"] == event_id), None)
+        event_id = int(selected)
+        event = self.repo.get("events", event_id)
 
         if not event:
             messagebox.showerror("Ошибка", "Событие не найдено")
@@ -577,116 +1223,138 @@ class StudentDayApp:
 
         dialog = tk.Toplevel(self.root)
         dialog.title("Редактировать событие")
-        dialog.geometry("400x350")
+        dialog.geometry("400x610")
         dialog.transient(self.root)
         dialog.grab_set()
 
         ttk.Label(dialog, text="Название события:").pack(pady=(10, 0))
         title_entry = ttk.Entry(dialog)
-        title_entry.insert(0, event["title"])
+        title_entry.insert(0, event.title)
         title_entry.pack(fill=tk.X, padx=10, pady=5)
 
         ttk.Label(dialog, text="Описание:").pack()
         desc_entry = tk.Text(dialog, height=5)
-        desc_entry.insert("1.0", event.get("description", ""))
+        desc_entry.insert("1.0", event.description)
         desc_entry.pack(fill=tk.X, padx=10, pady=5)
 
         # Календарь для выбора даты
         ttk.Label(dialog, text="Дата события:").pack()
         cal_frame = ttk.Frame(dialog)
         cal_frame.pack(pady=5)
-        cal = Calendar(cal_frame, selectmode="day", date_pattern="yyyy-mm-dd")
-        cal.set_date(event["date"])
+        cal = calendar_widget(cal_frame)
+        cal.set_date(event.date)
         cal.pack()
 
         ttk.Label(dialog, text="Время (ЧЧ:ММ):").pack()
         time_entry = ttk.Entry(dialog)
-        time_entry.insert(0, event.get("time", ""))
+        time_entry.insert(0, event.time or "")
         time_entry.pack(fill=tk.X, padx=10, pady=5)
 
+        ttk.Label(dialog, text="Длительность (минуты):").pack()
+        duration_entry = ttk.Entry(dialog)
+        duration_entry.insert(0, str(event.duration) if event.duration else "")
+        duration_entry.pack(fill=tk.X, padx=10, pady=5)
+
         ttk.Label(dialog, text="Напоминание (минуты до события):").pack()
         reminder_entry = ttk.Entry(dialog)
-        reminder_entry.insert(0, str(event.get("reminder", "")) if event.get("reminder") else "")
+        reminder_entry.insert(0, str(event.reminder) if event.reminder else "")
         reminder_entry.pack(fill=tk.X, padx=10, pady=5)
 
+        repeat_fields = self.repeat_fields(dialog, event)
+
         def save_changes():
             title = title_entry.get().strip()
             description = desc_entry.get("1.0", tk.END).strip()
             date = cal.get_date()
             time = time_entry.get().strip()
             reminder = reminder_entry.get().strip()
-
-            if not title:
-                messagebox.showerror("Ошибка", "Название события обязательно!")
-                return
+            duration = duration_entry.get().strip()
 
             try:
-                datetime.strptime(date, "%Y-%m-%d")
-                if time:
-                    datetime.strptime(time, "%H:%M")
-                if reminder:
-                    int(reminder)
-            except ValueError:
-                messagebox.showerror("Ошибка", "Неверный формат данных!")
+                changed = self.core.edited_event(event, title, description, date, time, reminder, *repeat_fields(),
+                                                 duration)
+            except ValidationError as e:
+                messagebox.showerror("Ошибка", str(e))
                 return
-
-            event["title"] = title
-            event["description"] = description
-            event["date"] = date
-            event["time"] = time if time else None
-            event["reminder"] = int(reminder) if reminder else None
-            event["updated_at"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-            self.save_data()
+            if not self.confirm_conflicts(changed, dialog):
+                return
+            self.core.save_event(changed)
             self.update_event_list()
             dialog.destroy()
 
         ttk.Button(dialog, text="Сохранить", command=save_changes).pack(pady=10)
 
+    def confirm_conflicts(self, event, dialog):
+        """Предупреждение о пересечениях события с другими; True, если сохранять"""
+        found = self.core.conflicts(event)
+        if not found:
+            return True
+        lines = "\n".join(span_text(begin, end, other) for begin, end, other in found)
+        more = "\n..." if len(found) >= CONFLICT_LIMIT else ""
+        return messagebox.askyesno("Пересечение событий",
+                                   f"Событие пересекается по времени с другими:\n{lines}{more}\n\nВсе равно сохранить?",
+                                   parent=dialog)
+
+    def repeat_fields(self, dialog, event=None):
+        """Поля правила повторения в диалоге события; возвращает функцию чтения их значений"""
+        ttk.Label(dialog, text="Повтор:").pack()
+        repeat_var = tk.StringVar(value=event.repeat if event is not None and event.repeat else NO_REPEAT)
+        ttk.Combobox(dialog, textvariable=repeat_var, values=(NO_REPEAT,) + REPEATS,
+                     state="readonly").pack(fill=tk.X, padx=10, pady=5)
+
+        entries = []
+        values = (event.repeat_interval, event.repeat_until, event.repeat_except) if event is not None else ()
+        labels = ("Каждые (число дней, недель или месяцев):", "Повторять до (ГГГГ-ММ-ДД):",
+                  "Кроме дат (ГГГГ-ММ-ДД через запятую):")
+        for index, label in enumerate(labels):
+            ttk.Label(dialog, text=label).pack()
+            entry = ttk.Entry(dialog)
+            if index < len(values) and values[index]:
+                entry.insert(0, str(values[index]))
+            entry.pack(fill=tk.X, padx=10, pady=5)
+            entries.append(entry)
+
+        def read():
+            repeat = repeat_var.get()
+            return (("" if repeat == NO_REPEAT else repeat),) + tuple(entry.get().strip() for entry in entries)
+
+        return read
+
     def delete_event(self):
-        """Удаление выбранного события"""
-        selected = self.event_tree.focus()
-        if not selected:
+        """Удаление выбранных событий"""
+        event_ids = self.selected_ids(self.event_view)
+        if not event_ids:
             messagebox.showwarning("Предупреждение", "Выберите событие для удаления")
             return
 
-        item = self.event_tree.item(selected)
-        event_id = int(item["values"][0])
-
-        if messagebox.askyesno("Подтверждение", "Вы уверены, что хотите удалить это событие?"):
-            self.events = [e for e in self.events if e["id"] != event_id]
-            self.save_data()
+        question = ("Вы уверены, что хотите удалить это событие?" if len(event_ids) == 1
+                    else f"Вы уверены, что хотите удалить выбранные события ({len(event_ids)})?")
+        if messagebox.askyesno("Подтверждение", question):
+            self.core.delete_many("events", event_ids)
             self.update_event_list()
 
     def update_event_list(self):
         """Обновление списка событий"""
-        for item in self.event_tree.get_children():
-            self.event_tree.delete(item)
+        if "events" not in self.shown:
+            return
+        with span("update_event_list"):
+            self.search_scheduler.run_now("events", self.event_query(), self.show_event_rows)
+
+    def schedule_event_list(self):
+        """Отложенное обновление списка событий при вводе в поле поиска"""
+        if "events" not in self.shown:
+            return
+        self.search_scheduler.schedule("events", self.event_query(), self.show_event_rows, self.repo.count("events"))
 
-        search_text = self.event_search_var.get().lower()
+    def event_query(self):
+        """Запрос строк списка событий с текущими фильтром и поиском"""
+        search_text = self.event_search_var.get()
         filter_type = self.event_filter.get()
-        today = datetime.now().date()
-
-        for event in sorted(self.events, key=lambda x: (x["date"], x.get("time", "00:00"))):
-            # Применение фильтра
-            event_date = datetime.strptime(event["date"], "%Y-%m-%d").date()
-            if filter_type == "Предстоящие" and event_date < today:
-                continue
-            if filter_type == "Прошедшие" and event_date >= today:
-                continue
-
-            # Применение поиска
-            event_text = (event["title"] + " " + event.get("description", "")).lower()
-            if search_text and search_text not in event_text:
-                continue
-
-            self.event_tree.insert("", tk.END, values=(
-                event["id"],
-                event["title"],
-                event["date"],
-                event.get("time", "Весь день"),
-                f"{event.get('reminder', 'Нет')} мин" if event.get("reminder") else "Нет"
-            ))
+        return lambda cancelled: self.core.find("events", filter_type, search_text, cancelled)
+
+    def show_event_rows(self, events):
+        """Вывод событий в виртуальный список: создаются только видимые строки"""
+        self.event_view.set_items(events)
 
     # Методы для работы с заметками
     def add_note_dialog(self):
@@ -709,21 +1377,11 @@ class StudentDayApp:
             title = title_entry.get().strip()
             content = content_entry.get("1.0", tk.END).strip()
 
-            if not title:
-                messagebox.showerror("Ошибка", "Название заметки обязательно!")
+            try:
+                self.core.add_note(title, content)
+            except ValidationError as e:
+                messagebox.showerror("Ошибка", str(e))
                 return
-
-            note_id = max([n.get("id", 0) for n in self.notes], default=0) + 1
-            new_note = {
-                "id": note_id,
-                "title": title,
-                "content": content,
-                "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                "updated_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            }
-
-            self.notes.append(new_note)
-            self.save_data()
             self.update_note_list()
             dialog.destroy()
 
@@ -731,14 +1389,13 @@ class StudentDayApp:
 
     def edit_note(self):
         """Редактирование выбранной заметки"""
-        selected = self.note_tree.focus()
+        selected = self.note_view.focus()
         if not selected:
             messagebox.showwarning("Предупреждение", "Выберите заметку для редактирования")
             return
 
-        item = self.note_tree.item(selected)
-        note_id = int(item["values"][0])
-        note = next((n for n in self.notes if n["id"] == note_id), None)
+        note_id = int(selected)
+        note = self.repo.get("notes", note_id)
 
         if not note:
             messagebox.showerror("Ошибка", "Заметка не найдена")
@@ -752,72 +1409,93 @@ class StudentDayApp:
 
         ttk.Label(dialog, text="Название заметки:").pack(pady=(10, 0))
         title_entry = ttk.Entry(dialog)
-        title_entry.insert(0, note["title"])
+        title_entry.insert(0, note.title)
         title_entry.pack(fill=tk.X, padx=10, pady=5)
 
         ttk.Label(dialog, text="Содержание:").pack()
         content_entry = tk.Text(dialog, height=15)
-        content_entry.insert("1.0", note["content"])
+        # Текст заметки не хранится в записи: он читается с диска при открытии и при построении поискового индекса
+        content_entry.insert("1.0", self.repo.content(note))
         content_entry.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
 
         def save_changes():
             title = title_entry.get().strip()
             content = content_entry.get("1.0", tk.END).strip()
 
-            if not title:
-                messagebox.showerror("Ошибка", "Название заметки обязательно!")
+            try:
+                self.core.update_note(note, title, content)
+            except ValidationError as e:
+                messagebox.showerror("Ошибка", str(e))
                 return
-
-            note["title"] = title
-            note["content"] = content
-            note["updated_at"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-            self.save_data()
             self.update_note_list()
             dialog.destroy()
 
         ttk.Button(dialog, text="Сохранить", command=save_changes).pack(pady=10)
 
     def delete_note(self):
-        """Удаление выбранной заметки"""
-        selected = self.note_tree.focus()
-        if not selected:
+        """Удаление выбранных заметок"""
+        note_ids = self.selected_ids(self.note_view)
+        if not note_ids:
             messagebox.showwarning("Предупреждение", "Выберите заметку для удаления")
             return
 
-        item = self.note_tree.item(selected)
-        note_id = int(item["values"][0])
-
-        if messagebox.askyesno("Подтверждение", "Вы уверены, что хотите удалить эту заметку?"):
-            self.notes = [n for n in self.notes if n["id"] != note_id]
-            self.save_data()
+        question = ("Вы уверены, что хотите удалить эту заметку?" if len(note_ids) == 1
+                    else f"Вы уверены, что хотите удалить выбранные заметки ({len(note_ids)})?")
+        if messagebox.askyesno("Подтверждение", question):
+            self.core.delete_many("notes", note_ids)
             self.update_note_list()
 
     def update_note_list(self):
         """Обновление списка заметок"""
-        for item in self.note_tree.get_children():
-            self.note_tree.delete(item)
-
-        search_text = self.note_search_var.get().lower()
+        if "notes" not in self.shown:
+            return
+        with span("update_note_list"):
+            self.search_scheduler.run_now("notes", self.note_query(), self.show_note_rows)
 
-        for note in sorted(self.notes, key=lambda x: x["updated_at"], reverse=True):
-            # Применение поиска
-            note_text = (note["title"] + " " + note["content"]).lower()
-            if search_text and search_text not in note_text:
-                continue
+    def schedule_note_list(self):
+        """Отложенное обновление списка заметок при вводе в поле поиска"""
+        if "notes" not in self.shown:
+            return
+        self.search_scheduler.schedule("notes", self.note_query(), self.show_note_rows, self.repo.count("notes"))
 
-            created = datetime.strptime(note["created_at"], "%Y-%m-%d %H:%M:%S").strftime("%d.%m.%Y %H:%M")
-            updated = datetime.strptime(note["updated_at"], "%Y-%m-%d %H:%M:%S").strftime("%d.%m.%Y %H:%M")
+    def note_query(self):
+        """Запрос строк списка заметок с текущим поиском"""
+        search_text = self.note_search_var.get()
+        return lambda cancelled: self.core.find("notes", search_text=search_text, cancelled=cancelled)
 
-            self.note_tree.insert("", tk.END, values=(
-                note["id"],
-                note["title"],
-                created,
-                updated
-            ))
+    def show_note_rows(self, notes):
+        """Вывод заметок в виртуальный список: создаются только видимые строки"""
+        self.note_view.set_items(notes)
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="День студента 25")
+    parser.add_argument("--sqlite", action="store_true", help="хранить данные в SQLite")
+    parser.add_argument("--binary", action="store_true", help="писать снимок в компактном двоичном формате")
+    parser.add_argument("--export-json", metavar="PATH", help="выгрузить данные в читаемый JSON и выйти")
+    parser.add_argument("--import-json", metavar="PATH", help="добавить записи из выгрузки JSON или двоичной и выйти")
+    parser.add_argument("--diagnostics", action="store_true", help="записывать замеры с самого запуска")
+    parser.add_argument("--columnar", action="store_true", help="хранить записи в памяти по столбцам (большие архивы)")
+    args = parser.parse_args()
+    recorder.enable(args.diagnostics)
+
+    storage_mode = "sqlite" if args.sqlite else "binary" if args.binary else "json"
+
+    if args.export_json or args.import_json:
+        # Выгрузка и загрузка идут через то же хранилище, с которым запустилось бы приложение
+        core = StudentDayCore(open_repository(storage_mode, DB_FILE, SQLITE_FILE, args.columnar))
+        try:
+            core.load(background=False)
+            if args.export_json:
+                core.export(args.export_json)
+            else:
+                core.import_file(args.import_json)
+        except (ValidationError, ValueError, OSError) as e:
+            sys.exit(f"Ошибка: {e}")
+        finally:
+            core.close()
+        sys.exit()
+
     root = tk.Tk()
-    app = StudentDayApp(root)
+    app = StudentDayApp(root, storage_mode=storage_mode, columnar=args.columnar)
     root.mainloop()
\ No newline at end of file
@@ -0,0 +1,463 @@
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from itertools import cycle
+
+from core import EVENT_FILTERS, PRIORITIES, TASK_FILTERS, ROWS, StudentDayCore, event_span, open_repository, today
+from dateindex import DateIndex
+from intervals import IntervalIndex
+from repository import ORDER_KEYS, Collection, record_to_dict
+from serializers import BINARY
+from stats import StatsAggregator
+from storage import JournalStorage, KINDS
+from treeview import VirtualTreeView
+
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json")
+
+# Замедление относительно базовой линии, которое считается регрессией; меньшие колебания дает фоновая нагрузка
+DEFAULT_TOLERANCE = 2.0
+
+# Доли типов записей в сгенерированной базе
+KIND_SHARES = (("tasks", 0.6), ("events", 0.25), ("notes", 0.15))
+
+# День, вокруг которого раскладываются сроки и даты: генерация не зависит от текущей даты
+BASE_DATE = date(2025, 9, 1)
+
+SUBJECTS = ("матанализ", "линейная алгебра", "физика", "программирование", "история", "философия",
+            "английский язык", "экономика", "базы данных", "операционные системы", "дискретная математика",
+            "теория вероятностей", "физкультура", "курсовая работа", "дипломный проект")
+TASK_VERBS = ("Сдать", "Подготовить", "Прочитать", "Решить", "Повторить", "Написать", "Оформить", "Проверить")
+TASK_OBJECTS = ("лабораторную", "реферат", "домашнее задание", "конспект", "задачи к семинару",
+                "доклад", "презентацию", "отчет", "контрольную")
+EVENT_TYPES = ("Лекция", "Семинар", "Экзамен", "Зачет", "Консультация", "Коллоквиум", "Встреча группы")
+PLACES = ("ауд. 101", "ауд. 214", "ауд. 305", "главный корпус", "библиотека", "онлайн", "лаборатория")
+WORDS = ("студент", "преподаватель", "материал", "вопрос", "билет", "формула", "пример", "глава",
+         "определение", "теорема", "доказательство", "таблица", "график", "список", "литература",
+         "срок", "оценка", "группа", "староста", "расписание", "ёлка", "щука", "объём", "съезд")
+
+# Строка поиска, которая встречается в части записей каждого типа
+SEARCH_TEXT = "алгебр"
+
+
+def sentence(rng, length):
+    """Случайная фраза из словаря"""
+    words = [rng.choice(WORDS) for _ in range(length)]
+    return " ".join(words).capitalize() + "."
+
+
+def generate_records(count, seed=25):
+    """Детерминированные записи базы: пары (тип, словарь) с id по порядку в каждом типе"""
+    rng = random.Random(seed)
+    kinds = [kind for kind, _ in KIND_SHARES]
+    weights = [share for _, share in KIND_SHARES]
+    next_ids = {kind: 1 for kind in KINDS}
+    for _ in range(count):
+        kind = rng.choices(kinds, weights)[0]
+        record_id = next_ids[kind]
+        next_ids[kind] += 1
+        created = BASE_DATE - timedelta(days=rng.randint(0, 365), seconds=rng.randint(0, 86399))
+        created_at = f"{created:%Y-%m-%d} {rng.randint(8, 23):02d}:{rng.randint(0, 59):02d}:{rng.randint(0, 59):02d}"
+        subject = rng.choice(SUBJECTS)
+
+        if kind == "tasks":
+            due = BASE_DATE + timedelta(days=rng.randint(-180, 180))
+            yield kind, {
+                "id": record_id,
+                "title": f"{rng.choice(TASK_VERBS)} {rng.choice(TASK_OBJECTS)} по предмету {subject}",
+                "description": sentence(rng, rng.randint(0, 20)),
+                "priority": rng.choice(("Низкий", "Средний", "Средний", "Высокий")),
+                # Часть задач без срока
+                "due_date": None if rng.random() < 0.2 else due.isoformat(),
+                "completed": rng.random() < 0.4,
+                "created_at": created_at,
+            }
+        elif kind == "events":
+            day = BASE_DATE + timedelta(days=rng.randint(-120, 240))
+            moment = None if rng.random() < 0.15 else f"{rng.randint(8, 20):02d}:{rng.choice((0, 15, 30, 45)):02d}"
+            yield kind, {
+                "id": record_id,
+                "title": f"{rng.choice(EVENT_TYPES)}: {subject}",
+                "description": f"{rng.choice(PLACES)}. {sentence(rng, rng.randint(0, 10))}",
+                "date": day.isoformat(),
+                "time": moment,
+                # Длительность берется от id, чтобы не менять остальные поля набора данных
+                "duration": (45, 90, 90, 180)[record_id % 4] if moment else None,
+                "reminder": rng.choice((None, None, 10, 15, 30, 60, 1440)),
+                "created_at": created_at,
+            }
+        else:
+            yield kind, {
+                "id": record_id,
+                "title": f"Конспект: {subject}",
+                "content": "\n".join(sentence(rng, rng.randint(5, 25)) for _ in range(rng.randint(1, 12))),
+                "created_at": created_at,
+                "updated_at": created_at,
+            }
+
+
+def generate(path, count, seed=25):
+    """Запись сгенерированной базы в student_tasks.json построчно, без сборки всего снимка в памяти"""
+    # Записи одного типа в снимке идут подряд, поэтому типы пишутся во временные файлы и склеиваются
+    directory = tempfile.mkdtemp(prefix="bench-")
+    try:
+        parts = {kind: open(os.path.join(directory, kind), "w+", encoding="utf-8") for kind in KINDS}
+        counts = {kind: 0 for kind in KINDS}
+        for kind, record in generate_records(count, seed):
+            part = parts[kind]
+            if counts[kind]:
+                part.write(",\n")
+            part.write("        " + json.dumps(record, ensure_ascii=False))
+            counts[kind] += 1
+
+        with open(path, "w", encoding="utf-8") as f:
+            next_ids = {kind: counts[kind] + 1 for kind in KINDS}
+            f.write('{\n    "next_ids": ' + json.dumps(next_ids) + ",\n")
+            for i, kind in enumerate(KINDS):
+                part = parts[kind]
+                part.seek(0)
+                f.write(f'    "{kind}": [\n')
+                shutil.copyfileobj(part, f)
+                f.write("\n    ]" + (",\n" if i < len(KINDS) - 1 else "\n"))
+            f.write("}\n")
+        for part in parts.values():
+            part.close()
+    finally:
+        shutil.rmtree(directory)
+    return counts
+
+
+class TreeStub:
+    """Treeview без окна: хранит строки и считает вызовы, которые ушли бы в Tk"""
+
+    def __init__(self):
+        self.rows = {}
+        self.calls = 0
+
+    def _call(self):
+        self.calls += 1
+
+    def configure(self, **options):
+        self._call()
+
+    def bind(self, sequence, func=None, add=None):
+        self._call()
+
+    def insert(self, parent, index, iid=None, values=()):
+        self._call()
+        self.rows[iid] = values
+
+    def delete(self, *iids):
+        self._call()
+        for iid in iids:
+            self.rows.pop(iid, None)
+
+    def detach(self, *iids):
+        self._call()
+
+    def move(self, iid, parent, index):
+        self._call()
+
+    def item(self, iid, values=None):
+        self._call()
+        self.rows[iid] = values
+
+    def selection(self):
+        return ()
+
+    def selection_set(self, items):
+        self._call()
+
+    def focus(self, iid=None):
+        if iid is not None:
+            self._call()
+        return ""
+
+    def see(self, iid):
+        self._call()
+
+    def yview(self):
+        return 0.0, 0.2
+
+    def yview_moveto(self, fraction):
+        self._call()
+
+    def set(self, lo, hi):
+        self._call()
+
+
+def measure(func, repeat):
+    """Время выполнения func в секундах: минимум и медиана по повторам"""
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - started)
+    return {"min": min(times), "median": statistics.median(times)}
+
+
+def prepare(directory, count, mode, seed):
+    """Сгенерированная база в нужном формате хранения; преобразование не входит в замеры"""
+    db_file = os.path.join(directory, "student_tasks.json")
+    sqlite_file = os.path.join(directory, "student_tasks.db")
+    counts = generate(db_file, count, seed)
+    if mode == "binary":
+        storage = JournalStorage(db_file, serializer=BINARY)
+        data = storage.load()
+        storage.compact(data, data["next_ids"], background=False)
+        storage.close()
+    if mode == "sqlite":
+        # В SQLite переносится база из одного журнала: так она выглядит до первого сжатия
+        storage = JournalStorage(db_file)
+        data = storage.load()
+        storage.close()
+        os.remove(db_file)
+        storage = JournalStorage(db_file)
+        storage.append_many(("put", kind, record) for kind in KINDS for record in data[kind])
+        storage.close()
+    # Первое открытие переносит данные в SQLite, первое изменение - тексты заметок в хранилище блоков
+    core = StudentDayCore(open_repository(mode, db_file, sqlite_file))
+    core.load(background=False)
+    loaded = {kind: len(core.repo.all(kind)) for kind in KINDS}
+    notes = core.repo.all("notes")
+    if mode != "sqlite" and notes:
+        core.repo.update("notes", notes[0])
+    core.close()
+    if loaded != counts:
+        raise RuntimeError(f"база {mode} загружена не полностью: {loaded} вместо {counts}")
+    return db_file, sqlite_file
+
+
+def run_benchmarks(count, mode="json", repeat=5, seed=25, only=None, columnar=False):
+    """Замеры путей загрузки, сохранения, фильтров, поиска, сортировки, статистики, календаря и списков"""
+    directory = tempfile.mkdtemp(prefix="bench-")
+    results = {}
+
+    def bench(name, func, times=repeat):
+        if only and not any(name.startswith(prefix) for prefix in only):
+            return
+        results[name] = measure(func, times)
+
+    try:
+        db_file, sqlite_file = prepare(directory, count, mode, seed)
+
+        def load():
+            core = StudentDayCore(open_repository(mode, db_file, sqlite_file, columnar))
+            core.load(background=False)
+            core.close()
+
+        bench("load", load)
+
+        core = StudentDayCore(open_repository(mode, db_file, sqlite_file, columnar))
+        core.load(background=False)
+        repo = core.repo
+        if mode != "sqlite":
+            # Пауза сбора изменений в одну запись измеряла бы ожидание, а не стоимость записи
+            repo.storage.coalesce_delay = 0
+        try:
+            def save_one():
+                task = core.add_task("Сдать отчет по практике", "Описание", "Высокий", "2025-10-01")
+                core.delete("tasks", task.id)
+                if mode != "sqlite":
+                    repo.storage.flush()
+
+            bench("save.one", save_one)
+
+            # Действие над выделением: одна транзакция и одно задание журнала на все записи
+            task_ids = [task.id for task in repo.all("tasks")[:1000]]
+            priorities = cycle(PRIORITIES)
+
+            def save_bulk():
+                core.set_priority(task_ids, next(priorities))
+                if mode != "sqlite":
+                    repo.storage.flush()
+
+            bench("save.bulk", save_bulk)
+            if mode != "sqlite":
+                bench("save.snapshot", lambda: repo.storage.compact(repo.data, repo.next_ids(),
+                                                                     serialize=record_to_dict,
+                                                                     background=False))
+
+            for filter_type in TASK_FILTERS:
+                bench(f"filter.tasks.{filter_type}", lambda f=filter_type: core.find("tasks", f))
+            for filter_type in EVENT_FILTERS:
+                bench(f"filter.events.{filter_type}", lambda f=filter_type: core.find("events", f))
+            bench("filter.notes", lambda: core.find("notes"))
+
+            # Поиск до построения индекса проверяет текст каждой записи
+            for kind in KINDS:
+                bench(f"search.scan.{kind}", lambda k=kind: core.find(k, search_text=SEARCH_TEXT))
+            for kind in KINDS:
+                records = repo.all(kind)
+
+                def build(k=kind, r=records):
+                    index = core.new_search_index(k)
+                    index.build(r)
+                    return index
+
+                bench(f"search.index_build.{kind}", build, max(1, repeat // 2))
+                core.install_search_index(kind, build())
+                bench(f"search.indexed.{kind}", lambda k=kind: core.find(k, search_text=SEARCH_TEXT))
+
+            for kind in KINDS:
+                records = repo.all(kind)
+                if mode == "sqlite":
+                    query = {"tasks": repo.query_tasks, "events": repo.query_events, "notes": repo.query_notes}
+                    bench(f"sort.{kind}", query[kind])
+                else:
+                    bench(f"sort.{kind}", lambda k=kind, r=records: Collection(r, 1, ORDER_KEYS[k]))
+
+            def stats():
+                aggregator = StatsAggregator(today())
+                for kind in KINDS:
+                    aggregator.build(kind, repo.all(kind))
+                return aggregator.values()
+
+            bench("stats", stats)
+
+            # Календарь: индекс дат, занятые дни месяца и дела одного дня
+            def date_index():
+                indexes = {"tasks": DateIndex(lambda task: task.due_date),
+                           "events": DateIndex(lambda event: event.date)}
+                for kind, index in indexes.items():
+                    index.build(repo.all(kind))
+                return indexes
+
+            bench("calendar.index_build", date_index, max(1, repeat // 2))
+            month_start = BASE_DATE.replace(day=1)
+            month_stop = (month_start + timedelta(days=31)).replace(day=1)
+            bench("calendar.month", lambda: core.busy_days(month_start.isoformat(), month_stop.isoformat()))
+            bench("calendar.day", lambda: core.day_items(BASE_DATE.isoformat()))
+
+            # Промежутки событий: построение индекса, выборка дня и проверка пересечений нового события
+            def interval_index():
+                index = IntervalIndex(event_span)
+                index.build(repo.all("events"))
+                return index
+
+            bench("intervals.build", interval_index, max(1, repeat // 2))
+            core.interval_index()
+            day_start = datetime.combine(BASE_DATE, datetime.min.time())
+            bench("intervals.between", lambda: core.events_between(day_start, day_start + timedelta(days=1)))
+            probe = core.new_event("Консультация", "", BASE_DATE.isoformat(), "12:00", duration="120")
+            bench("intervals.conflicts", lambda: core.conflicts(probe))
+
+            # Список вкладки: первое заполнение и обновление после изменения одной записи
+            for kind in KINDS:
+                items = core.find(kind)
+
+                def fill(k=kind, i=items):
+                    view = VirtualTreeView(TreeStub(), TreeStub(), ROWS[k])
+                    view.set_items(i)
+                    return view
+
+                view = fill()
+                bench(f"list.fill.{kind}", fill)
+                bench(f"list.refresh.{kind}", lambda v=view, i=items: v.set_items(i[1:] + i[:1]))
+        finally:
+            core.close()
+    finally:
+        shutil.rmtree(directory)
+    return results
+
+
+def machine():
+    """Описание среды замеров для базовой линии"""
+    return {"python": platform.python_version(), "platform": platform.platform(), "cpu": platform.processor()}
+
+
+def load_baseline(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_baseline(path, baseline):
+    tmp_file = path + ".tmp"
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        json.dump(baseline, f, ensure_ascii=False, indent=4, sort_keys=True)
+        f.write("\n")
+    os.replace(tmp_file, path)
+
+
+def compare(results, reference, tolerance):
+    """Замеры, лучшее время которых выросло больше допустимого; очень быстрые пути не сравниваются"""
+    # Минимум по повторам меньше медианы зависит от посторонней нагрузки на машину
+    regressions = []
+    for name, timing in results.items():
+        previous = reference.get(name)
+        if previous is None or previous["min"] < 1e-4:
+            continue
+        ratio = timing["min"] / previous["min"]
+        if ratio > tolerance:
+            regressions.append((name, previous["min"], timing["min"], ratio))
+    return regressions
+
+
+def print_results(key, results, reference, out):
+    out.write(f"{key}\n")
+    for name, timing in results.items():
+        line = f"  {name:32} {timing['median'] * 1000:10.2f} мс (мин {timing['min'] * 1000:.2f})"
+        previous = reference.get(name)
+        if previous is not None and previous["min"]:
+            line += f"  x{timing['min'] / previous['min']:.2f} к базовой (по минимуму)"
+        out.write(line + "\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Замеры путей данных Дня студента 25 без окна")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    command = commands.add_parser("generate", help="создать детерминированную базу student_tasks.json")
+    command.add_argument("path")
+    command.add_argument("--count", type=int, default=10000)
+    command.add_argument("--seed", type=int, default=25)
+
+    command = commands.add_parser("run", help="выполнить замеры и сравнить с базовой линией")
+    command.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000])
+    command.add_argument("--mode", default="json", choices=("json", "binary", "sqlite"))
+    command.add_argument("--columnar", action="store_true", help="записи в памяти по столбцам (json и binary)")
+    command.add_argument("--repeat", type=int, default=5)
+    command.add_argument("--seed", type=int, default=25)
+    command.add_argument("--only", nargs="+", help="замеры, имена которых начинаются с указанного")
+    command.add_argument("--baseline", default=BASELINE_FILE)
+    command.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    command.add_argument("--update-baseline", action="store_true", help="записать результаты как базовую линию")
+    args = parser.parse_args(argv)
+
+    if args.command == "generate":
+        counts = generate(args.path, args.count, args.seed)
+        print(", ".join(f"{kind}: {count}" for kind, count in counts.items()))
+        return 0
+
+    baseline = load_baseline(args.baseline)
+    regressions = []
+    for size in args.sizes:
+        key = f"{args.mode}{'+columnar' if args.columnar else ''}:{size}"
+        results = run_benchmarks(size, args.mode, args.repeat, args.seed, args.only, args.columnar)
+        reference = baseline.get("results", {}).get(key, {})
+        print_results(key, results, reference, sys.stdout)
+        regressions += [(key,) + regression for regression in compare(results, reference, args.tolerance)]
+        if args.update_baseline:
+            baseline.setdefault("results", {}).setdefault(key, {}).update(results)
+
+    if args.update_baseline:
+        baseline["machine"] = machine()
+        save_baseline(args.baseline, baseline)
+        return 0
+    for key, name, before, after, ratio in regressions:
+        print(f"Регрессия {key} {name}: {before * 1000:.2f} -> {after * 1000:.2f} мс (x{ratio:.2f})", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
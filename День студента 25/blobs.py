@@ -0,0 +1,57 @@
+import hashlib
+import os
+import time
+
+
+def content_hash(text):
+    """Адрес текста в хранилище блоков"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class BlobStore:
+    """Тексты в отдельных файлах, названных по хешу содержимого; одинаковые тексты хранятся один раз"""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def path(self, digest):
+        # Файлы разложены по подкаталогам, чтобы ни в одном не было слишком много записей
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def exists(self, digest):
+        return os.path.exists(self.path(digest))
+
+    def write(self, digest, text):
+        """Запись блока во временный файл с fsync и атомарное переименование"""
+        path = self.path(digest)
+        if os.path.exists(path):
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Тот же текст может одновременно записывать другой процесс
+        tmp_file = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_file, "wb") as f:
+            f.write(text.encode("utf-8"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, path)
+
+    def read(self, digest):
+        with open(self.path(digest), "rb") as f:
+            return f.read().decode("utf-8")
+
+    def collect(self, live, min_age=86400):
+        """Удаление блоков, на которые не ссылается ни одна запись"""
+        # Свежие блоки не трогаются: на них может ссылаться еще не прочитанная строка журнала
+        if not os.path.isdir(self.directory):
+            return 0
+        removed = 0
+        cutoff = time.time() - min_age
+        for shard in os.scandir(self.directory):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name in live or entry.stat().st_mtime > cutoff:
+                    continue
+                os.remove(entry.path)
+                removed += 1
+        return removed
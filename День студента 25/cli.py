@@ -0,0 +1,238 @@
+import argparse
+import json
+import os
+import shlex
+import sys
+from datetime import datetime
+
+from core import (DB_FILE, EVENT_FILTERS, PRIORITIES, ROWS, SQLITE_FILE, TASK_FILTERS, StudentDayCore,
+                  ValidationError, open_repository, span_text)
+from instrumentation import recorder
+from recurrence import REPEATS
+from serializers import BINARY, JSON
+from storage import KINDS
+from transfer import detect_format
+
+
+class CommandError(Exception):
+    """Ошибка команды, о которой достаточно сообщить одной строкой"""
+
+
+class CommandParser(argparse.ArgumentParser):
+    """Разбор команд; внутри пакета ошибка разбора не завершает процесс"""
+
+    def error(self, message):
+        raise CommandError(message)
+
+
+def build_parser():
+    """Разбор аргументов командной строки и строк пакетного файла"""
+    parser = CommandParser(prog="cli.py", description="День студента 25 без окна: пакетная работа с данными")
+    parser.add_argument("--sqlite", action="store_true", help="работать с базой SQLite")
+    parser.add_argument("--binary", action="store_true", help="писать снимок в компактном двоичном формате")
+    parser.add_argument("--columnar", action="store_true", help="хранить записи в памяти по столбцам (большие архивы)")
+    parser.add_argument("--db", default=None, help="файл данных (по умолчанию как у приложения)")
+    parser.add_argument("--trace", metavar="PATH", help="записать замеры участков в файл трассы (Trace Event JSON)")
+    commands = parser.add_subparsers(dest="command", required=True, parser_class=CommandParser)
+
+    command = commands.add_parser("list", help="вывести записи")
+    command.add_argument("kind", choices=KINDS)
+    command.add_argument("--filter", default="Все", choices=sorted(set(TASK_FILTERS + EVENT_FILTERS)))
+    command.add_argument("--search", default="", help="подстрока в названии и тексте")
+    command.add_argument("--json", action="store_true", help="по записи JSON в строке")
+
+    command = commands.add_parser("add-task", help="добавить задачу")
+    command.add_argument("title")
+    command.add_argument("--description", default="")
+    command.add_argument("--priority", default="Средний", choices=PRIORITIES)
+    command.add_argument("--due", default="", help="срок ГГГГ-ММ-ДД")
+
+    command = commands.add_parser("add-event", help="добавить событие")
+    command.add_argument("title")
+    command.add_argument("date", help="дата ГГГГ-ММ-ДД")
+    command.add_argument("--time", default="", help="время ЧЧ:ММ")
+    command.add_argument("--duration", default="", help="длительность в минутах")
+    command.add_argument("--reminder", default="", help="минуты до события")
+    command.add_argument("--description", default="")
+    command.add_argument("--repeat", default="", choices=REPEATS, help="повторять событие")
+    command.add_argument("--every", default="", help="интервал повтора: каждые N дней, недель или месяцев")
+    command.add_argument("--until", default="", help="последний день повтора ГГГГ-ММ-ДД")
+    command.add_argument("--except", dest="skip", default="", help="пропускаемые даты ГГГГ-ММ-ДД через запятую")
+
+    command = commands.add_parser("between", help="вывести события со временем, идущие в промежутке")
+    command.add_argument("start", help="начало ГГГГ-ММ-ДД или \"ГГГГ-ММ-ДД ЧЧ:ММ\"")
+    command.add_argument("stop", help="конец (не включая) в том же виде")
+
+    command = commands.add_parser("add-note", help="добавить заметку")
+    command.add_argument("title")
+    command.add_argument("--content", default="")
+
+    command = commands.add_parser("complete", help="отметить задачи выполненными")
+    command.add_argument("ids", type=int, nargs="+")
+
+    command = commands.add_parser("set-priority", help="сменить приоритет задач")
+    command.add_argument("priority", choices=PRIORITIES)
+    command.add_argument("ids", type=int, nargs="+")
+
+    command = commands.add_parser("reschedule", help="перенести срок задач или дату событий")
+    command.add_argument("kind", choices=("tasks", "events"))
+    command.add_argument("date", help="новая дата ГГГГ-ММ-ДД; пустая строка снимает срок задач")
+    command.add_argument("ids", type=int, nargs="+")
+
+    command = commands.add_parser("delete", help="удалить записи")
+    command.add_argument("kind", choices=KINDS)
+    command.add_argument("ids", type=int, nargs="+")
+
+    commands.add_parser("stats", help="вывести статистику")
+
+    command = commands.add_parser("import", help="добавить записи из CSV, iCalendar (.ics) или выгрузки JSON/двоичной")
+    command.add_argument("path")
+    command.add_argument("--kind", choices=KINDS, help="тип записей CSV файла")
+    command.add_argument("--skip-invalid", action="store_true", help="пропускать неверные записи, а не отменять импорт")
+
+    command = commands.add_parser("export", help="выгрузить записи")
+    command.add_argument("path")
+    command.add_argument("--format", choices=("json", "binary", "csv", "ics"),
+                         help="формат (по умолчанию по расширению файла, иначе json)")
+    command.add_argument("--kind", choices=KINDS, help="тип записей для CSV")
+
+    command = commands.add_parser("batch",
+                                  help="выполнить команды из файла, по одной в строке ('-' - стандартный ввод)")
+    command.add_argument("path")
+    return parser
+
+
+def parse_moment(value):
+    """Момент из строки ГГГГ-ММ-ДД ЧЧ:ММ или начало дня из ГГГГ-ММ-ДД"""
+    for pattern in ("%Y-%m-%d %H:%M", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(value.strip(), pattern)
+        except ValueError:
+            pass
+    raise CommandError(f"неверный момент: {value}")
+
+
+def run(core, args, out):
+    """Выполнение одной команды над загруженными данными"""
+    if args.command == "list":
+        for record in core.find(args.kind, args.filter, args.search):
+            if args.json:
+                out.write(json.dumps(core.record_dict(args.kind, record), ensure_ascii=False) + "\n")
+            else:
+                out.write("\t".join("" if value is None else str(value) for value in ROWS[args.kind](record)) + "\n")
+    elif args.command == "add-task":
+        out.write(f"{core.add_task(args.title, args.description, args.priority, args.due).id}\n")
+    elif args.command == "add-event":
+        record = core.new_event(args.title, args.description, args.date, args.time, args.reminder,
+                                args.repeat, args.every, args.until, args.skip, args.duration)
+        # Пересечение не мешает добавлению, о нем только предупреждается
+        for begin, end, other in core.conflicts(record):
+            print(f"пересекается с {other.id}: {span_text(begin, end, other)}", file=sys.stderr)
+        out.write(f"{core.save_event(record).id}\n")
+    elif args.command == "between":
+        for begin, end, event in core.events_between(parse_moment(args.start), parse_moment(args.stop)):
+            out.write(f"{event.id}\t{begin.strftime('%Y-%m-%d %H:%M')}\t{end.strftime('%Y-%m-%d %H:%M')}\t"
+                      f"{event.title}\n")
+    elif args.command == "add-note":
+        out.write(f"{core.add_note(args.title, args.content).id}\n")
+    elif args.command == "complete":
+        with core.repo.transaction():
+            found = {task.id for task in core.existing("tasks", args.ids)}
+            core.complete_tasks(found)
+        missing = [task_id for task_id in args.ids if task_id not in found]
+        if missing:
+            raise CommandError(f"задачи не найдены: {', '.join(map(str, missing))}")
+    elif args.command == "set-priority":
+        core.set_priority(args.ids, args.priority)
+    elif args.command == "reschedule":
+        core.reschedule(args.kind, args.ids, args.date)
+    elif args.command == "delete":
+        core.delete_many(args.kind, args.ids)
+    elif args.command == "stats":
+        for key, value in core.stats.values().items():
+            out.write(f"{key}\t{value}\n")
+    elif args.command == "import":
+        on_error = None
+        if args.skip_invalid:
+            def on_error(number, error):
+                print(f"{args.path}: запись {number}: {error}", file=sys.stderr)
+        counts = core.import_file(args.path, args.kind, on_error)
+        for kind in KINDS:
+            out.write(f"{kind}\t{counts[kind]}\n")
+    elif args.command == "export":
+        file_format = args.format or detect_format(args.path) or "json"
+        if file_format == "csv":
+            if args.kind is None:
+                raise CommandError("для CSV нужно указать --kind")
+            core.export_csv(args.path, args.kind)
+        elif file_format == "ics":
+            core.export_ics(args.path, (args.kind,) if args.kind else ("tasks", "events"))
+        else:
+            core.export(args.path, BINARY if file_format == "binary" else JSON)
+    elif args.command == "batch":
+        return run_batch(core, args.path, out)
+    return 0
+
+
+def run_batch(core, path, out):
+    """Команды из файла над один раз загруженными данными; ошибочные строки пропускаются"""
+    parser = build_parser()
+    failed = 0
+    f = sys.stdin if path == "-" else open(path, "r", encoding="utf-8")
+    try:
+        with core.repo.transaction():
+            for number, line in enumerate(f, 1):
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                try:
+                    args = parser.parse_args(shlex.split(line))
+                    if args.command == "batch":
+                        raise CommandError("вложенный пакет не поддерживается")
+                    run(core, args, out)
+                except (CommandError, ValidationError, ValueError) as e:
+                    failed += 1
+                    print(f"{path}:{number}: {e}", file=sys.stderr)
+    finally:
+        if f is not sys.stdin:
+            f.close()
+    return 1 if failed else 0
+
+
+def main(argv=None):
+    parser = build_parser()
+    try:
+        args = parser.parse_args(argv)
+    except CommandError as e:
+        parser.print_usage(sys.stderr)
+        print(f"{parser.prog}: ошибка: {e}", file=sys.stderr)
+        return 2
+
+    recorder.enable(args.trace is not None)
+    storage_mode = "sqlite" if args.sqlite else "binary" if args.binary else "json"
+    db_file = args.db or (SQLITE_FILE if args.sqlite else DB_FILE)
+    if args.sqlite:
+        repo = open_repository(storage_mode, sqlite_file=db_file)
+    else:
+        repo = open_repository(storage_mode, db_file=db_file, columnar=args.columnar)
+
+    # Данные загружаются один раз на весь запуск, в том числе на весь пакет команд
+    core = StudentDayCore(repo)
+    try:
+        core.load(background=False)
+        return run(core, args, sys.stdout)
+    except (CommandError, ValidationError) as e:
+        print(f"Ошибка: {e}", file=sys.stderr)
+        return 1
+    except BrokenPipeError:
+        # Вывод закрыт раньше времени, например командой head
+        sys.stdout = open(os.devnull, "w")
+        return 0
+    finally:
+        core.close()
+        if args.trace:
+            recorder.export_trace(args.trace)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
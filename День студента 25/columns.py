@@ -0,0 +1,282 @@
+import sys
+from array import array
+from datetime import date, datetime
+from itertools import compress
+
+from models import stored_fields
+
+
+# Код байтового столбца для значения, которому не хватило места в таблице значений
+OVERFLOW_CODE = 255
+
+# Сколько готовых объектов записей таблица держит, чтобы не собирать их из столбцов при каждом чтении
+RECORD_CACHE_SIZE = 16384
+
+# Строки дней по номеру дня: дат в записях немного, и каждая строка собирается один раз
+DAY_STRINGS = {}
+
+
+def day_string(ordinal):
+    """Дата ГГГГ-ММ-ДД по номеру дня"""
+    text = DAY_STRINGS.get(ordinal)
+    if text is None:
+        text = DAY_STRINGS[ordinal] = date.fromordinal(ordinal).isoformat()
+    return text
+
+
+class ObjectColumn:
+    """Значения как есть: тексты, которые не сжимаются без потерь; заголовки интернируются"""
+
+    def __init__(self, intern=False):
+        self.values = []
+        self.intern = intern
+
+    def _prepare(self, value):
+        # Одинаковые заголовки ("Лекция: Математика") хранятся одной строкой
+        return sys.intern(value) if self.intern and type(value) is str else value
+
+    def append(self, value):
+        self.values.append(self._prepare(value))
+
+    def set(self, row, value):
+        self.values[row] = self._prepare(value)
+
+    def get(self, row):
+        return self.values[row]
+
+    def matching(self, value, ids):
+        """id строк, где значение равно value"""
+        return compress(ids, [item == value for item in self.values])
+
+
+class PackedColumn:
+    """Числовые коды в массиве array; значение, которое не восстанавливается из кода точно, лежит в odd"""
+
+    typecode = "q"
+    # Коды пустого и несжимаемого значения; encode их не выдает
+    NONE = -1
+    ODD = -2
+
+    def __init__(self):
+        self.values = array(self.typecode)
+        self.odd = {}
+
+    def encode(self, value):
+        """Код значения или None, если оно не сжимается"""
+        raise NotImplementedError
+
+    def decode(self, code):
+        raise NotImplementedError
+
+    def _code(self, row, value):
+        if value is None:
+            return self.NONE
+        try:
+            code = self.encode(value)
+        except (TypeError, ValueError, OverflowError):
+            code = None
+        # Код годится, только если из него получается то же значение того же типа
+        if code is not None:
+            decoded = self.decode(code)
+            if type(decoded) is type(value) and decoded == value:
+                return code
+        self.odd[row] = value
+        return self.ODD
+
+    def append(self, value):
+        self.values.append(self._code(len(self.values), value))
+
+    def set(self, row, value):
+        self.odd.pop(row, None)
+        self.values[row] = self._code(row, value)
+
+    def get(self, row):
+        code = self.values[row]
+        if code == self.NONE:
+            return None
+        if code == self.ODD:
+            return self.odd[row]
+        return self.decode(code)
+
+    def matching(self, value, ids):
+        """id строк, где значение равно value"""
+        return compress(ids, [self.get(row) == value for row in range(len(self.values))])
+
+
+class IntColumn(PackedColumn):
+    """Целые числа (минуты напоминания, длительность, интервал повтора) по 8 байт"""
+
+    NONE = -2 ** 63
+    ODD = -2 ** 63 + 1
+
+    def encode(self, value):
+        if type(value) is not int or not self.ODD < value < 2 ** 63:
+            return None
+        return value
+
+    def decode(self, code):
+        return code
+
+
+class DateColumn(PackedColumn):
+    """Даты ГГГГ-ММ-ДД как номер дня по 4 байта вместо строки"""
+
+    typecode = "i"
+    NONE = 0
+    ODD = -1
+
+    def encode(self, value):
+        return date.fromisoformat(value).toordinal()
+
+    def decode(self, code):
+        return day_string(code)
+
+
+class TimeColumn(PackedColumn):
+    """Время ЧЧ:ММ как минуты от начала дня по 2 байта"""
+
+    typecode = "h"
+
+    def encode(self, value):
+        hours, minutes = value.split(":")
+        code = int(hours) * 60 + int(minutes)
+        return code if 0 <= code < 24 * 60 else None
+
+    def decode(self, code):
+        return f"{code // 60:02d}:{code % 60:02d}"
+
+
+class TimestampColumn(PackedColumn):
+    """Отметки времени ГГГГ-ММ-ДД ЧЧ:ММ:СС как число секунд по 8 байт"""
+
+    def encode(self, value):
+        moment = datetime.fromisoformat(value)
+        return moment.toordinal() * 86400 + moment.hour * 3600 + moment.minute * 60 + moment.second
+
+    def decode(self, code):
+        days, seconds = divmod(code, 86400)
+        minutes, seconds = divmod(seconds, 60)
+        return f"{day_string(days)} {minutes // 60:02d}:{minutes % 60:02d}:{seconds:02d}"
+
+
+class CodeColumn:
+    """Повторяющиеся значения (приоритет, отметка выполнения, правило повтора): байт на запись.
+
+    Код - номер значения в таблице values_table, 0 - пустое значение. Выборка по значению
+    переводит байты в маску одним вызовом bytes.translate и отбирает id через compress.
+    """
+
+    def __init__(self):
+        self.values = bytearray()
+        self.values_table = [None]
+        # Тип входит в ключ, чтобы True и 1 получали разные коды
+        self.codes = {(type(None), None): 0}
+        self.odd = {}
+
+    def _code(self, row, value):
+        key = (type(value), value)
+        code = self.codes.get(key)
+        if code is None:
+            if len(self.values_table) == OVERFLOW_CODE:
+                self.odd[row] = value
+                return OVERFLOW_CODE
+            code = self.codes[key] = len(self.values_table)
+            self.values_table.append(value)
+        return code
+
+    def append(self, value):
+        self.values.append(self._code(len(self.values), value))
+
+    def set(self, row, value):
+        self.odd.pop(row, None)
+        self.values[row] = self._code(row, value)
+
+    def get(self, row):
+        code = self.values[row]
+        if code == OVERFLOW_CODE:
+            return self.odd[row]
+        return self.values_table[code]
+
+    def matching(self, value, ids):
+        """id строк, где значение равно value"""
+        code = self.codes.get((type(value), value))
+        if code is None:
+            return (ids[row] for row, item in self.odd.items() if item == value)
+        mask = self.values.translate(bytes(int(i == code) for i in range(256)))
+        return compress(ids, mask)
+
+
+# Вид столбца для каждого поля записей; остальные поля хранятся как есть
+FIELD_COLUMNS = {
+    "title": lambda: ObjectColumn(intern=True),
+    "priority": CodeColumn,
+    "completed": CodeColumn,
+    "repeat": CodeColumn,
+    "due_date": DateColumn,
+    "date": DateColumn,
+    "repeat_until": DateColumn,
+    "time": TimeColumn,
+    "duration": IntColumn,
+    "reminder": IntColumn,
+    "repeat_interval": IntColumn,
+    "created_at": TimestampColumn,
+    "updated_at": TimestampColumn,
+}
+
+
+class ColumnTable:
+    """Записи одного типа по столбцам: строка таблицы - запись, объект записи создается при чтении"""
+
+    def __init__(self, model, cache_size=RECORD_CACHE_SIZE):
+        self.model = model
+        names = stored_fields(model)
+        # id - первое поле записи, он хранится отдельным столбцом
+        self.ids = array("q")
+        self.columns = {name: FIELD_COLUMNS.get(name, ObjectColumn)() for name in names[1:]}
+        self.getters = [column.get for column in self.columns.values()]
+        self.free = []
+        # Готовые записи по номеру строки: повторное чтение не разбирает даты заново. Заполненный кэш
+        # не вытесняет записи, иначе полный перебор таблицы больше кэша не находил бы в нем ничего
+        self.cache = {}
+        self.cache_size = cache_size
+
+    def insert(self, record):
+        """Запись в свободную или новую строку; возвращает номер строки"""
+        if self.free:
+            row = self.free.pop()
+            self.update(row, record)
+            return row
+        self.ids.append(record.id)
+        for name, column in self.columns.items():
+            column.append(getattr(record, name))
+        return len(self.ids) - 1
+
+    def update(self, row, record):
+        """Замена значений строки"""
+        self.ids[row] = record.id
+        for name, column in self.columns.items():
+            column.set(row, getattr(record, name))
+        # Кэш заполняется чтением; измененная запись заменяется в нем, только если уже там была
+        if row in self.cache:
+            self.cache[row] = record
+
+    def remove(self, row):
+        """Освобождение строки; ее значения очищаются, чтобы не попадать в выборки"""
+        self.ids[row] = 0
+        for column in self.columns.values():
+            column.set(row, None)
+        self.cache.pop(row, None)
+        self.free.append(row)
+
+    def record(self, row):
+        """Объект записи из строки"""
+        record = self.cache.get(row)
+        if record is None:
+            record = self.model(self.ids[row], *[get(row) for get in self.getters])
+            if len(self.cache) < self.cache_size:
+                self.cache[row] = record
+        return record
+
+    def matching(self, name, value):
+        """id записей, у которых поле name равно value"""
+        return self.columns[name].matching(value, self.ids)
@@ -0,0 +1,694 @@
+from dataclasses import replace
+from datetime import datetime, timedelta
+from functools import lru_cache
+
+from dateindex import DateIndex
+from instrumentation import span
+from intervals import IntervalIndex
+from models import Event, Note, Task, now_timestamp, parse_date
+from recurrence import REPEATS, occurrences, occurs_on
+from repository import MemoryRepository, SQLiteRepository, event_order_key
+from search import SearchIndex
+from serializers import BINARY, JSON, detect_serializer
+from stats import StatsAggregator
+from storage import JournalStorage, KINDS, write_file
+from transfer import detect_format, read_csv, read_ics, write_csv, write_ics
+
+
+DB_FILE = "student_tasks.json"
+SQLITE_FILE = "student_tasks.db"
+
+PRIORITIES = ("Низкий", "Средний", "Высокий")
+TASK_FILTERS = ("Все", "Активные", "Завершенные", "Высокий")
+EVENT_FILTERS = ("Все", "Предстоящие", "Прошедшие")
+
+# Поля, по которым ищется текст записей каждого типа
+SEARCH_FIELDS = {
+    "tasks": ("title", "description"),
+    "events": ("title", "description"),
+    "notes": ("title", "content"),
+}
+
+# Массовый импорт добавляет записи порциями: id выдаются диапазоном, журнал пишется одним заданием
+IMPORT_CHUNK = 1000
+
+# Насколько вперед проверяются пересечения повторений новой серии, дней
+CONFLICT_HORIZON_DAYS = 180
+
+# Наибольшее число пересечений, о которых сообщается при сохранении события
+CONFLICT_LIMIT = 20
+
+# Значения отметки "выполнено" в файлах обмена
+TRUE_VALUES = ("1", "true", "yes", "да", "+", "x")
+
+
+class ValidationError(ValueError):
+    """Неверные данные записи; текст ошибки предназначен пользователю"""
+
+
+def today():
+    """Текущая дата в формате хранения"""
+    return datetime.now().strftime("%Y-%m-%d")
+
+
+def never():
+    """Условие отмены для выборок, которые никто не отменяет"""
+    return False
+
+
+@lru_cache(maxsize=4096)
+def check_format(value, pattern):
+    """Разбор значения по формату; повторяющиеся при массовом импорте даты разбираются один раз"""
+    datetime.strptime(value, pattern)
+
+
+def validate_task(title, due_date):
+    """Проверка полей задачи"""
+    if not title:
+        raise ValidationError("Название задачи обязательно!")
+    try:
+        if due_date:
+            check_format(due_date, "%Y-%m-%d")
+    except ValueError:
+        raise ValidationError("Неверный формат даты! Используйте ГГГГ-ММ-ДД") from None
+
+
+def validate_event(title, date, time, reminder, repeat="", repeat_interval="", repeat_until="", repeat_except="",
+                   duration=""):
+    """Проверка полей события, его длительности и правила повторения"""
+    if not title:
+        raise ValidationError("Название события обязательно!")
+    if repeat and repeat not in REPEATS:
+        raise ValidationError(f"Неизвестный повтор: {repeat}")
+    try:
+        check_format(date, "%Y-%m-%d")
+        if time:
+            check_format(time, "%H:%M")
+        if reminder:
+            int(reminder)
+        if duration and int(duration) < 1:
+            raise ValueError(duration)
+        if repeat_interval and int(repeat_interval) < 1:
+            raise ValueError(repeat_interval)
+        if repeat_until:
+            check_format(repeat_until, "%Y-%m-%d")
+        for day in split_dates(repeat_except):
+            check_format(day, "%Y-%m-%d")
+    except ValueError:
+        raise ValidationError("Неверный формат данных!") from None
+    if repeat and repeat_until and repeat_until < date:
+        raise ValidationError("Повторение не может закончиться раньше первого события!")
+    if duration and not time:
+        raise ValidationError("Длительность задается только для события со временем!")
+
+
+def split_dates(value):
+    """Даты из строки через запятую"""
+    return [part.strip() for part in value.split(",") if part.strip()] if value else []
+
+
+def repeat_fields(repeat, repeat_interval, repeat_until, repeat_except):
+    """Поля повторения проверенного события; у разового события все они пустые"""
+    if not repeat:
+        return {"repeat": None, "repeat_interval": None, "repeat_until": None, "repeat_except": None}
+    interval = int(repeat_interval) if repeat_interval else 1
+    return {
+        "repeat": repeat,
+        "repeat_interval": interval if interval > 1 else None,
+        "repeat_until": repeat_until or None,
+        "repeat_except": ",".join(sorted(set(split_dates(repeat_except)))) or None,
+    }
+
+
+def validate_note(title):
+    """Проверка полей заметки"""
+    if not title:
+        raise ValidationError("Название заметки обязательно!")
+
+
+def text(value):
+    """Строка поля из файла обмена; пустые значения дают пустую строку"""
+    return "" if value is None else str(value).strip()
+
+
+def parse_flag(value):
+    """Отметка "выполнено" из файла обмена: логическое значение или его запись строкой"""
+    if isinstance(value, bool):
+        return value
+    return text(value).lower() in TRUE_VALUES
+
+
+def build_record(kind, row, stamp=None):
+    """Проверенная запись без id из словаря файла обмена, по тем же правилам, что и в диалогах"""
+    title = text(row.get("title"))
+    created_at = text(row.get("created_at")) or stamp or now_timestamp()
+    updated_at = text(row.get("updated_at")) or None
+    if kind == "tasks":
+        due_date = text(row.get("due_date"))
+        priority = text(row.get("priority")) or "Средний"
+        validate_task(title, due_date)
+        if priority not in PRIORITIES:
+            raise ValidationError(f"Неизвестный приоритет: {priority}")
+        return Task(
+            title=title,
+            description=text(row.get("description")),
+            priority=priority,
+            due_date=due_date if due_date else None,
+            completed=parse_flag(row.get("completed")),
+            created_at=created_at,
+            updated_at=updated_at
+        )
+    if kind == "events":
+        date, time, reminder = text(row.get("date")), text(row.get("time")), text(row.get("reminder"))
+        duration = text(row.get("duration"))
+        repeat = [text(row.get(name)) for name in ("repeat", "repeat_interval", "repeat_until", "repeat_except")]
+        validate_event(title, date, time, reminder, *repeat, duration)
+        return Event(
+            title=title,
+            description=text(row.get("description")),
+            date=date,
+            time=time if time else None,
+            duration=int(duration) if duration else None,
+            reminder=int(reminder) if reminder else None,
+            created_at=created_at,
+            updated_at=updated_at,
+            **repeat_fields(*repeat)
+        )
+    validate_note(title)
+    return Note(
+        title=title,
+        content=row.get("content") or "",
+        created_at=created_at,
+        updated_at=updated_at or created_at
+    )
+
+
+def event_span(event):
+    """Промежуток [начало, конец) разового события со временем; без длительности событие занимает минуту"""
+    if event.repeat or not event.time or event.start is None:
+        return None
+    return event.start, event.start + timedelta(minutes=event.duration or 1)
+
+
+def occurrence_spans(event, start, stop):
+    """Промежутки повторений события со временем, пересекающие [start, stop)"""
+    if not event.time or event.start is None:
+        return
+    length = timedelta(minutes=event.duration or 1)
+    # Повторение, начавшееся до окна, может еще идти в его начале
+    for day in occurrences(event, (start - length).date(), stop.date() + timedelta(days=1)):
+        begin = datetime.combine(day, event.start.time())
+        if begin < stop and begin + length > start:
+            yield begin, begin + length
+
+
+def span_text(begin, end, event):
+    """Строка повторения события для сообщений о пересечениях"""
+    return f"{begin.strftime('%Y-%m-%d %H:%M')}–{end.strftime('%H:%M')} {event.title}"
+
+
+def task_row(task):
+    """Значения строки списка задач"""
+    return task.id, task.title, task.priority, task.due_display, task.status_display
+
+
+def event_row(event):
+    """Значения строки списка событий"""
+    return event.id, event.title, event.date, event.time_display, event.repeat_display, event.reminder_display
+
+
+def note_row(note):
+    """Значения строки списка заметок"""
+    return note.id, note.title, note.created_display, note.updated_display
+
+
+ROWS = {
+    "tasks": task_row,
+    "events": event_row,
+    "notes": note_row,
+}
+
+
+def open_repository(storage_mode="json", db_file=DB_FILE, sqlite_file=SQLITE_FILE, columnar=False):
+    """Хранилище данных: снимок с журналом (JSON или двоичный) или SQLite.
+
+    columnar включает хранение записей снимка в памяти по столбцам; на SQLite не влияет.
+    """
+    if storage_mode == "sqlite":
+        # При первом запуске данные переносятся из JSON файла
+        return SQLiteRepository(sqlite_file, db_file)
+    if storage_mode == "binary":
+        return MemoryRepository(JournalStorage(db_file, serializer=BINARY), columnar)
+    return MemoryRepository(JournalStorage(db_file), columnar)
+
+
+class StudentDayCore:
+    """Записи, проверка, выборки, поиск и статистика без интерфейса: основа окна и командной строки"""
+
+    def __init__(self, repo):
+        self.repo = repo
+
+        # Поисковые индексы строятся по запросу и затем обновляются при каждом изменении;
+        # до готовности индекса поиск проверяет текст записей
+        self.search_indexes = {kind: self.new_search_index(kind) for kind in KINDS}
+        self.indexed = set()
+        self.index_dirty = {kind: set() for kind in KINDS}
+
+        # Счетчики статистики тоже меняются на каждое изменение, без полного пересчета
+        self.stats = StatsAggregator(today())
+        # Дни задач (по сроку) и событий для календаря: месяц выбирается без разбора всех дат
+        self.date_indexes = {
+            "tasks": DateIndex(lambda task: task.due_date),
+            "events": DateIndex(lambda event: None if event.repeat else event.date),
+        }
+        # Повторяющиеся события хранятся правилом: их дни вычисляются только для показываемого окна
+        self.series = {}
+        # Промежутки разовых событий со временем для поиска пересечений; строятся при первом запросе
+        self.intervals = None
+        repo.subscribe(self.on_record_change)
+
+    def load(self, background=True):
+        """Загрузка записей: в фоне для окна, сразу для командной строки"""
+        self.repo.load(background)
+        if not background:
+            for kind in KINDS:
+                self.install(kind)
+
+    def install(self, kind):
+        """Подсчет статистики по загруженным записям типа; возвращает записи"""
+        records = self.repo.all(kind)
+        with span(f"stats.{kind}"):
+            self.stats.build(kind, records)
+        if kind in self.date_indexes:
+            with span(f"dates.{kind}"):
+                self.date_indexes[kind].build(records)
+        if kind == "events":
+            self.series = {event.id: event for event in records if event.repeat}
+        return records
+
+    def reinstall(self, kind):
+        """Повторный подсчет, когда неизвестно, какие записи изменились"""
+        self.stats.clear(kind)
+        if kind in self.date_indexes:
+            self.date_indexes[kind].clear()
+        if kind == "events":
+            self.series = {}
+            self.intervals = None
+        self.indexed.discard(kind)
+        self.index_dirty[kind].clear()
+        return self.install(kind)
+
+    def on_record_change(self, kind, op, payload):
+        """Обновление поисковых индексов, статистики и дней календаря после изменения записи"""
+        if op == "reload":
+            return
+        index = self.search_indexes[kind] if kind in self.indexed else None
+        dates = self.date_indexes.get(kind)
+        if op == "put":
+            if index is not None:
+                index.put(payload)
+            else:
+                self.index_dirty[kind].add(payload.id)
+            self.stats.put(kind, payload)
+            if dates is not None:
+                dates.put(payload)
+            if kind == "events":
+                if payload.repeat:
+                    self.series[payload.id] = payload
+                else:
+                    self.series.pop(payload.id, None)
+                if self.intervals is not None:
+                    self.intervals.put(payload)
+        else:
+            if index is not None:
+                index.remove(payload)
+            else:
+                self.index_dirty[kind].add(payload)
+            self.stats.remove(kind, payload)
+            if dates is not None:
+                dates.remove(payload)
+            if kind == "events":
+                self.series.pop(payload, None)
+                if self.intervals is not None:
+                    self.intervals.remove(payload)
+
+    # Изменение записей
+    def add_task(self, title, description="", priority="Средний", due_date=""):
+        """Проверка и добавление задачи"""
+        validate_task(title, due_date)
+        return self.repo.add("tasks", Task(
+            title=title,
+            description=description,
+            priority=priority,
+            due_date=due_date if due_date else None,
+            completed=False,
+            created_at=now_timestamp()
+        ))
+
+    def update_task(self, task, title, description, priority, due_date, completed):
+        """Проверка и сохранение изменений задачи"""
+        validate_task(title, due_date)
+        task = replace(
+            task,
+            title=title,
+            description=description,
+            priority=priority,
+            due_date=due_date if due_date else None,
+            completed=completed,
+            updated_at=now_timestamp()
+        )
+        self.repo.update("tasks", task)
+        return task
+
+    def existing(self, kind, record_ids):
+        """Записи по id без пропавших, например удаленных другим процессом"""
+        records = (self.repo.get(kind, record_id) for record_id in record_ids)
+        return [record for record in records if record is not None]
+
+    def complete_tasks(self, task_ids):
+        """Отметка выбранных задач выполненными одной транзакцией; возвращает измененные задачи"""
+        now = now_timestamp()
+        with self.repo.transaction():
+            tasks = [replace(task, completed=True, updated_at=now)
+                     for task in self.existing("tasks", task_ids) if not task.completed]
+            self.repo.update_many("tasks", tasks)
+        return tasks
+
+    def set_priority(self, task_ids, priority):
+        """Смена приоритета выбранных задач одной транзакцией"""
+        if priority not in PRIORITIES:
+            raise ValidationError(f"Неизвестный приоритет: {priority}")
+        now = now_timestamp()
+        with self.repo.transaction():
+            tasks = [replace(task, priority=priority, updated_at=now)
+                     for task in self.existing("tasks", task_ids) if task.priority != priority]
+            self.repo.update_many("tasks", tasks)
+        return tasks
+
+    def reschedule(self, kind, record_ids, day):
+        """Перенос срока выбранных задач или даты событий одной транзакцией.
+
+        Задачи без day остаются без срока. Все записи проверяются до первого изменения:
+        если перенос нарушает правило повторения хотя бы одной серии, не меняется ничего.
+        """
+        now = now_timestamp()
+        with self.repo.transaction():
+            records = []
+            for record in self.existing(kind, record_ids):
+                if kind == "tasks":
+                    validate_task(record.title, day)
+                    records.append(replace(record, due_date=day or None, updated_at=now))
+                else:
+                    validate_event(record.title, day, record.time, record.reminder, record.repeat,
+                                   record.repeat_interval, record.repeat_until, record.repeat_except, record.duration)
+                    records.append(replace(record, date=day, updated_at=now))
+            self.repo.update_many(kind, records)
+        return records
+
+    def new_event(self, title, description, date, time="", reminder="", repeat="", repeat_interval="",
+                  repeat_until="", repeat_except="", duration=""):
+        """Проверенное событие без id; до сохранения его можно проверить на пересечения"""
+        validate_event(title, date, time, reminder, repeat, repeat_interval, repeat_until, repeat_except, duration)
+        return Event(
+            title=title,
+            description=description,
+            date=date,
+            time=time if time else None,
+            duration=int(duration) if duration else None,
+            reminder=int(reminder) if reminder else None,
+            created_at=now_timestamp(),
+            **repeat_fields(repeat, repeat_interval, repeat_until, repeat_except)
+        )
+
+    def edited_event(self, event, title, description, date, time, reminder, repeat="", repeat_interval="",
+                     repeat_until="", repeat_except="", duration=""):
+        """Проверенная, еще не сохраненная копия события с изменениями"""
+        validate_event(title, date, time, reminder, repeat, repeat_interval, repeat_until, repeat_except, duration)
+        return replace(
+            event,
+            title=title,
+            description=description,
+            date=date,
+            time=time if time else None,
+            duration=int(duration) if duration else None,
+            reminder=int(reminder) if reminder else None,
+            updated_at=now_timestamp(),
+            **repeat_fields(repeat, repeat_interval, repeat_until, repeat_except)
+        )
+
+    def save_event(self, event):
+        """Сохранение события из new_event (добавление) или edited_event (изменение)"""
+        if event.id is None:
+            return self.repo.add("events", event)
+        self.repo.update("events", event)
+        return event
+
+    def add_note(self, title, content=""):
+        """Проверка и добавление заметки"""
+        validate_note(title)
+        return self.repo.add("notes", Note(
+            title=title,
+            content=content,
+            created_at=now_timestamp(),
+            updated_at=now_timestamp()
+        ))
+
+    def update_note(self, note, title, content):
+        """Проверка и сохранение изменений заметки"""
+        validate_note(title)
+        # Неизмененный текст не передается и не записывается повторно
+        changes = {"title": title, "updated_at": now_timestamp()}
+        if content != self.repo.content(note):
+            changes["content"] = content
+        note = replace(note, **changes)
+        self.repo.update("notes", note)
+        return note
+
+    def delete(self, kind, record_id):
+        """Удаление записи по id"""
+        self.repo.delete(kind, record_id)
+
+    def delete_many(self, kind, record_ids):
+        """Удаление выбранных записей одной транзакцией; возвращает число удаленных"""
+        with self.repo.transaction():
+            record_ids = [record.id for record in self.existing(kind, record_ids)]
+            self.repo.delete_many(kind, record_ids)
+        return len(record_ids)
+
+    def import_rows(self, items, on_error=None):
+        """Потоковый импорт пар (тип, словарь) одной транзакцией; возвращает число добавленных по типам.
+
+        Без on_error первая неверная запись прерывает импорт, иначе она передается в
+        on_error(номер, ошибка) и пропускается. В памяти держится не больше порции записей.
+        """
+        counts = {kind: 0 for kind in KINDS}
+        chunks = {kind: [] for kind in KINDS}
+        # Записи без даты создания получают время начала импорта
+        stamp = now_timestamp()
+        with span("import"), self.repo.transaction():
+            for number, (kind, row) in enumerate(items, 1):
+                try:
+                    record = build_record(kind, row, stamp)
+                except ValidationError as e:
+                    if on_error is None:
+                        raise ValidationError(f"Запись {number}: {e}") from None
+                    on_error(number, e)
+                    continue
+                chunk = chunks[kind]
+                chunk.append(record)
+                if len(chunk) >= IMPORT_CHUNK:
+                    counts[kind] += len(self.repo.add_many(kind, chunk))
+                    chunk.clear()
+            for kind, chunk in chunks.items():
+                counts[kind] += len(self.repo.add_many(kind, chunk))
+        return counts
+
+    def import_file(self, path, kind=None, on_error=None):
+        """Импорт из CSV (записи одного типа), iCalendar или выгрузки JSON/двоичной"""
+        file_format = detect_format(path)
+        if file_format == "csv":
+            if kind is None:
+                raise ValidationError("Для CSV нужно указать тип записей")
+            items = read_csv(path, kind)
+        elif file_format == "ics":
+            items = read_ics(path)
+        else:
+            items = ((read_kind, row) for read_kind, rows in detect_serializer(path).stream(path)
+                     if read_kind in KINDS for row in rows)
+        return self.import_rows(items, on_error)
+
+    def export(self, path, serializer=JSON):
+        """Выгрузка всех записей в файл; тексты заметок записываются в сами заметки"""
+        with self.repo.lock:
+            snapshot = {"next_ids": self.repo.next_ids()}
+            for kind in KINDS:
+                snapshot[kind] = [self.record_dict(kind, record) for record in self.repo.all(kind)]
+        write_file(path, snapshot, serializer)
+
+    def export_csv(self, path, kind):
+        """Выгрузка записей одного типа в CSV; строки пишутся по одной"""
+        with self.repo.lock:
+            records = self.repo.all(kind)
+        write_csv(path, kind, (self.record_dict(kind, record) for record in records))
+
+    def export_ics(self, path, kinds=("tasks", "events")):
+        """Выгрузка задач и событий (и при желании заметок) в iCalendar"""
+        with self.repo.lock:
+            records = {kind: self.repo.all(kind) for kind in kinds}
+        write_ics(path, ((kind, self.record_dict(kind, record)) for kind in kinds for record in records[kind]))
+
+    def record_dict(self, kind, record):
+        """Словарь записи для выгрузки: текст заметки вместо ссылки на него"""
+        row = record.to_dict()
+        if kind == "notes":
+            row.pop("content_hash", None)
+            row["content"] = self.repo.content(record)
+        return row
+
+    # Выборки
+    def new_search_index(self, kind):
+        """Пустой поисковый индекс для записей типа; тексты заметок в нем не хранятся и читаются при проверке"""
+        loader = (lambda record_id: self.repo.get(kind, record_id)) if kind == "notes" else None
+        return SearchIndex(SEARCH_FIELDS[kind], self.repo.value, loader)
+
+    def install_search_index(self, kind, index):
+        """Подключение построенного индекса с учетом изменений, сделанных во время построения"""
+        for record_id in self.index_dirty[kind]:
+            record = self.repo.get(kind, record_id)
+            if record is None:
+                index.remove(record_id)
+            else:
+                index.put(record)
+        self.index_dirty[kind].clear()
+        self.search_indexes[kind] = index
+        self.indexed.add(kind)
+
+    def search_filter(self, kind, search_text):
+        """Условие поиска: по индексу, а пока его нет, по тексту самих записей"""
+        if not search_text:
+            return None
+        index = self.search_indexes[kind]
+        if kind in self.indexed:
+            matches = index.search(search_text)
+            return lambda record: record.id in matches
+        return lambda record: index.match(record, search_text)
+
+    def find(self, kind, filter_type="Все", search_text="", cancelled=never):
+        """Записи для списка по фильтру и поиску (может выполняться в фоновом потоке)"""
+        found = []
+        with span(f"query.{kind}"), self.repo.lock:
+            accept = self.search_filter(kind, search_text)
+            if kind == "tasks":
+                records = self.repo.query_tasks(filter_type)
+            elif kind == "events":
+                day = today()
+                records = self.repo.query_events(filter_type, day)
+                if filter_type != "Все" and self.series:
+                    records = self.with_series(records, filter_type, day)
+            else:
+                records = self.repo.query_notes()
+
+            for record in records:
+                if cancelled():
+                    return None
+
+                # Применение поиска
+                if accept is not None and not accept(record):
+                    continue
+                found.append(record)
+        return found
+
+    def with_series(self, records, filter_type, day):
+        """Поправка выборки по дате начала на серии: серия предстоит, пока не прошло ее последнее повторение"""
+        upcoming = filter_type == "Предстоящие"
+        records = [record for record in records if not record.repeat or (record.end >= day) == upcoming]
+        if upcoming:
+            # Начавшиеся раньше сегодняшнего дня серии идут перед остальными, как и их даты начала
+            ongoing = [event for event in self.series.values() if event.date < day <= event.end]
+            records = sorted(ongoing, key=event_order_key) + records
+        return records
+
+    def interval_index(self):
+        """Индекс промежутков событий: строится при первом обращении, затем обновляется при изменениях"""
+        if self.intervals is None:
+            intervals = IntervalIndex(event_span)
+            with span("intervals.events"):
+                intervals.build(self.repo.all("events"))
+            self.intervals = intervals
+        return self.intervals
+
+    def events_between(self, start, stop, ignore_id=None):
+        """События со временем, идущие в промежутке [start, stop), вместе с повторениями серий.
+
+        Возвращает тройки (начало, конец, событие) по времени начала. Разовые события берутся
+        из индекса промежутков, у серий вычисляются только повторения около окна.
+        """
+        found = []
+        with span("query.between"), self.repo.lock:
+            for begin, end, event_id in self.interval_index().overlapping(start, stop):
+                event = self.repo.get("events", event_id) if event_id != ignore_id else None
+                if event is not None:
+                    found.append((begin, end, event))
+            series = [event for event in self.series.values() if event.id != ignore_id]
+        for event in series:
+            found.extend((begin, end, event) for begin, end in occurrence_spans(event, start, stop))
+        found.sort(key=lambda item: (item[0], item[2].id))
+        return found
+
+    def conflicts(self, event):
+        """Пересечения события по времени с другими событиями: тройки (начало, конец, событие)"""
+        if not event.time or event.start is None:
+            return []
+        if event.repeat:
+            # У серии проверяются повторения ближайших месяцев, а не вся, возможно бесконечная, серия
+            start = max(event.start, datetime.combine(datetime.now().date(), event.start.time()))
+            spans = occurrence_spans(event, start, start + timedelta(days=CONFLICT_HORIZON_DAYS))
+        else:
+            spans = [event_span(event)]
+
+        found = []
+        seen = set()
+        with span("conflicts"):
+            for begin, end in spans:
+                for item in self.events_between(begin, end, ignore_id=event.id):
+                    key = (item[2].id, item[0])
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                    found.append(item)
+                    if len(found) >= CONFLICT_LIMIT:
+                        return found
+        return found
+
+    def busy_days(self, start, stop):
+        """Число событий и задач по дням от start включительно до stop; дни без записей не входят"""
+        days = {}
+        with span("query.calendar"):
+            for position, kind in enumerate(("events", "tasks")):
+                for day, ids in self.date_indexes[kind].range(start, stop):
+                    days.setdefault(day, [0, 0])[position] += len(ids)
+            # Повторения серий вычисляются только для запрошенного окна
+            window = parse_date(start), parse_date(stop)
+            with self.repo.lock:
+                series = list(self.series.values())
+            for event in series:
+                for day in occurrences(event, *window):
+                    days.setdefault(day.isoformat(), [0, 0])[0] += 1
+        return days
+
+    def day_items(self, day):
+        """Пары (тип, запись) одного дня: события и повторения серий по времени, затем задачи со сроком"""
+        with self.repo.lock:
+            events = [self.repo.get("events", record_id) for record_id in self.date_indexes["events"].day(day)]
+            tasks = [self.repo.get("tasks", record_id) for record_id in self.date_indexes["tasks"].day(day)]
+            series = list(self.series.values())
+        moment = parse_date(day)
+        events += [event for event in series if occurs_on(event, moment)]
+        events = sorted((event for event in events if event is not None),
+                        key=lambda event: (event.time or "", event.id))
+        tasks = sorted((task for task in tasks if task is not None), key=lambda task: (task.completed, task.id))
+        return [("events", event) for event in events] + [("tasks", task) for task in tasks]
+
+    def close(self):
+        """Завершение работы с хранилищем"""
+        self.repo.close()
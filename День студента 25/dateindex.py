@@ -0,0 +1,62 @@
+from bisect import bisect_left, insort
+
+
+class DateIndex:
+    """Записи по дням: дата ГГГГ-ММ-ДД -> id записей, обновляется при каждом изменении"""
+
+    def __init__(self, key):
+        # key возвращает дату записи строкой или None для записи без даты
+        self.key = key
+        self.days = {}
+        # Дни с записями по возрастанию: выборка месяца находится двоичным поиском
+        self.order = []
+        self.record_days = {}
+
+    def build(self, records):
+        """Учет всех записей типа за один проход"""
+        for record in records:
+            self.put(record)
+
+    def put(self, record):
+        """Учет добавленной или измененной записи; запись без даты из индекса убирается"""
+        day = self.key(record) or None
+        old = self.record_days.get(record.id)
+        if old == day:
+            return
+        if old is not None:
+            self.remove(record.id)
+        if day is None:
+            return
+        self.record_days[record.id] = day
+        ids = self.days.get(day)
+        if ids is None:
+            ids = self.days[day] = set()
+            insort(self.order, day)
+        ids.add(record.id)
+
+    def remove(self, record_id):
+        """Исключение удаленной записи; опустевший день удаляется"""
+        day = self.record_days.pop(record_id, None)
+        if day is None:
+            return
+        ids = self.days[day]
+        ids.discard(record_id)
+        if not ids:
+            del self.days[day]
+            del self.order[bisect_left(self.order, day)]
+
+    def clear(self):
+        self.days = {}
+        self.order = []
+        self.record_days = {}
+
+    def day(self, day):
+        """Id записей одного дня"""
+        return set(self.days.get(day, ()))
+
+    def range(self, start, stop):
+        """Пары (день, id записей) для дней с записями от start включительно до stop"""
+        first = bisect_left(self.order, start)
+        last = bisect_left(self.order, stop, first)
+        for day in self.order[first:last]:
+            yield day, self.days[day]
@@ -0,0 +1,134 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager, nullcontext
+
+
+# Сколько последних замеров хранится для файла трассы
+TRACE_LIMIT = 50000
+
+NO_SPAN = nullcontext()
+
+
+class Metric:
+    """Накопленные замеры одного участка: число вызовов, суммарное и наибольшее время"""
+
+    __slots__ = ("calls", "total", "max", "last")
+
+    def __init__(self):
+        self.calls = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+
+    def add(self, duration):
+        self.calls += 1
+        self.total += duration
+        self.last = duration
+        if duration > self.max:
+            self.max = duration
+
+
+class Recorder:
+    """Замеры горячих участков по запросу; выключенный почти ничего не стоит"""
+
+    def __init__(self):
+        self.enabled = False
+        self.metrics = {}
+        self.trace = deque(maxlen=TRACE_LIMIT)
+        self.started = time.perf_counter()
+        self.profiler = None
+        self._lock = threading.Lock()
+
+    def enable(self, enabled=True):
+        self.enabled = enabled
+
+    def span(self, name):
+        """Контекст замера участка; при выключенных замерах пустой"""
+        if not self.enabled:
+            return NO_SPAN
+        return self._span(name)
+
+    @contextmanager
+    def _span(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start, start)
+
+    def record(self, name, duration, start=None):
+        """Учет готового замера, например задержки цикла Tk"""
+        if not self.enabled:
+            return
+        if start is None:
+            start = time.perf_counter() - duration
+        with self._lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = Metric()
+            metric.add(duration)
+            self.trace.append((name, start, duration, threading.get_ident()))
+
+    def snapshot(self):
+        """Копия счетчиков для показа: имя -> (вызовы, всего, наибольшее, последнее), с"""
+        with self._lock:
+            return {name: (m.calls, m.total, m.max, m.last) for name, m in self.metrics.items()}
+
+    def reset(self):
+        with self._lock:
+            self.metrics = {}
+            self.trace.clear()
+
+    def export_trace(self, path):
+        """Запись трассы в формате Trace Event (открывается в chrome://tracing и Perfetto)"""
+        with self._lock:
+            spans = list(self.trace)
+        pid = os.getpid()
+        events = [{
+            "name": name,
+            "ph": "X",
+            "ts": round((start - self.started) * 1e6, 1),
+            "dur": round(duration * 1e6, 1),
+            "pid": pid,
+            "tid": thread,
+        } for name, start, duration, thread in spans]
+        tmp_file = path + ".tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f, ensure_ascii=False)
+        os.replace(tmp_file, path)
+        return len(events)
+
+    # Профилирование cProfile, включаемое во время работы
+    @property
+    def profiling(self):
+        return self.profiler is not None
+
+    def start_profile(self):
+        """Запуск cProfile в потоке интерфейса"""
+        if self.profiler is None:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+    def stop_profile(self, path=None, limit=25):
+        """Остановка cProfile: статистика пишется в path (для snakeviz и pstats), возвращается ее начало"""
+        profiler = self.profiler
+        if profiler is None:
+            return ""
+        self.profiler = None
+        profiler.disable()
+        if path:
+            profiler.dump_stats(path)
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(limit)
+        return out.getvalue()
+
+
+# Один набор замеров на процесс, как у модуля logging: его пишут хранилище, ядро и окно
+recorder = Recorder()
+span = recorder.span
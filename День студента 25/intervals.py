@@ -0,0 +1,151 @@
+import random
+
+
+class Node:
+    """Узел декартова дерева: ключ (начало, id), конец промежутка и наибольший конец в поддереве"""
+
+    __slots__ = ("key", "end", "priority", "left", "right", "max_end")
+
+    def __init__(self, key, end):
+        self.key = key
+        self.end = end
+        self.priority = random.random()
+        self.left = None
+        self.right = None
+        self.max_end = end
+
+
+def update(node):
+    """Пересчет наибольшего конца поддерева после смены потомков"""
+    max_end = node.end
+    if node.left is not None and node.left.max_end > max_end:
+        max_end = node.left.max_end
+    if node.right is not None and node.right.max_end > max_end:
+        max_end = node.right.max_end
+    node.max_end = max_end
+
+
+def split(node, key):
+    """Разделение дерева на ключи меньше key и остальные"""
+    if node is None:
+        return None, None
+    if node.key < key:
+        left, right = split(node.right, key)
+        node.right = left
+        update(node)
+        return node, right
+    left, right = split(node.left, key)
+    node.left = right
+    update(node)
+    return left, node
+
+
+def merge(left, right):
+    """Слияние деревьев, все ключи left меньше ключей right"""
+    if left is None:
+        return right
+    if right is None:
+        return left
+    if left.priority > right.priority:
+        left.right = merge(left.right, right)
+        update(left)
+        return left
+    right.left = merge(left, right.left)
+    update(right)
+    return right
+
+
+def drop_first(node):
+    """Дерево без узла с наименьшим ключом"""
+    if node.left is None:
+        return node.right
+    node.left = drop_first(node.left)
+    update(node)
+    return node
+
+
+def fix_max_end(node):
+    """Расчет наибольших концов всего дерева после построения"""
+    if node is None:
+        return
+    fix_max_end(node.left)
+    fix_max_end(node.right)
+    update(node)
+
+
+class IntervalIndex:
+    """Промежутки записей [начало, конец) в декартовом дереве по началу с наибольшим концом поддерева.
+
+    Добавление и удаление стоят O(log n) в среднем. Выборка пересечений с окном спускается
+    только в поддеревья, где есть начало раньше конца окна и конец позже его начала, поэтому
+    проходит O(log n) узлов на каждый найденный промежуток, а не все записи.
+    """
+
+    def __init__(self, key):
+        # key возвращает (начало, конец) записи или None, если у записи нет промежутка
+        self.key = key
+        self.root = None
+        self.spans = {}
+
+    def build(self, records):
+        """Построение по всем записям за O(n log n) на сортировку и O(n) на само дерево"""
+        nodes = []
+        for record in records:
+            span = self.key(record)
+            if span is not None:
+                self.spans[record.id] = span
+                nodes.append(Node((span[0], record.id), span[1]))
+        nodes.sort(key=lambda node: node.key)
+
+        # Декартово дерево по отсортированным ключам строится стеком правой ветви
+        stack = []
+        for node in nodes:
+            last = None
+            while stack and stack[-1].priority < node.priority:
+                last = stack.pop()
+            node.left = last
+            if stack:
+                stack[-1].right = node
+            stack.append(node)
+        self.root = stack[0] if stack else None
+        fix_max_end(self.root)
+
+    def put(self, record):
+        """Учет добавленной или измененной записи"""
+        span = self.key(record)
+        if self.spans.get(record.id) == span:
+            return
+        self.remove(record.id)
+        if span is None:
+            return
+        self.spans[record.id] = span
+        left, right = split(self.root, (span[0], record.id))
+        self.root = merge(merge(left, Node((span[0], record.id), span[1])), right)
+
+    def remove(self, record_id):
+        """Исключение записи"""
+        span = self.spans.pop(record_id, None)
+        if span is None:
+            return
+        left, right = split(self.root, (span[0], record_id))
+        self.root = merge(left, drop_first(right))
+
+    def overlapping(self, start, stop):
+        """Тройки (начало, конец, id) промежутков, пересекающих [start, stop), по возрастанию начала"""
+        found = []
+
+        def visit(node):
+            if node is None or node.max_end <= start:
+                return
+            visit(node.left)
+            if node.key[0] >= stop:
+                return
+            if node.end > start:
+                found.append((node.key[0], node.end, node.key[1]))
+            visit(node.right)
+
+        visit(self.root)
+        return found
+
+    def __len__(self):
+        return len(self.spans)
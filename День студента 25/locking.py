@@ -0,0 +1,80 @@
+import json
+import os
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    # На Windows блокировок нет: база остается однопроцессной
+    fcntl = None
+
+
+class FileLock:
+    """Рекомендательная блокировка базы между процессами и общие для них счетчики"""
+
+    def __init__(self, path):
+        # Блокируется отдельный файл: снимок и журнал заменяются целиком и меняют inode
+        self.path = path
+        # У каждого потока свой дескриптор, поэтому потоки одного процесса тоже исключают друг друга
+        self._local = threading.local()
+        self._fds = []
+
+    @contextmanager
+    def shared(self):
+        """Блокировка для чтения: другие процессы не пишут, но тоже могут читать"""
+        with self._locked(False) as state:
+            yield state
+
+    @contextmanager
+    def exclusive(self):
+        """Блокировка для записи"""
+        with self._locked(True) as state:
+            yield state
+
+    @contextmanager
+    def _locked(self, exclusive):
+        fd = getattr(self._local, "fd", None)
+        if fd is None:
+            # O_BINARY есть только на Windows: без него os.open открывает файл в текстовом режиме
+            flags = os.O_RDWR | os.O_CREAT | getattr(os, "O_BINARY", 0)
+            fd = self._local.fd = os.open(self.path, flags, 0o644)
+            self._fds.append(fd)
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield LockState(fd)
+        finally:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+
+    def close(self):
+        """Закрытие дескрипторов всех потоков"""
+        for fd in self._fds:
+            os.close(fd)
+        self._fds = []
+        self._local = threading.local()
+
+
+class LockState:
+    """Содержимое файла блокировки: версия последнего снимка или выданные id"""
+
+    def __init__(self, fd):
+        self.fd = fd
+        # lseek с read/write вместо pread/pwrite: их нет на Windows
+        os.lseek(fd, 0, os.SEEK_SET)
+        try:
+            data = json.loads(os.read(fd, 65536) or b"{}")
+        except ValueError:
+            data = {}
+        self.version = data.get("version", 0)
+        self.next_ids = data.get("next_ids", {})
+
+    def save(self, durable=False):
+        """Запись счетчиков; версия снимка сохраняется с fsync"""
+        data = json.dumps({"version": self.version, "next_ids": self.next_ids}).encode()
+        os.lseek(self.fd, 0, os.SEEK_SET)
+        os.write(self.fd, data)
+        os.ftruncate(self.fd, len(data))
+        if durable:
+            os.fsync(self.fd)
@@ -0,0 +1,199 @@
+from dataclasses import dataclass, field, fields, replace
+from datetime import date, datetime, timedelta
+from functools import cache
+
+from recurrence import parse_skipped, repeat_display, series_end
+
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+DISPLAY_FORMAT = "%d.%m.%Y %H:%M"
+
+
+def now_timestamp():
+    """Текущее время в формате, в котором оно хранится в базе"""
+    return datetime.now().strftime(TIMESTAMP_FORMAT)
+
+
+def parse_date(value):
+    """Разбор даты ГГГГ-ММ-ДД; для пустого или неверного значения None"""
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        return None
+
+
+def parse_datetime(value):
+    """Разбор отметки времени ГГГГ-ММ-ДД ЧЧ:ММ:СС; для пустого или неверного значения None"""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return None
+
+
+def format_datetime(value):
+    """Отметка времени в виде для списков"""
+    return value.strftime(DISPLAY_FORMAT) if value else ""
+
+
+@cache
+def stored_fields(cls):
+    """Имена полей записи, которые хранятся в базе"""
+    return tuple(f.name for f in fields(cls) if f.init)
+
+
+class Record:
+    """Общая часть записей: преобразование в словари формата JSON и обратно"""
+
+    __slots__ = ()
+
+    # Поля, которые не пишутся в JSON, пока не заданы
+    optional_fields = ("updated_at",)
+
+    @classmethod
+    def from_dict(cls, data):
+        """Запись из словаря в формате JSON файла"""
+        try:
+            return cls(**data)
+        except TypeError:
+            # В словаре есть поля, которых нет у записи
+            return cls(**{name: data[name] for name in stored_fields(cls) if name in data})
+
+    def to_dict(self):
+        """Словарь в формате JSON файла"""
+        data = {}
+        for name in stored_fields(type(self)):
+            value = getattr(self, name)
+            if value is None and name in self.optional_fields:
+                continue
+            data[name] = value
+        return data
+
+    def with_id(self, record_id):
+        """Копия записи с назначенным id"""
+        return replace(self, id=record_id)
+
+
+@dataclass(frozen=True, slots=True)
+class Task(Record):
+    """Задача; даты разбираются один раз при создании записи"""
+
+    id: int = None
+    title: str = ""
+    description: str = ""
+    priority: str = "Средний"
+    due_date: str = None
+    completed: bool = False
+    created_at: str = None
+    updated_at: str = None
+
+    due: date = field(init=False, repr=False, compare=False)
+    due_display: str = field(init=False, repr=False, compare=False)
+    status_display: str = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        object.__setattr__(self, "completed", bool(self.completed))
+        object.__setattr__(self, "due", parse_date(self.due_date))
+        object.__setattr__(self, "due_display", self.due_date if self.due_date else "Нет срока")
+        object.__setattr__(self, "status_display", "Завершено" if self.completed else "Активно")
+
+
+@dataclass(frozen=True, slots=True)
+class Event(Record):
+    """Событие; дата и время разбираются один раз при создании записи.
+
+    Повторяющееся событие хранится одной записью: date - первое повторение, repeat - правило,
+    repeat_until - последний возможный день, repeat_except - исключенные даты через запятую.
+    duration - длительность события со временем в минутах.
+    """
+
+    # Поля повторения и длительность не пишутся, пока не заданы: файлы прежних версий не меняются
+    optional_fields = ("updated_at", "duration", "repeat", "repeat_interval", "repeat_until", "repeat_except")
+
+    id: int = None
+    title: str = ""
+    description: str = ""
+    date: str = None
+    time: str = None
+    duration: int = None
+    reminder: int = None
+    repeat: str = None
+    repeat_interval: int = None
+    repeat_until: str = None
+    repeat_except: str = None
+    created_at: str = None
+    updated_at: str = None
+
+    day: date = field(init=False, repr=False, compare=False)
+    start: datetime = field(init=False, repr=False, compare=False)
+    until: date = field(init=False, repr=False, compare=False)
+    skipped: frozenset = field(init=False, repr=False, compare=False)
+    end: str = field(init=False, repr=False, compare=False)
+    time_display: str = field(init=False, repr=False, compare=False)
+    reminder_display: str = field(init=False, repr=False, compare=False)
+    repeat_display: str = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        day = parse_date(self.date)
+        start = None
+        if day is not None:
+            start = datetime.combine(day, datetime.min.time())
+            if self.time:
+                try:
+                    start = datetime.fromisoformat(f"{self.date} {self.time}")
+                except ValueError:
+                    # Время вида 9:05 тоже проходит проверку диалога
+                    try:
+                        start = datetime.combine(day, datetime.strptime(self.time, "%H:%M").time())
+                    except ValueError:
+                        pass
+        object.__setattr__(self, "day", day)
+        object.__setattr__(self, "start", start)
+        object.__setattr__(self, "until", parse_date(self.repeat_until) if self.repeat else None)
+        object.__setattr__(self, "skipped", parse_skipped(self.repeat_except) if self.repeat else frozenset())
+        # Последний день серии нужен статистике и фильтрам предстоящих и прошедших событий
+        object.__setattr__(self, "end", series_end(self))
+        time_display = self.time if self.time else "Весь день"
+        if self.time and self.duration and start is not None:
+            time_display += f"–{(start + timedelta(minutes=self.duration)).strftime('%H:%M')}"
+        object.__setattr__(self, "time_display", time_display)
+        object.__setattr__(self, "reminder_display", f"{self.reminder} мин" if self.reminder else "Нет")
+        object.__setattr__(self, "repeat_display", repeat_display(self))
+
+
+@dataclass(frozen=True, slots=True)
+class Note(Record):
+    """Заметка; отметки времени разбираются и форматируются один раз"""
+
+    # Текст хранится либо в самой записи, либо в хранилище блоков по хешу
+    optional_fields = ("content", "content_hash")
+
+    id: int = None
+    title: str = ""
+    content: str = None
+    content_hash: str = None
+    created_at: str = None
+    updated_at: str = None
+
+    created: datetime = field(init=False, repr=False, compare=False)
+    updated: datetime = field(init=False, repr=False, compare=False)
+    created_display: str = field(init=False, repr=False, compare=False)
+    updated_display: str = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        created = parse_datetime(self.created_at)
+        updated = parse_datetime(self.updated_at)
+        object.__setattr__(self, "created", created)
+        object.__setattr__(self, "updated", updated)
+        object.__setattr__(self, "created_display", format_datetime(created))
+        object.__setattr__(self, "updated_display", format_datetime(updated))
+
+
+MODELS = {
+    "tasks": Task,
+    "events": Event,
+    "notes": Note,
+}
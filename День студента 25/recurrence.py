@@ -0,0 +1,127 @@
+from calendar import monthrange
+from datetime import date, timedelta
+
+
+REPEATS = ("Ежедневно", "Еженедельно", "Ежемесячно")
+
+# Шаг серии в днях; ежемесячная серия считается по месяцам
+STEP_DAYS = {"Ежедневно": 1, "Еженедельно": 7}
+
+INTERVAL_DISPLAY = {
+    "Ежедневно": "Каждые {} дн.",
+    "Еженедельно": "Каждые {} нед.",
+    "Ежемесячно": "Каждые {} мес.",
+}
+
+# Конец бессрочной серии: строки дат сравниваются как строки
+OPEN_END = "9999-12-31"
+
+
+def parse_skipped(value):
+    """Исключенные даты серии из строки "ГГГГ-ММ-ДД,ГГГГ-ММ-ДД"; неверные даты пропускаются"""
+    if not value:
+        return frozenset()
+    days = set()
+    for part in value.split(","):
+        try:
+            days.add(date.fromisoformat(part.strip()))
+        except ValueError:
+            pass
+    return frozenset(days)
+
+
+def nth_day(first, repeat, interval, number):
+    """Дата повторения с номером number без учета исключений; None, если в месяце нет такого числа"""
+    step = STEP_DAYS.get(repeat)
+    if step is not None:
+        return first + timedelta(days=step * interval * number)
+    months = first.month - 1 + interval * number
+    year, month = first.year + months // 12, months % 12 + 1
+    if first.day > monthrange(year, month)[1]:
+        return None
+    return first.replace(year=year, month=month)
+
+
+def first_number(first, repeat, interval, day):
+    """Номер повторения, с которого нужно начинать перебор, чтобы не пропустить день day"""
+    if day <= first:
+        return 0
+    step = STEP_DAYS.get(repeat)
+    if step is not None:
+        # Округление вверх: это первое повторение не раньше day
+        return -(-(day - first).days // (step * interval))
+    months = (day.year - first.year) * 12 + day.month - first.month
+    return months // interval
+
+
+def last_number(first, repeat, interval, day):
+    """Номер последнего повторения не позже дня day (без учета пропусков в коротких месяцах)"""
+    step = STEP_DAYS.get(repeat)
+    if step is not None:
+        return (day - first).days // (step * interval)
+    months = (day.year - first.year) * 12 + day.month - first.month
+    return months // interval
+
+
+def occurrences(event, start=None, stop=None):
+    """Даты повторений события от start включительно до stop по одной: серия целиком не строится.
+
+    Перебор начинается сразу с окна, поэтому показ месяца или проверка напоминания
+    стоят столько, сколько повторений попадает в окно. Без stop и даты окончания
+    генератор бесконечен, его читают через next() или до нужной даты.
+    """
+    first = event.day
+    if first is None:
+        return
+    if event.repeat not in REPEATS:
+        if (start is None or first >= start) and (stop is None or first < stop):
+            yield first
+        return
+
+    interval = event.repeat_interval or 1
+    number = first_number(first, event.repeat, interval, start) if start is not None else 0
+    while True:
+        day = nth_day(first, event.repeat, interval, number)
+        number += 1
+        if day is None or (start is not None and day < start):
+            continue
+        if (event.until is not None and day > event.until) or (stop is not None and day >= stop):
+            return
+        if day not in event.skipped:
+            yield day
+
+
+def occurs_on(event, day):
+    """Есть ли у события повторение в день day"""
+    return next(occurrences(event, day, day + timedelta(days=1)), None) is not None
+
+
+def series_end(event):
+    """Дата последнего повторения строкой; у бессрочной серии OPEN_END, у разовой события - его дата.
+
+    Перебор идет назад от даты окончания и останавливается на первом неисключенном повторении.
+    Серия, в которой не осталось повторений, считается законченной в день начала.
+    """
+    if event.repeat not in REPEATS or event.day is None:
+        return event.date or ""
+    if event.until is None:
+        return OPEN_END
+    interval = event.repeat_interval or 1
+    number = last_number(event.day, event.repeat, interval, event.until)
+    while number >= 0:
+        day = nth_day(event.day, event.repeat, interval, number)
+        if day is not None and day <= event.until and day not in event.skipped:
+            return day.isoformat()
+        number -= 1
+    return event.date
+
+
+def repeat_display(event):
+    """Правило повторения для списка событий"""
+    if event.repeat not in REPEATS:
+        return "Нет"
+    interval = event.repeat_interval or 1
+    text = INTERVAL_DISPLAY[event.repeat].format(interval) if interval > 1 else event.repeat
+    if event.repeat_until:
+        text += f" до {event.repeat_until}"
+    return text
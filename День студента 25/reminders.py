@@ -0,0 +1,141 @@
+import heapq
+import json
+import os
+from datetime import datetime, timedelta
+
+from models import TIMESTAMP_FORMAT
+from recurrence import occurrences
+
+
+def fire_time(event, after=None):
+    """Момент срабатывания напоминания события или None, если напоминания нет.
+
+    У серии берется ближайшее повторение, напоминание которого позже after: повторения
+    перебираются лениво с нужного дня, серия целиком не строится.
+    """
+    if not event.reminder or event.start is None:
+        return None
+    offset = timedelta(minutes=event.reminder)
+    if not event.repeat:
+        return event.start - offset
+    moment = (after or datetime.now()) + offset
+    for day in occurrences(event, moment.date()):
+        start = datetime.combine(day, event.start.time())
+        if start > moment:
+            return start - offset
+    return None
+
+
+class ReminderQueue:
+    """Очередь напоминаний: куча моментов срабатывания с ленивым удалением"""
+
+    def __init__(self, watermark):
+        # Напоминания не позже этого момента уже показаны (или пропущены до первого запуска)
+        self.watermark = watermark
+        self.times = {}
+        self.pending = {}
+        self.heap = []
+        # Серии, чье следующее напоминание ставится после срабатывания предыдущего
+        self.series = {}
+
+    def build(self, events):
+        """Заполнение очереди при запуске; пропущенные за время закрытия тоже попадают в нее"""
+        for event in events:
+            when = fire_time(event, self.watermark)
+            if when is None:
+                continue
+            if event.repeat:
+                self.series[event.id] = event
+            self.times[event.id] = when
+            if when > self.watermark:
+                self.pending[event.id] = when
+        self.heap = [(when, event_id) for event_id, when in self.pending.items()]
+        heapq.heapify(self.heap)
+
+    def put(self, event, now):
+        """Учет добавленного или измененного события"""
+        when = fire_time(event, max(self.watermark, now))
+        if when is None:
+            self.remove(event.id)
+            return
+        if event.repeat:
+            self.series[event.id] = event
+        else:
+            self.series.pop(event.id, None)
+
+        # Правка, не менявшая время срабатывания, не должна повторять уже показанное напоминание
+        if self.times.get(event.id) == when:
+            return
+        self.times[event.id] = when
+        self.pending.pop(event.id, None)
+
+        # Напоминание прошедшего события бесполезно; для будущего с уже прошедшим моментом
+        # срабатывания оно показывается сразу. У серии момент уже выбран позже текущего
+        if event.repeat or event.start > now:
+            self.pending[event.id] = when
+            heapq.heappush(self.heap, (when, event.id))
+            self._compact()
+
+    def remove(self, event_id):
+        """Удаление напоминания удаленного события"""
+        self.times.pop(event_id, None)
+        self.pending.pop(event_id, None)
+        self.series.pop(event_id, None)
+
+    def next_time(self):
+        """Ближайший момент срабатывания или None"""
+        while self.heap:
+            when, event_id = self.heap[0]
+            if self.pending.get(event_id) == when:
+                return when
+            heapq.heappop(self.heap)
+        return None
+
+    def pop_due(self, now):
+        """Пары (id события, момент срабатывания) для напоминаний, наступивших к моменту now"""
+        due = []
+        while self.heap and self.heap[0][0] <= now:
+            when, event_id = heapq.heappop(self.heap)
+            if self.pending.get(event_id) == when:
+                del self.pending[event_id]
+                due.append((event_id, when))
+                event = self.series.get(event_id)
+                if event is not None:
+                    # Следующее повторение серии; пропущенные за время простоя не повторяются по одному
+                    self._schedule(event, fire_time(event, max(when, now)))
+        self.watermark = max(self.watermark, now)
+        return due
+
+    def _schedule(self, event, when):
+        """Постановка следующего срабатывания серии"""
+        if when is None:
+            self.times.pop(event.id, None)
+            self.series.pop(event.id, None)
+            return
+        self.times[event.id] = when
+        self.pending[event.id] = when
+        heapq.heappush(self.heap, (when, event.id))
+
+    def _compact(self):
+        """Перестроение кучи, когда в ней накопилось много устаревших элементов"""
+        if len(self.heap) > 2 * len(self.pending) + 64:
+            self.heap = [(when, event_id) for event_id, when in self.pending.items()]
+            heapq.heapify(self.heap)
+
+
+def load_watermark(path):
+    """Момент последней проверки напоминаний из прошлого запуска"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return datetime.strptime(json.load(f)["last_check"], TIMESTAMP_FORMAT)
+    except (OSError, ValueError, KeyError):
+        # При первом запуске старые напоминания не показываются
+        return datetime.now()
+
+
+def save_watermark(path, watermark):
+    """Сохранение момента последней проверки напоминаний"""
+    tmp_file = path + ".tmp"
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        json.dump({"last_check": watermark.strftime(TIMESTAMP_FORMAT)}, f)
+    os.replace(tmp_file, path)
@@ -0,0 +1,884 @@
+import os
+import sqlite3
+import sys
+import threading
+from bisect import bisect_left, insort
+from contextlib import contextmanager
+from dataclasses import replace
+
+from columns import ColumnTable
+from instrumentation import span
+from models import MODELS
+from storage import JournalStorage, KINDS
+
+
+def task_order_key(task):
+    """Ключ сортировки задач: по сроку, задачи без срока в конце"""
+    return task.due_date or "9999-99-99"
+
+
+def event_order_key(event):
+    """Ключ сортировки событий: по дате и времени"""
+    return event.date, event.time or "00:00"
+
+
+def note_order_key(note):
+    """Ключ сортировки заметок: по времени изменения"""
+    return note.updated_at
+
+
+class Repository:
+    """Общая часть хранилищ: оповещение подписчиков и поэтапная загрузка по типам записей"""
+
+    def __init__(self):
+        self.listeners = []
+        # Изменения и фоновые выборки не должны пересекаться
+        self.lock = threading.RLock()
+
+        self.loaded = {kind: threading.Event() for kind in KINDS}
+        self.priority = list(KINDS)
+        self.loader = None
+        self.load_error = None
+
+    def subscribe(self, listener):
+        """Подписка на изменения: listener(kind, op, payload)"""
+        self.listeners.append(listener)
+
+    def _notify(self, kind, op, payload):
+        for listener in self.listeners:
+            listener(kind, op, payload)
+
+    def load(self, background=True):
+        """Загрузка записей по типам, в фоне или сразу"""
+        if background:
+            self.loader = threading.Thread(target=self._load_all, daemon=True)
+            self.loader.start()
+        else:
+            self._load_all()
+
+    def _load_all(self):
+        """Загрузка всех типов, начиная с самого нужного интерфейсу"""
+        try:
+            with span("load.read"):
+                self._read()
+            while True:
+                with self.lock:
+                    remaining = [kind for kind in self.priority if not self.is_loaded(kind)]
+                if not remaining:
+                    break
+                with span(f"load.{remaining[0]}"):
+                    self._load_kind(remaining[0])
+                self.loaded[remaining[0]].set()
+            with span("load.maintenance"):
+                self._after_load()
+        except Exception as e:
+            # Ожидающие загрузки получат ошибку, а не зависнут
+            self.load_error = e
+            for event in self.loaded.values():
+                event.set()
+            if self.loader is None:
+                raise
+
+    def _read(self):
+        """Чтение данных, общих для всех типов"""
+
+    def _load_kind(self, kind):
+        """Подготовка записей одного типа"""
+
+    def _after_load(self):
+        """Обслуживание хранилища после загрузки всех типов"""
+
+    def content(self, note):
+        """Текст заметки"""
+        return note.content or ""
+
+    def value(self, record, field):
+        """Значение поля записи для поиска"""
+        if field == "content":
+            return self.content(record)
+        return getattr(record, field)
+
+    def prioritize(self, kind):
+        """Перенос типа в начало очереди загрузки"""
+        with self.lock:
+            self.priority.remove(kind)
+            self.priority.insert(0, kind)
+
+    def is_loaded(self, kind):
+        """Загружены ли записи указанного типа"""
+        return self.loaded[kind].is_set()
+
+    def sync(self):
+        """Прием изменений, сделанных другими процессами; возвращает затронутые типы"""
+        return set()
+
+    @contextmanager
+    def transaction(self):
+        """Серия изменений без вмешательства других потоков"""
+        with self.lock:
+            yield
+
+    def add_many(self, kind, records):
+        """Добавление серии записей; возвращает их с назначенными id"""
+        with self.transaction():
+            return [self.add(kind, record) for record in records]
+
+    def update_many(self, kind, records):
+        """Сохранение изменений серии записей одной транзакцией"""
+        with self.transaction():
+            for record in records:
+                self.update(kind, record)
+
+    def delete_many(self, kind, record_ids):
+        """Удаление серии записей одной транзакцией"""
+        with self.transaction():
+            for record_id in record_ids:
+                self.delete(kind, record_id)
+
+
+ORDER_KEYS = {
+    "tasks": task_order_key,
+    "events": event_order_key,
+    "notes": note_order_key,
+}
+
+
+class Collection:
+    """Записи одного типа: словарь по id, монотонный счетчик id и порядок показа"""
+
+    def __init__(self, records=(), next_id=1, order_key=None):
+        self.records = {}
+        self.next_id = next_id
+        self.order_key = order_key
+        # Отсортированный список пар (ключ, id) и текущий ключ каждой записи
+        self.order = []
+        self.keys = {}
+        # После массовой вставки порядок досортировывается при первом обращении к нему
+        self.unsorted = False
+
+        for record in records:
+            if record.id is None:
+                record = record.with_id(self.next_id)
+            self._store(record)
+            self.next_id = max(self.next_id, record.id + 1)
+            if order_key is not None:
+                self.keys[record.id] = self._key(record)
+        if order_key is not None:
+            self.order = sorted((key, record_id) for record_id, key in self.keys.items())
+
+    def __len__(self):
+        return len(self.records)
+
+    def __iter__(self):
+        return iter(self.records.values())
+
+    def __contains__(self, record_id):
+        return record_id in self.records
+
+    def get(self, record_id):
+        """Запись по id за O(1)"""
+        return self.records.get(record_id)
+
+    def _store(self, record):
+        """Сохранение записи под ее id"""
+        self.records[record.id] = record
+
+    def _discard(self, record_id):
+        """Удаление записи по id; возвращает ее или None"""
+        return self.records.pop(record_id, None)
+
+    def _key(self, record):
+        """Ключ записи в порядке показа"""
+        return self.order_key(record)
+
+    def add(self, record):
+        """Добавление записи с выдачей следующего id"""
+        record = record.with_id(self.next_id)
+        self.put(record)
+        return record
+
+    def put(self, record):
+        """Вставка или замена записи по ее id с перестановкой в порядке показа"""
+        record_id = record.id
+        self._store(record)
+        if record_id >= self.next_id:
+            self.next_id = record_id + 1
+
+        if self.order_key is not None:
+            self._sort()
+            key = self._key(record)
+            if record_id in self.keys:
+                old_key = self.keys[record_id]
+                if old_key == key:
+                    return
+                self._unlink(old_key, record_id)
+            self.keys[record_id] = key
+            insort(self.order, (key, record_id))
+
+    def put_many(self, records):
+        """Вставка серии новых записей без поиска места каждой в порядке показа"""
+        for record in records:
+            self._store(record)
+            self.next_id = max(self.next_id, record.id + 1)
+            if self.order_key is not None:
+                key = self._key(record)
+                self.keys[record.id] = key
+                self.order.append((key, record.id))
+                self.unsorted = True
+
+    def _sort(self):
+        """Досортировка порядка показа после массовой вставки: одна сортировка на всю серию"""
+        if self.unsorted:
+            self.order.sort()
+            self.unsorted = False
+
+    def delete(self, record_id):
+        """Удаление записи по id"""
+        record = self._discard(record_id)
+        if record is not None and record_id in self.keys:
+            self._unlink(self.keys.pop(record_id), record_id)
+        return record
+
+    def _unlink(self, key, record_id):
+        """Удаление пары из порядка показа двоичным поиском"""
+        self._sort()
+        del self.order[bisect_left(self.order, (key, record_id))]
+
+    def ordered(self, start=0, stop=None, reverse=False):
+        """Записи в порядке показа, при необходимости только из части порядка"""
+        self._sort()
+        entries = self.order[start:stop]
+        if reverse:
+            entries.reverse()
+        return [self.records[record_id] for key, record_id in entries]
+
+    def position(self, key):
+        """Позиция первой записи с ключом не меньше заданного"""
+        self._sort()
+        return bisect_left(self.order, (key,))
+
+    def select(self, field, value):
+        """Записи в порядке показа, у которых поле field равно value"""
+        return [record for record in self.ordered() if getattr(record, field) == value]
+
+
+def intern_key(key):
+    """Ключ порядка с интернированными строками: одинаковые даты сроков хранятся один раз"""
+    if type(key) is str:
+        return sys.intern(key)
+    if type(key) is tuple:
+        return tuple(sys.intern(part) if type(part) is str else part for part in key)
+    return key
+
+
+class ColumnCollection(Collection):
+    """Записи одного типа по столбцам (columns.ColumnTable) для больших архивов.
+
+    В records хранится номер строки таблицы по id, объект записи создается при каждом
+    обращении к нему. Памяти на запись нужно в несколько раз меньше, чем объектам записей,
+    а фильтры по приоритету и выполнению проходят байтовые столбцы без создания объектов.
+    """
+
+    def __init__(self, model, records=(), next_id=1, order_key=None):
+        self.table = ColumnTable(model)
+        super().__init__(records, next_id, order_key)
+
+    def __iter__(self):
+        return map(self.table.record, self.records.values())
+
+    def get(self, record_id):
+        """Запись по id, собранная из строки таблицы"""
+        row = self.records.get(record_id)
+        return None if row is None else self.table.record(row)
+
+    def _store(self, record):
+        row = self.records.get(record.id)
+        if row is None:
+            self.records[record.id] = self.table.insert(record)
+        else:
+            self.table.update(row, record)
+
+    def _discard(self, record_id):
+        row = self.records.pop(record_id, None)
+        if row is None:
+            return None
+        record = self.table.record(row)
+        self.table.remove(row)
+        return record
+
+    def _key(self, record):
+        return intern_key(self.order_key(record))
+
+    def ordered(self, start=0, stop=None, reverse=False):
+        self._sort()
+        entries = self.order[start:stop]
+        if reverse:
+            entries.reverse()
+        record, rows = self.table.record, self.records
+        return [record(rows[record_id]) for key, record_id in entries]
+
+    def select(self, field, value):
+        """Записи с полем field, равным value: id отбираются по столбцу, объекты создаются только для них"""
+        ids = set(self.table.matching(field, value))
+        self._sort()
+        record, rows = self.table.record, self.records
+        return [record(rows[record_id]) for key, record_id in self.order if record_id in ids]
+
+
+def record_to_dict(record):
+    """Словарь записи для снимка JSON"""
+    return record.to_dict()
+
+
+class MemoryRepository(Repository):
+    """Записи в памяти со снимком JSON и журналом изменений на диске"""
+
+    def __init__(self, storage, columnar=False):
+        super().__init__()
+        self.storage = storage
+        # Хранение записей по столбцам вместо объектов: меньше памяти, но объект собирается при каждом чтении
+        self.columnar = columnar
+        self.stream = None
+        self.raw = {}
+        self.data = {}
+        # Заметки старого формата с текстом внутри записи; они переносятся при первом изменении данных
+        self.inline_notes = 0
+        self.compact_pending = False
+        # Внутри transaction() журнал сжимается только после последнего изменения
+        self.transaction_depth = 0
+
+    def _read(self):
+        """Начало потокового чтения снимка; записи создаются по одному типу"""
+        self.stream = self.storage.stream()
+
+    def _pull(self, key):
+        """Чтение снимка до появления нужного типа записей"""
+        while key not in self.raw:
+            read_key, value = next(self.stream)
+            self.raw[read_key] = value
+
+    def _load_kind(self, kind):
+        """Создание записей одного типа из разобранных словарей"""
+        # В новых снимках счетчики id записаны первыми и чтение не забегает вперед
+        self._pull("next_ids")
+        self._pull(kind)
+        records = map(MODELS[kind].from_dict, self.raw.pop(kind))
+        if kind == "notes":
+            records = list(records)
+            self.inline_notes = sum(note.content is not None for note in records)
+        if self.columnar:
+            collection = ColumnCollection(MODELS[kind], records, self.raw["next_ids"][kind], ORDER_KEYS[kind])
+        else:
+            collection = Collection(records, self.raw["next_ids"][kind], ORDER_KEYS[kind])
+        with self.lock:
+            self.data[kind] = collection
+
+    def _store_body(self, note):
+        """Перенос текста заметки в хранилище блоков; в записи остается хеш"""
+        if note.content is None:
+            return note
+        return replace(note, content=None, content_hash=self.storage.put_blob(note.content))
+
+    def _after_load(self):
+        """Заказ блоков id и удаление неиспользуемых текстов; снимок при чтении не переписывается"""
+        self.storage.prefetch_ids()
+        with self.lock:
+            live = {note.content_hash for note in self.data["notes"]}
+        self.storage.collect_blobs(live)
+
+    def _move_bodies(self):
+        """Перенос текстов заметок старого снимка в хранилище блоков при первом изменении данных.
+
+        Пока данные только читаются, снимок остается в прежнем формате. После переноса снимок
+        сжимается сразу, чтобы другие копии приложения видели ссылки на новые блоки.
+        """
+        if not self.inline_notes or not self.is_loaded("notes"):
+            return
+        notes = self.data["notes"]
+        for note in list(notes):
+            if note.content is not None:
+                notes.put(self._store_body(note))
+        self.inline_notes = 0
+        self.compact_pending = True
+
+    def content(self, note):
+        """Текст заметки; из хранилища блоков он читается только по запросу"""
+        if note.content is not None:
+            return note.content
+        if note.content_hash is None:
+            return ""
+        return self.storage.get_blob(note.content_hash)
+
+    def _collection(self, kind):
+        """Записи типа; до окончания их загрузки вызывающий поток ждет"""
+        if not self.is_loaded(kind):
+            if self.loader is None:
+                self.load(background=False)
+            self.loaded[kind].wait()
+        if self.load_error is not None:
+            raise self.load_error
+        return self.data[kind]
+
+    def all(self, kind):
+        """Все записи указанного типа"""
+        return list(self._collection(kind))
+
+    def get(self, kind, record_id):
+        """Поиск записи по id"""
+        return self._collection(kind).get(record_id)
+
+    def add(self, kind, record):
+        """Добавление записи с назначением нового id"""
+        collection = self._collection(kind)
+        if kind == "notes":
+            record = self._store_body(record)
+        with self.lock:
+            # id согласуется с другими процессами, работающими с той же базой; обычно он берется из памяти
+            collection.next_id = self.storage.reserve_id(kind, collection.next_id)
+            record = collection.add(record)
+            self._log("put", kind, record)
+            self._notify(kind, "put", record)
+        return record
+
+    def add_many(self, kind, records):
+        """Добавление серии записей: id выдаются одним диапазоном, журнал получает одно задание"""
+        collection = self._collection(kind)
+        if kind == "notes":
+            records = map(self._store_body, records)
+        records = list(records)
+        if not records:
+            return records
+        with self.transaction():
+            first_id = self.storage.reserve_id(kind, collection.next_id, len(records))
+            records = [record.with_id(first_id + i) for i, record in enumerate(records)]
+            collection.put_many(records)
+            self._log_many(("put", kind, record.to_dict()) for record in records)
+            for record in records:
+                self._notify(kind, "put", record)
+        return records
+
+    def update(self, kind, record):
+        """Сохранение изменений существующей записи"""
+        collection = self._collection(kind)
+        if kind == "notes":
+            record = self._store_body(record)
+        with self.lock:
+            collection.put(record)
+            self._log("put", kind, record)
+            self._notify(kind, "put", record)
+
+    def update_many(self, kind, records):
+        """Сохранение изменений серии записей: журнал получает одно задание"""
+        collection = self._collection(kind)
+        if kind == "notes":
+            records = map(self._store_body, records)
+        records = list(records)
+        if not records:
+            return
+        with self.transaction():
+            for record in records:
+                collection.put(record)
+            self._log_many(("put", kind, record.to_dict()) for record in records)
+            for record in records:
+                self._notify(kind, "put", record)
+
+    def delete(self, kind, record_id):
+        """Удаление записи по id"""
+        collection = self._collection(kind)
+        with self.lock:
+            collection.delete(record_id)
+            self._log("delete", kind, record_id)
+            self._notify(kind, "delete", record_id)
+
+    def delete_many(self, kind, record_ids):
+        """Удаление серии записей: журнал получает одно задание"""
+        collection = self._collection(kind)
+        record_ids = list(record_ids)
+        if not record_ids:
+            return
+        with self.transaction():
+            for record_id in record_ids:
+                collection.delete(record_id)
+            self._log_many(("delete", kind, record_id) for record_id in record_ids)
+            for record_id in record_ids:
+                self._notify(kind, "delete", record_id)
+
+    def sync(self):
+        """Применение чужих изменений к коллекциям с оповещением подписчиков о каждой записи"""
+        if self.load_error is not None or not all(self.is_loaded(kind) for kind in KINDS):
+            return set()
+        entries, data = self.storage.changes()
+        if data is not None:
+            entries = self._diff(data)
+
+        changed = set()
+        with self.lock:
+            for entry in entries:
+                kind = entry["kind"]
+                collection = self.data[kind]
+                if entry["op"] == "put":
+                    record = MODELS[kind].from_dict(entry["record"])
+                    if kind == "notes":
+                        record = self._store_body(record)
+                    collection.put(record)
+                    self._notify(kind, "put", record)
+                else:
+                    record_id = entry["id"]
+                    collection.next_id = max(collection.next_id, record_id + 1)
+                    if collection.delete(record_id) is None:
+                        continue
+                    self._notify(kind, "delete", record_id)
+                changed.add(kind)
+            if data is not None:
+                for kind, next_id in data["next_ids"].items():
+                    self.data[kind].next_id = max(self.data[kind].next_id, next_id)
+        return changed
+
+    def _diff(self, data):
+        """Строки журнала, приводящие коллекции к прочитанным данным; свои новые правки не трогаются"""
+        version = self.storage.version
+        entries = []
+        for kind in KINDS:
+            collection = self.data[kind]
+            ids = set()
+            for raw in data[kind]:
+                record = MODELS[kind].from_dict(raw)
+                ids.add(record.id)
+                if collection.get(record.id) != record and \
+                        not self.storage.is_newer_locally(kind, record.id, version):
+                    entries.append({"op": "put", "kind": kind, "record": raw})
+            for record_id in list(collection.records):
+                if record_id not in ids and not self.storage.is_newer_locally(kind, record_id, version):
+                    entries.append({"op": "delete", "kind": kind, "id": record_id})
+        return entries
+
+    def next_ids(self):
+        """Текущие значения счетчиков id для сохранения в снимке"""
+        return {kind: collection.next_id for kind, collection in self.data.items()}
+
+    def query_tasks(self, filter_type="Все"):
+        """Задачи по фильтру, упорядоченные по сроку"""
+        tasks = self._collection("tasks")
+        if filter_type == "Активные":
+            return tasks.select("completed", False)
+        if filter_type == "Завершенные":
+            return tasks.select("completed", True)
+        if filter_type == "Высокий":
+            return tasks.select("priority", "Высокий")
+        return tasks.ordered()
+
+    def query_events(self, filter_type="Все", today=None):
+        """События по фильтру, упорядоченные по дате и времени"""
+        events = self._collection("events")
+        if filter_type == "Предстоящие":
+            return events.ordered(events.position((today,)))
+        if filter_type == "Прошедшие":
+            return events.ordered(0, events.position((today,)))
+        return events.ordered()
+
+    def query_notes(self):
+        """Заметки, начиная с последних измененных"""
+        return self._collection("notes").ordered(reverse=True)
+
+    def count(self, kind):
+        """Количество записей указанного типа"""
+        return len(self._collection(kind))
+
+    @contextmanager
+    def transaction(self):
+        """Серия изменений без вмешательства других потоков; снимок пишется не чаще раза в конце"""
+        with self.lock:
+            self.transaction_depth += 1
+            try:
+                yield
+            finally:
+                self.transaction_depth -= 1
+            if not self.transaction_depth:
+                self._compact_if_needed()
+
+    def _log(self, op, kind, payload):
+        """Запись изменения в журнал со сжатием при его разрастании"""
+        self._move_bodies()
+        self.storage.append(op, kind, payload.to_dict() if op == "put" else payload)
+        if not self.transaction_depth:
+            self._compact_if_needed()
+
+    def _log_many(self, changes):
+        """Запись серии изменений (op, kind, payload) в журнал одним заданием"""
+        self._move_bodies()
+        self.storage.append_many(changes)
+
+    def _compact_if_needed(self):
+        """Сворачивание разросшегося журнала в снимок"""
+        # Снимок пишется только когда в памяти есть записи всех типов
+        if not all(self.is_loaded(kind) for kind in KINDS):
+            return
+        if self.compact_pending or self.storage.needs_compaction():
+            self.compact_pending = False
+            self.storage.compact(self.data, self.next_ids(), serialize=record_to_dict)
+
+    def close(self):
+        """Завершение работы с хранилищем"""
+        self.storage.close()
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    title TEXT NOT NULL,
+    description TEXT NOT NULL DEFAULT '',
+    priority TEXT NOT NULL DEFAULT 'Средний',
+    due_date TEXT,
+    completed INTEGER NOT NULL DEFAULT 0,
+    created_at TEXT,
+    updated_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_tasks_due ON tasks (COALESCE(due_date, '9999-99-99'));
+CREATE INDEX IF NOT EXISTS idx_tasks_completed ON tasks (completed, COALESCE(due_date, '9999-99-99'));
+CREATE INDEX IF NOT EXISTS idx_tasks_priority ON tasks (priority, COALESCE(due_date, '9999-99-99'));
+
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    title TEXT NOT NULL,
+    description TEXT NOT NULL DEFAULT '',
+    date TEXT NOT NULL,
+    time TEXT,
+    duration INTEGER,
+    reminder INTEGER,
+    repeat TEXT,
+    repeat_interval INTEGER,
+    repeat_until TEXT,
+    repeat_except TEXT,
+    created_at TEXT,
+    updated_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_events_date ON events (date, COALESCE(time, '00:00'));
+
+CREATE TABLE IF NOT EXISTS notes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    title TEXT NOT NULL,
+    content TEXT NOT NULL DEFAULT '',
+    created_at TEXT,
+    updated_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_notes_updated ON notes (updated_at);
+"""
+
+COLUMNS = {
+    "tasks": ("id", "title", "description", "priority", "due_date", "completed", "created_at", "updated_at"),
+    "events": ("id", "title", "description", "date", "time", "duration", "reminder", "repeat", "repeat_interval",
+               "repeat_until", "repeat_except", "created_at", "updated_at"),
+    "notes": ("id", "title", "content", "created_at", "updated_at"),
+}
+
+# Столбцы, появившиеся в новых версиях: в базы прежних версий они добавляются при открытии
+ADDED_COLUMNS = {
+    "events": (("repeat", "TEXT"), ("repeat_interval", "INTEGER"), ("repeat_until", "TEXT"),
+               ("repeat_except", "TEXT"), ("duration", "INTEGER")),
+}
+
+TASK_ORDER = "ORDER BY COALESCE(due_date, '9999-99-99')"
+EVENT_ORDER = "ORDER BY date, COALESCE(time, '00:00')"
+
+
+class SQLiteRepository(Repository):
+    """Записи в базе SQLite с индексированными выборками"""
+
+    def __init__(self, db_file, json_file=None):
+        super().__init__()
+        self.db_file = db_file
+        self.conn = sqlite3.connect(db_file, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript(SCHEMA)
+        self._add_columns()
+
+        # Внутри transaction() изменения фиксируются один раз в конце
+        self.autocommit = True
+
+        # В базу, куда еще ничего не добавлялось, переносятся данные JSON, даже если файл базы уже создан
+        is_new = not self.conn.execute("SELECT 1 FROM sqlite_sequence LIMIT 1").fetchone()
+        if is_new and json_file and json_data_exists(json_file):
+            migrate_json(json_file, self)
+        self.data_version = self._data_version()
+
+    def _add_columns(self):
+        """Дополнение таблиц базы прежней версии новыми столбцами"""
+        for kind, columns in ADDED_COLUMNS.items():
+            for column, column_type in columns:
+                present = {row["name"] for row in self.conn.execute(f"PRAGMA table_info({kind})")}
+                if column in present:
+                    continue
+                try:
+                    self.conn.execute(f"ALTER TABLE {kind} ADD COLUMN {column} {column_type}")
+                except sqlite3.OperationalError:
+                    # Столбец мог добавить другой процесс, открывший базу одновременно
+                    pass
+        self.conn.commit()
+
+    def _data_version(self):
+        """Счетчик SQLite, меняющийся при фиксации изменений другими соединениями"""
+        with self.lock:
+            return self.conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def sync(self):
+        """Проверка изменений других процессов; выборки и так идут из базы, подписчики пересчитывают типы"""
+        data_version = self._data_version()
+        if data_version == self.data_version:
+            return set()
+        self.data_version = data_version
+        # Какие именно записи изменились, SQLite не сообщает
+        for kind in KINDS:
+            self._notify(kind, "reload", None)
+        return set(KINDS)
+
+    def _to_record(self, kind, row):
+        """Преобразование строки таблицы в запись"""
+        return MODELS[kind].from_dict(dict(row))
+
+    def _select(self, kind, where="", params=(), order=""):
+        """Выборка записей с условием и порядком"""
+        sql = f"SELECT * FROM {kind} {where} {order}"
+        with self.lock:
+            return [self._to_record(kind, row) for row in self.conn.execute(sql, params)]
+
+    def all(self, kind):
+        """Все записи указанного типа"""
+        return self._select(kind)
+
+    def get(self, kind, record_id):
+        """Поиск записи по id"""
+        records = self._select(kind, "WHERE id = ?", (record_id,))
+        return records[0] if records else None
+
+    def _values(self, kind, record):
+        """Значения столбцов таблицы для записи"""
+        values = []
+        for column in COLUMNS[kind]:
+            value = getattr(record, column)
+            if column == "completed":
+                value = int(bool(value))
+            elif column in ("description", "content") and value is None:
+                value = ""
+            elif column == "priority" and value is None:
+                value = "Средний"
+            values.append(value)
+        return values
+
+    def add(self, kind, record, commit=True):
+        """Добавление записи с назначением нового id"""
+        columns = COLUMNS[kind][1:]
+        values = self._values(kind, record)[1:]
+        placeholders = ", ".join("?" * len(columns))
+        with self.lock:
+            cursor = self.conn.execute(f"INSERT INTO {kind} ({', '.join(columns)}) VALUES ({placeholders})", values)
+            record = record.with_id(cursor.lastrowid)
+            if commit and self.autocommit:
+                self._commit()
+            self._notify(kind, "put", record)
+        return record
+
+    def update(self, kind, record, commit=True):
+        """Сохранение изменений существующей записи"""
+        columns = COLUMNS[kind]
+        placeholders = ", ".join("?" * len(columns))
+        with self.lock:
+            self.conn.execute(f"INSERT OR REPLACE INTO {kind} ({', '.join(columns)}) VALUES ({placeholders})",
+                              self._values(kind, record))
+            if commit and self.autocommit:
+                self._commit()
+            self._notify(kind, "put", record)
+
+    def delete(self, kind, record_id):
+        """Удаление записи по id"""
+        with self.lock:
+            self.conn.execute(f"DELETE FROM {kind} WHERE id = ?", (record_id,))
+            if self.autocommit:
+                self._commit()
+            self._notify(kind, "delete", record_id)
+
+    @contextmanager
+    def transaction(self):
+        """Серия изменений в одной транзакции SQLite; при ошибке откатывается целиком"""
+        with self.lock:
+            if not self.autocommit:
+                yield
+                return
+            self.autocommit = False
+            try:
+                yield
+                self._commit()
+            except BaseException:
+                self.conn.rollback()
+                raise
+            finally:
+                self.autocommit = True
+
+    def query_tasks(self, filter_type="Все"):
+        """Задачи по фильтру, упорядоченные по сроку"""
+        if filter_type == "Активные":
+            return self._select("tasks", "WHERE completed = 0", order=TASK_ORDER)
+        if filter_type == "Завершенные":
+            return self._select("tasks", "WHERE completed = 1", order=TASK_ORDER)
+        if filter_type == "Высокий":
+            return self._select("tasks", "WHERE priority = 'Высокий'", order=TASK_ORDER)
+        return self._select("tasks", order=TASK_ORDER)
+
+    def query_events(self, filter_type="Все", today=None):
+        """События по фильтру, упорядоченные по дате и времени"""
+        if filter_type == "Предстоящие":
+            return self._select("events", "WHERE date >= ?", (today,), EVENT_ORDER)
+        if filter_type == "Прошедшие":
+            return self._select("events", "WHERE date < ?", (today,), EVENT_ORDER)
+        return self._select("events", order=EVENT_ORDER)
+
+    def query_notes(self):
+        """Заметки, начиная с последних измененных"""
+        return self._select("notes", order="ORDER BY updated_at DESC")
+
+    def count(self, kind):
+        """Количество записей указанного типа"""
+        return self.conn.execute(f"SELECT COUNT(*) FROM {kind}").fetchone()[0]
+
+    def next_ids(self):
+        """Следующие id по счетчикам AUTOINCREMENT"""
+        with self.lock:
+            seq = dict(self.conn.execute("SELECT name, seq FROM sqlite_sequence").fetchall())
+        return {kind: seq.get(kind, 0) + 1 for kind in KINDS}
+
+    def _commit(self):
+        """Фиксация транзакции на диске"""
+        with span("save.commit"):
+            self.conn.commit()
+
+    def close(self):
+        """Завершение работы с базой"""
+        self.conn.commit()
+        self.conn.close()
+
+
+def json_data_exists(json_file):
+    """Есть ли у JSON базы данные: снимок или журнал (до первого сжатия снимка нет)"""
+    return any(os.path.exists(json_file + suffix) for suffix in ("", ".journal", ".journal.old"))
+
+
+def migrate_json(json_file, repository):
+    """Однократный перенос данных из JSON файла (с журналом) в SQLite"""
+    storage = JournalStorage(json_file)
+    data = storage.load()
+    storage.close()
+
+    with repository.conn:
+        for kind in KINDS:
+            for record in data[kind]:
+                record = MODELS[kind].from_dict(record)
+                if kind == "notes" and record.content_hash is not None:
+                    record = replace(record, content=storage.get_blob(record.content_hash), content_hash=None)
+                repository.update(kind, record, commit=False)
+
+            # Счетчик id переносится, чтобы id удаленных записей не выдавались повторно
+            last_id = data["next_ids"][kind] - 1
+            updated = repository.conn.execute(
+                "UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = ?", (last_id, kind)
+            ).rowcount
+            if not updated and last_id > 0:
+                repository.conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)", (kind, last_id))
@@ -0,0 +1,289 @@
+import queue
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from instrumentation import recorder, span
+
+
+# Сколько текстов проверенных записей индекс без хранимых текстов держит в памяти
+TEXT_CACHE_SIZE = 256
+
+
+def fold(text):
+    """Приведение текста к нижнему регистру (в том числе кириллицы)"""
+    return text.lower()
+
+
+def grams(text, size):
+    """Множество подстрок заданной длины"""
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+class SearchIndex:
+    """Инвертированный индекс по биграммам и триграммам для поиска подстрок"""
+
+    def __init__(self, fields, getter=getattr, loader=None, cache_size=TEXT_CACHE_SIZE):
+        self.fields = fields
+        # Значение поля записи; текст заметок может читаться из хранилища блоков
+        self.getter = getter
+        # Запись по id: с ним тексты в индексе не хранятся, совпадения проверяются по самой записи
+        self.loader = loader
+        self.texts = {}
+        # Без текстов у записи остаются ее n-граммы (строки общие со списками postings) и заголовок
+        self.record_grams = {}
+        self.titles = {}
+        # Тексты последних проверенных записей: повторный ввод запроса не читает их с диска
+        self.cache = OrderedDict()
+        self.cache_size = cache_size
+        self.cache_lock = threading.Lock()
+        self.postings = {}
+
+    def _text(self, record):
+        """Текст записи в том же виде, в каком по нему искали раньше"""
+        return fold(" ".join(self.getter(record, field) or "" for field in self.fields))
+
+    def match(self, record, query):
+        """Проверка записи без индекса, пока он строится"""
+        return fold(query) in self._text(record)
+
+    def build(self, records):
+        """Построение индекса по всем записям"""
+        self.texts = {}
+        self.record_grams = {}
+        self.titles = {}
+        self.cache.clear()
+        self.postings = {}
+        for record in records:
+            self.put(record)
+
+    def put(self, record):
+        """Добавление или переиндексация записи"""
+        record_id = record.id
+        text = self._text(record)
+        if self.loader is None:
+            old_text = self.texts.get(record_id)
+            if old_text == text:
+                return
+            old_grams = self._grams(old_text) if old_text is not None else set()
+            new_grams = self._grams(text)
+            self.texts[record_id] = text
+        else:
+            self.titles[record_id] = fold(self.getter(record, self.fields[0]) or "")
+            self._remember(record_id, text)
+            old_grams = set(self.record_grams.get(record_id, ()))
+            new_grams = self._grams(text)
+            # Кортеж интернированных строк занимает по указателю на n-грамму
+            self.record_grams[record_id] = tuple(map(sys.intern, new_grams))
+            if old_grams == new_grams:
+                return
+
+        for gram in old_grams - new_grams:
+            self._discard(gram, record_id)
+        for gram in new_grams - old_grams:
+            self.postings.setdefault(gram, set()).add(record_id)
+
+    def remove(self, record_id):
+        """Удаление записи из индекса"""
+        if self.loader is None:
+            text = self.texts.pop(record_id, None)
+            if text is None:
+                return
+            old_grams = self._grams(text)
+        else:
+            self.titles.pop(record_id, None)
+            with self.cache_lock:
+                self.cache.pop(record_id, None)
+            old_grams = self.record_grams.pop(record_id, ())
+        for gram in old_grams:
+            self._discard(gram, record_id)
+
+    def _grams(self, text):
+        return grams(text, 2) | grams(text, 3)
+
+    def _discard(self, gram, record_id):
+        ids = self.postings.get(gram)
+        if ids is not None:
+            ids.discard(record_id)
+            if not ids:
+                del self.postings[gram]
+
+    def _remember(self, record_id, text):
+        """Текст записи в кэше; самые давно проверенные вытесняются"""
+        with self.cache_lock:
+            self.cache[record_id] = text
+            self.cache.move_to_end(record_id)
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+
+    def _contains(self, record_id, query):
+        """Проверка подстроки в тексте записи; без хранимых текстов запись читается заново"""
+        if self.loader is None:
+            return query in self.texts[record_id]
+        if query in self.titles.get(record_id, ""):
+            return True
+        with self.cache_lock:
+            text = self.cache.get(record_id)
+            if text is not None:
+                self.cache.move_to_end(record_id)
+        if text is None:
+            record = self.loader(record_id)
+            if record is None:
+                return False
+            text = self._text(record)
+            self._remember(record_id, text)
+        return query in text
+
+    def search(self, query):
+        """Множество id записей, содержащих строку запроса"""
+        query = fold(query)
+        if not query:
+            return set(self.texts if self.loader is None else self.record_grams)
+
+        if len(query) == 1:
+            # Для одного символа индекс не сужает выборку
+            if self.loader is None:
+                return {record_id for record_id, text in self.texts.items() if query in text}
+            # Символ есть в тексте, если он входит в одну из его биграмм; текст короче биграммы проверяется целиком
+            found = set()
+            for gram, ids in list(self.postings.items()):
+                if len(gram) == 2 and query in gram:
+                    found |= ids
+            short = [record_id for record_id, record_grams in list(self.record_grams.items()) if not record_grams]
+            return found | {record_id for record_id in short if self._contains(record_id, query)}
+
+        size = 2 if len(query) == 2 else 3
+        postings = []
+        for gram in grams(query, size):
+            ids = self.postings.get(gram)
+            if not ids:
+                return set()
+            postings.append(ids)
+
+        postings.sort(key=len)
+        candidates = set(postings[0])
+        for ids in postings[1:]:
+            candidates &= ids
+            if not candidates:
+                return candidates
+
+        # Триграммы могут совпасть и без подстроки целиком, поэтому проверяем текст
+        if len(query) > 3:
+            candidates = {record_id for record_id in candidates if self._contains(record_id, query)}
+        return candidates
+
+
+class SearchScheduler:
+    """Отложенный запуск поиска с отменой устаревших запросов"""
+
+    def __init__(self, root, delay=250, worker_threshold=5000, poll_interval=20):
+        self.root = root
+        self.delay = delay
+        self.worker_threshold = worker_threshold
+        self.poll_interval = poll_interval
+
+        self.pending = {}
+        self.generations = {}
+        self.results = queue.Queue()
+        self.executor = None
+        self.in_flight = 0
+        self.polling = None
+
+    def _next_generation(self, key):
+        """Новое поколение запроса: все предыдущие по ключу становятся устаревшими"""
+        self.cancel(key)
+        generation = self.generations.get(key, 0) + 1
+        self.generations[key] = generation
+        return generation
+
+    def _is_stale(self, key, generation):
+        return self.generations.get(key) != generation
+
+    def _traced(self, key, compute, apply):
+        """Запрос с замерами вычисления, показа и общего времени от запроса до показа"""
+        if not recorder.enabled:
+            return compute, apply
+        name = "search." + ".".join(key) if isinstance(key, tuple) else f"search.{key}"
+        requested = time.perf_counter()
+
+        def traced_compute(cancelled):
+            with span(f"{name}.compute"):
+                return compute(cancelled)
+
+        def traced_apply(result):
+            with span(f"{name}.apply"):
+                apply(result)
+            recorder.record(f"{name}.latency", time.perf_counter() - requested, requested)
+
+        return traced_compute, traced_apply
+
+    def schedule(self, key, compute, apply, size=0):
+        """Запуск запроса после паузы в наборе текста"""
+        generation = self._next_generation(key)
+        compute, apply = self._traced(key, compute, apply)
+        self.pending[key] = self.root.after(self.delay, self._run, key, generation, compute, apply, size)
+
+    def run_now(self, key, compute, apply):
+        """Немедленное выполнение запроса в потоке интерфейса"""
+        generation = self._next_generation(key)
+        compute, apply = self._traced(key, compute, apply)
+        apply(compute(lambda: self._is_stale(key, generation)))
+
+    def run_in_background(self, key, compute, apply):
+        """Выполнение долгой работы в фоновом потоке с передачей результата в интерфейс"""
+        generation = self._next_generation(key)
+        compute, apply = self._traced(key, compute, apply)
+        self._submit(key, generation, compute, apply)
+
+    def cancel(self, key):
+        """Отмена ожидающего запуска запроса"""
+        after_id = self.pending.pop(key, None)
+        if after_id is not None:
+            self.root.after_cancel(after_id)
+
+    def _run(self, key, generation, compute, apply, size):
+        """Выполнение запроса: небольшие наборы сразу, большие в фоновом потоке"""
+        self.pending.pop(key, None)
+        cancelled = lambda: self._is_stale(key, generation)
+
+        if size < self.worker_threshold:
+            apply(compute(cancelled))
+            return
+
+        self._submit(key, generation, compute, apply)
+
+    def _submit(self, key, generation, compute, apply):
+        """Передача запроса фоновому потоку и запуск опроса результатов"""
+        cancelled = lambda: self._is_stale(key, generation)
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=1)
+        future = self.executor.submit(compute, cancelled)
+        future.add_done_callback(lambda f: self.results.put((key, generation, f, apply)))
+        self.in_flight += 1
+        if self.polling is None:
+            self.polling = self.root.after(self.poll_interval, self._poll)
+
+    def _poll(self):
+        """Передача готовых результатов из фонового потока в интерфейс"""
+        self.polling = None
+        while True:
+            try:
+                key, generation, future, apply = self.results.get_nowait()
+            except queue.Empty:
+                break
+            self.in_flight -= 1
+            if future.cancelled() or self._is_stale(key, generation):
+                continue
+            apply(future.result())
+
+        if self.in_flight:
+            self.polling = self.root.after(self.poll_interval, self._poll)
+
+    def shutdown(self):
+        """Остановка фонового потока и отмена ожидающих запросов"""
+        for key in list(self.pending):
+            self.cancel(key)
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
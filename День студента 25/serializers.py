@@ -0,0 +1,388 @@
+import io
+import json
+import re
+import struct
+from collections import Counter
+
+
+MAGIC = b"SD25BIN\x01"
+
+WHITESPACE = re.compile(r"[ \t\n\r]*")
+NUMBER_CHARS = frozenset("0123456789.eE+-")
+
+
+class JSONStream:
+    """Чтение JSON блоками: значения разбираются по одному, не дожидаясь конца файла"""
+
+    def __init__(self, f, chunk_size=1 << 16):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buf = ""
+        self.pos = 0
+
+    def _fill(self):
+        """Дочитывание следующего блока; прочитанная часть буфера отбрасывается"""
+        chunk = self.f.read(self.chunk_size)
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return bool(chunk)
+
+    def peek(self):
+        """Следующий значимый символ или пустая строка в конце файла"""
+        while True:
+            self.pos = WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ""
+
+    def accept(self, char):
+        """Пропуск символа, если он следующий"""
+        if self.peek() == char:
+            self.pos += 1
+            return True
+        return False
+
+    def expect(self, char):
+        if not self.accept(char):
+            raise ValueError(f"Ожидался символ {char!r} в снимке данных")
+
+    def value(self):
+        """Разбор одного значения целиком"""
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+            except ValueError:
+                if not self._fill():
+                    raise
+                continue
+            # Число на границе блока могло прочитаться не полностью
+            if (end == len(self.buf) or self.buf[end] in NUMBER_CHARS) and self._fill():
+                continue
+            self.pos = end
+            return value
+
+
+def iter_snapshot(f):
+    """Пары (ключ, значение) снимка; массивы разбираются поэлементно по мере чтения"""
+    stream = JSONStream(f)
+    stream.expect("{")
+    if stream.accept("}"):
+        return
+    while True:
+        key = stream.value()
+        stream.expect(":")
+        if stream.accept("["):
+            items = []
+            if not stream.accept("]"):
+                items.append(stream.value())
+                while stream.accept(","):
+                    items.append(stream.value())
+                stream.expect("]")
+            yield key, items
+        else:
+            yield key, stream.value()
+        if not stream.accept(","):
+            stream.expect("}")
+            return
+
+
+class JSONSerializer:
+    """Снимок в читаемом JSON с отступами, как в прежних версиях"""
+
+    def dump(self, snapshot, f):
+        """Запись снимка в открытый на запись двоичный файл"""
+        text = io.TextIOWrapper(f, encoding="utf-8")
+        json.dump(snapshot, text, ensure_ascii=False, indent=4)
+        text.flush()
+        text.detach()
+
+    def stream(self, path):
+        """Пары (ключ, значение) снимка по мере чтения файла"""
+        with open(path, "r", encoding="utf-8") as f:
+            yield from iter_snapshot(f)
+
+
+# Метки значений двоичного формата
+NONE, FALSE, TRUE, INT, FLOAT, STR, STR_REF, TIMESTAMP = range(8)
+
+# Разделы снимка: массив записей или одна запись (счетчики id)
+LIST_SECTION, DICT_SECTION = b"L", b"D"
+
+TIMESTAMP_RE = re.compile(r"\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}")
+
+# Более длинные строки (тексты заметок) не интернируются
+INTERN_MAX_LENGTH = 64
+
+DOUBLE = struct.Struct("<d")
+
+
+def write_varint(out, value):
+    """Беззнаковое целое переменной длины, по 7 бит в байте"""
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def read_varint(data, pos):
+    """Чтение целого переменной длины; возвращает значение и новую позицию"""
+    value = data[pos]
+    pos += 1
+    if value < 0x80:
+        return value, pos
+    value &= 0x7F
+    shift = 7
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+def write_bytes(out, raw):
+    write_varint(out, len(raw))
+    out += raw
+
+
+class StringTable:
+    """Строки раздела, встречающиеся больше одного раза; в записях на них ссылаются по номеру"""
+
+    def __init__(self, records):
+        values = Counter()
+        keys = {}
+        for record in records:
+            values.update(record.values())
+            keys.update(dict.fromkeys(record))
+
+        # Части каждой различной строки вычисляются один раз и используются при записи
+        self.parts = {}
+        counts = Counter()
+        for value, count in values.items():
+            if value.__class__ is str:
+                parts = self.parts[value] = split_timestamp(value)
+                for part in parts:
+                    if len(part) <= INTERN_MAX_LENGTH:
+                        counts[part] += count
+
+        # Имена полей есть в каждой записи и попадают в таблицу всегда
+        self.strings = list(keys) + [string for string, count in counts.items() if count > 1 and string not in keys]
+        self.index = {string: i for i, string in enumerate(self.strings)}
+
+    def dump(self, out):
+        write_varint(out, len(self.strings))
+        for string in self.strings:
+            write_bytes(out, string.encode("utf-8"))
+
+
+def split_timestamp(value):
+    """Отметка времени делится на дату и время, чтобы общая дата хранилась один раз"""
+    if len(value) == 19 and value[10] == " " and TIMESTAMP_RE.fullmatch(value):
+        return value[:10], value[11:]
+    return (value,)
+
+
+class BinarySerializer:
+    """Компактный двоичный снимок: записи с префиксом длины и таблица повторяющихся строк"""
+
+    def dump(self, snapshot, f):
+        """Запись снимка в открытый на запись двоичный файл"""
+        f.write(MAGIC)
+        for key, value in snapshot.items():
+            records = value if isinstance(value, list) else [value]
+            table = StringTable(records)
+            index = table.index
+
+            # Набор и порядок полей записей одного типа обычно совпадают и хранятся один раз
+            shapes = {}
+            bodies = []
+            for record in records:
+                keys = tuple(record)
+                shape = shapes.get(keys)
+                if shape is None:
+                    shape = shapes[keys] = len(shapes)
+                body = bytearray()
+                write_varint(body, shape)
+                for item in record.values():
+                    # Короткий путь для строк из таблицы и небольших чисел
+                    if item.__class__ is str:
+                        ref = index.get(item)
+                        if ref is not None and ref < 0x80:
+                            body.append(STR_REF)
+                            body.append(ref)
+                            continue
+                    elif item.__class__ is int and 0 <= item < 0x40:
+                        body.append(INT)
+                        body.append(item << 1)
+                        continue
+                    self._value(body, item, table)
+                bodies.append(body)
+
+            out = bytearray()
+            write_bytes(out, key.encode("utf-8"))
+            out += LIST_SECTION if isinstance(value, list) else DICT_SECTION
+            table.dump(out)
+            write_varint(out, len(shapes))
+            for keys in shapes:
+                write_varint(out, len(keys))
+                for name in keys:
+                    write_varint(out, index[name])
+            if isinstance(value, list):
+                write_varint(out, len(bodies))
+            for body in bodies:
+                write_bytes(out, body)
+            f.write(out)
+
+    def _value(self, out, value, table):
+        index = table.index
+        if isinstance(value, str):
+            parts = table.parts[value]
+            if len(parts) == 2:
+                out.append(TIMESTAMP)
+            for part in parts:
+                ref = index.get(part)
+                if ref is None:
+                    out.append(STR)
+                    write_bytes(out, part.encode("utf-8"))
+                else:
+                    out.append(STR_REF)
+                    write_varint(out, ref)
+        elif value is None:
+            out.append(NONE)
+        elif value is True:
+            out.append(TRUE)
+        elif value is False:
+            out.append(FALSE)
+        elif isinstance(value, int):
+            out.append(INT)
+            # Знак переносится в младший бит
+            write_varint(out, value << 1 if value >= 0 else (-value << 1) - 1)
+        elif isinstance(value, float):
+            out.append(FLOAT)
+            out += DOUBLE.pack(value)
+        else:
+            raise TypeError(f"Значение {value!r} нельзя записать в двоичный снимок")
+
+    def stream(self, path):
+        """Пары (ключ, значение) снимка; разделы разбираются по одному"""
+        with open(path, "rb") as f:
+            data = f.read()
+        if not data.startswith(MAGIC):
+            raise ValueError("Файл не является двоичным снимком данных")
+
+        pos = len(MAGIC)
+        while pos < len(data):
+            size, pos = read_varint(data, pos)
+            key = data[pos:pos + size].decode("utf-8")
+            pos += size
+            section = data[pos:pos + 1]
+            pos += 1
+
+            count, pos = read_varint(data, pos)
+            table = []
+            for _ in range(count):
+                size, pos = read_varint(data, pos)
+                table.append(data[pos:pos + size].decode("utf-8"))
+                pos += size
+
+            count, pos = read_varint(data, pos)
+            shapes = []
+            for _ in range(count):
+                size, pos = read_varint(data, pos)
+                keys = []
+                for _ in range(size):
+                    ref, pos = read_varint(data, pos)
+                    keys.append(table[ref])
+                shapes.append(keys)
+
+            if section == LIST_SECTION:
+                count, pos = read_varint(data, pos)
+                records, pos = self._read_records(data, pos, count, table, shapes)
+                yield key, records
+            else:
+                records, pos = self._read_records(data, pos, 1, table, shapes)
+                yield key, records[0]
+
+    def _read_records(self, data, pos, count, table, shapes):
+        """Разбор count записей подряд; возвращает их и позицию после последней"""
+        records = []
+        for _ in range(count):
+            size = data[pos]
+            if size < 0x80:
+                pos += 1
+            else:
+                size, pos = read_varint(data, pos)
+            end = pos + size
+            shape = data[pos]
+            if shape < 0x80:
+                pos += 1
+            else:
+                shape, pos = read_varint(data, pos)
+
+            # Самые частые значения разбираются на месте, без вызова функций
+            values = []
+            append = values.append
+            while pos < end:
+                tag = data[pos]
+                ref = data[pos + 1] if pos + 1 < end else 0x80
+                if tag == STR_REF and ref < 0x80:
+                    append(table[ref])
+                    pos += 2
+                elif tag == INT and ref < 0x80:
+                    append((ref >> 1) if not ref & 1 else -((ref + 1) >> 1))
+                    pos += 2
+                elif tag == TIMESTAMP and ref == STR_REF and data[pos + 2] < 0x80 \
+                        and data[pos + 3] == STR_REF and data[pos + 4] < 0x80:
+                    append(table[data[pos + 2]] + " " + table[data[pos + 4]])
+                    pos += 5
+                elif tag == STR and ref < 0x80:
+                    pos += 2
+                    append(data[pos:pos + ref].decode("utf-8"))
+                    pos += ref
+                elif tag == NONE:
+                    append(None)
+                    pos += 1
+                else:
+                    value, pos = self._read_value(data, pos + 1, tag, table)
+                    append(value)
+            records.append(dict(zip(shapes[shape], values)))
+        return records, pos
+
+    def _read_value(self, data, pos, tag, table):
+        """Разбор значения с меткой tag, начинающегося с позиции pos"""
+        if tag == STR_REF:
+            ref, pos = read_varint(data, pos)
+            return table[ref], pos
+        if tag == STR:
+            size, pos = read_varint(data, pos)
+            return data[pos:pos + size].decode("utf-8"), pos + size
+        if tag == INT:
+            value, pos = read_varint(data, pos)
+            return (value >> 1) if not value & 1 else -((value + 1) >> 1), pos
+        if tag == TIMESTAMP:
+            day, pos = self._read_value(data, pos + 1, data[pos], table)
+            clock, pos = self._read_value(data, pos + 1, data[pos], table)
+            return f"{day} {clock}", pos
+        if tag == NONE:
+            return None, pos
+        if tag == TRUE:
+            return True, pos
+        if tag == FALSE:
+            return False, pos
+        if tag == FLOAT:
+            return DOUBLE.unpack_from(data, pos)[0], pos + DOUBLE.size
+        raise ValueError(f"Неизвестная метка значения {tag} в двоичном снимке")
+
+
+JSON = JSONSerializer()
+BINARY = BinarySerializer()
+
+def detect_serializer(path):
+    """Формат снимка по первым байтам файла"""
+    with open(path, "rb") as f:
+        header = f.read(len(MAGIC))
+    return BINARY if header == MAGIC else JSON
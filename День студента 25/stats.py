@@ -0,0 +1,90 @@
+from collections import Counter
+
+
+class StatsAggregator:
+    """Счетчики вкладки статистики, обновляемые при каждом изменении записи"""
+
+    def __init__(self, today):
+        self.today = today
+
+        # Вклад каждой записи в счетчики, чтобы правка и удаление вычитали старые значения
+        self.tasks = {}
+        self.events = {}
+        self.notes = set()
+
+        self.completed = 0
+        self.high_priority = 0
+        self.upcoming = 0
+        self.event_dates = Counter()
+
+    def build(self, kind, records):
+        """Подсчет по всем записям одного типа за один проход"""
+        for record in records:
+            self.put(kind, record)
+
+    def put(self, kind, record):
+        """Учет добавленной или измененной записи"""
+        self.remove(kind, record.id)
+        if kind == "tasks":
+            completed = bool(record.completed)
+            high = record.priority == "Высокий"
+            self.tasks[record.id] = (completed, high)
+            self.completed += completed
+            self.high_priority += high
+        elif kind == "events":
+            # Повторяющееся событие предстоит, пока не прошло его последнее повторение
+            date = record.end
+            self.events[record.id] = date
+            self.event_dates[date] += 1
+            if date >= self.today:
+                self.upcoming += 1
+        else:
+            self.notes.add(record.id)
+
+    def remove(self, kind, record_id):
+        """Вычитание вклада удаленной записи"""
+        if kind == "tasks":
+            old = self.tasks.pop(record_id, None)
+            if old is not None:
+                self.completed -= old[0]
+                self.high_priority -= old[1]
+        elif kind == "events":
+            date = self.events.pop(record_id, None)
+            if date is not None:
+                self.event_dates[date] -= 1
+                if not self.event_dates[date]:
+                    del self.event_dates[date]
+                if date >= self.today:
+                    self.upcoming -= 1
+        else:
+            self.notes.discard(record_id)
+
+    def clear(self, kind):
+        """Вычитание всех записей типа перед повторным подсчетом"""
+        ids = list(self.notes if kind == "notes" else getattr(self, kind))
+        for record_id in ids:
+            self.remove(kind, record_id)
+
+    def roll_over(self, today):
+        """Пересчет предстоящих событий после смены даты"""
+        if today == self.today:
+            return False
+        self.today = today
+        # Проход по различным датам, а не по всем событиям
+        self.upcoming = sum(count for date, count in self.event_dates.items() if date >= today)
+        return True
+
+    def values(self):
+        """Значения для подписей вкладки статистики"""
+        total_tasks = len(self.tasks)
+        total_events = len(self.events)
+        return {
+            "total_tasks": total_tasks,
+            "completed_tasks": self.completed,
+            "active_tasks": total_tasks - self.completed,
+            "high_priority": self.high_priority,
+            "total_events": total_events,
+            "upcoming_events": self.upcoming,
+            "past_events": total_events - self.upcoming,
+            "total_notes": len(self.notes),
+        }
@@ -0,0 +1,618 @@
+import itertools
+import json
+import os
+import threading
+import time
+from collections import Counter
+
+from blobs import BlobStore, content_hash
+from instrumentation import span
+from locking import FileLock
+from serializers import JSON, detect_serializer
+
+
+KINDS = ("tasks", "events", "notes")
+
+# Сколько id поток записи занимает в файле счетчиков за раз; они выдаются новым записям из памяти
+ID_BLOCK = 64
+
+class JournalStorage:
+    """Хранилище: снимок данных в файле и журнал изменений только на дозапись"""
+
+    def __init__(self, db_file, compact_threshold=500, coalesce_delay=0.05, serializer=JSON):
+        self.db_file = db_file
+        # Формат новых снимков; существующий снимок читается в том формате, в котором записан
+        self.serializer = serializer
+        self.journal_file = db_file + ".journal"
+        self.old_journal_file = db_file + ".journal.old"
+        self.file_lock = FileLock(db_file + ".lock")
+        # Выдача id не должна ждать записи журнала и сжатия, поэтому у нее своя блокировка
+        self.id_lock = FileLock(db_file + ".ids")
+        # Занятые заранее диапазоны id [следующий, конец) по типам и типы, для которых блок уже заказан
+        self._id_blocks = {kind: [] for kind in KINDS}
+        self._ids_pending = set()
+        self.compact_threshold = compact_threshold
+        self.coalesce_delay = coalesce_delay
+
+        self._journal = None
+        self._entries = 0
+        self._compact_pending = 0
+
+        # Очередь фонового потока записи: строки журнала и задания сжатия
+        self._cond = threading.Condition()
+        self._pending = []
+        self._writing = False
+        self._closing = False
+        self._writer = None
+        self.error = None
+
+        # Тексты заметок хранятся отдельно по хешу; еще не записанные ждут в памяти
+        self.blobs = BlobStore(db_file + ".blobs")
+        self._known_blobs = set()
+        self._pending_blobs = {}
+
+        # Несколько процессов пишут в один журнал; строки несут версию и номер процесса.
+        # Прочитанная часть журнала: его inode, смещение и версия последнего сжатия
+        self.writer_id = os.getpid()
+        self.version = 0
+        self._inode = None
+        self._offset = 0
+        self._base = 0
+        self._signature = None
+        self._sync = threading.Lock()
+        # Версии собственных изменений записей; еще не записанные считаются новее любых чужих
+        self._own = {}
+        self._own_pending = Counter()
+
+    def load(self):
+        """Загрузка снимка и воспроизведение хвоста журнала"""
+        return dict(self.stream())
+
+    def stream(self):
+        """Потоковая загрузка: пары (тип, словари записей) по мере чтения снимка и ("next_ids", счетчики)"""
+        # Журнал незавершенного сжатия воспроизводится первым, затем текущий
+        changes = {kind: [] for kind in KINDS}
+        next_ids = {kind: 1 for kind in KINDS}
+        self._entries = 0
+
+        # Журнал читается и снимок открывается под блокировкой, чтобы другой процесс
+        # не сжал их между этими шагами
+        pairs = iter(())
+        with self._sync, self.file_lock.shared() as state:
+            self._signature = self._stat()
+            self._entries += self._read_journal(self.old_journal_file, changes, next_ids)
+            self._inode = self._journal_inode()
+            self._offset = 0
+            self._base = state.version
+            self.version = state.version
+            self._entries += self._read_journal(self.journal_file, changes, next_ids, track=True)
+            if os.path.exists(self.db_file):
+                pairs = detect_serializer(self.db_file).stream(self.db_file)
+                first = next(pairs, None)
+                if first is not None:
+                    pairs = itertools.chain([first], pairs)
+
+        seen = set()
+        for key, value in pairs:
+            seen.add(key)
+            if key == "next_ids":
+                yield key, {kind: max(value.get(kind, 1), next_ids[kind]) for kind in KINDS}
+            elif key in changes:
+                yield key, self._replay(value, changes[key])
+
+        if "next_ids" not in seen:
+            yield "next_ids", next_ids
+        for kind in KINDS:
+            if kind not in seen:
+                yield kind, self._replay([], changes[kind])
+
+    def _read_journal(self, path, changes, next_ids, track=False):
+        """Чтение изменений из журнала с разбивкой по типам записей"""
+        if not os.path.exists(path):
+            return 0
+
+        count = 0
+        for entry in self._entries_from(path, 0, track):
+            kind = entry.get("kind")
+            if kind not in changes:
+                continue
+            if entry["op"] == "put":
+                record_id = entry["record"]["id"]
+            elif entry["op"] == "delete":
+                record_id = entry["id"]
+            else:
+                continue
+            changes[kind].append(entry)
+            # id удаленных записей тоже не выдаются повторно
+            next_ids[kind] = max(next_ids[kind], record_id + 1)
+            count += 1
+        return count
+
+    def _entries_from(self, path, offset, track=False):
+        """Строки журнала после смещения; с track запоминается прочитанная часть и версия"""
+        with open(path, "rb") as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    # Строка, оборванная сбоем, будет отделена при следующей дозаписи
+                    break
+                offset += len(line)
+                if track:
+                    self._offset = offset
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if track:
+                    self.version = max(self.version, entry.get("v", 0))
+                yield entry
+
+    def _journal_inode(self):
+        try:
+            return os.stat(self.journal_file).st_ino
+        except FileNotFoundError:
+            return None
+
+    def _stat(self):
+        """Отпечаток файлов базы: изменился ли хоть один с прошлой проверки"""
+        signature = []
+        for path in (self.journal_file, self.db_file):
+            try:
+                st = os.stat(path)
+                signature.append((st.st_ino, st.st_size, st.st_mtime_ns))
+            except FileNotFoundError:
+                signature.append(None)
+        return tuple(signature)
+
+    def changes(self):
+        """Изменения других процессов после прошлой проверки: (строки журнала, данные или None).
+        Если другой процесс успел сжать журнал с непрочитанными строками, вместо строк
+        возвращаются все данные, и вызывающий сравнивает их со своими"""
+        signature = self._stat()
+        if signature == self._signature:
+            return [], None
+
+        with self._sync:
+            with self.file_lock.shared() as state:
+                inode = self._journal_inode()
+                size = os.path.getsize(self.journal_file) if inode is not None else 0
+                if inode != self._inode or state.version != self._base or size < self._offset:
+                    # Журнал сжат: если в нем были непрочитанные строки, нужна сверка с данными
+                    if state.version > self.version or os.path.exists(self.old_journal_file):
+                        return [], self._reload(state)
+                    self._inode = inode
+                    self._offset = 0
+                    self._base = state.version
+                self._signature = signature
+
+                seen = self.version
+                entries = []
+                if inode is not None:
+                    for entry in self._entries_from(self.journal_file, self._offset, track=True):
+                        if entry.get("w") == self.writer_id or entry.get("v", 0) <= seen:
+                            continue
+                        entries.append(entry)
+
+        self._entries += len(entries)
+        with self._cond:
+            entries = [entry for entry in entries if not self.is_newer_locally(*entry_key(entry), entry.get("v", 0))]
+            if len(self._own) > 4096:
+                # Свои изменения не новее прочитанного больше ни с чем не конфликтуют
+                self._own = {key: v for key, v in self._own.items() if v > self.version}
+        return entries, None
+
+    def _reload(self, state):
+        """Полное чтение данных для сверки после чужого сжатия (вызывается под блокировками)"""
+        data = {}
+        changes = {kind: [] for kind in KINDS}
+        next_ids = {kind: 1 for kind in KINDS}
+        self._signature = self._stat()
+        self._read_journal(self.old_journal_file, changes, next_ids)
+        self._inode = self._journal_inode()
+        self._offset = 0
+        self._base = self.version = state.version
+        self._entries = self._read_journal(self.journal_file, changes, next_ids, track=True)
+        if os.path.exists(self.db_file):
+            data = dict(detect_serializer(self.db_file).stream(self.db_file))
+        snapshot_ids = data.get("next_ids", {})
+        result = {"next_ids": {kind: max(snapshot_ids.get(kind, 1), next_ids[kind]) for kind in KINDS}}
+        for kind in KINDS:
+            result[kind] = self._replay(data.get(kind, []), changes[kind])
+        return result
+
+    def is_newer_locally(self, kind, record_id, version):
+        """Есть ли у записи собственное изменение новее указанной версии"""
+        key = (kind, record_id)
+        return key in self._own_pending or self._own.get(key, 0) > version
+
+    def reserve_id(self, kind, floor, count=1):
+        """Выдача id новых записей, согласованная между процессами; возвращает первый из count подряд.
+
+        id берутся из блоков, которые поток записи занял заранее. Файл счетчиков читается
+        в вызывающем потоке, только если блок кончился раньше или серия в него не помещается.
+        """
+        with self._cond:
+            record_id = self._take_id(kind, floor, count)
+        if record_id is None:
+            with self.id_lock.exclusive() as state:
+                record_id = max(state.next_ids.get(kind, 1), floor)
+                state.next_ids[kind] = record_id + count
+                state.save()
+        self._refill_ids(kind)
+        return record_id
+
+    def _take_id(self, kind, floor, count):
+        """Первый из count подряд id занятых блоков или None"""
+        blocks = self._id_blocks[kind]
+        while blocks:
+            block = blocks[0]
+            start = max(block[0], floor)
+            if start >= block[1]:
+                blocks.pop(0)
+                continue
+            if start + count > block[1]:
+                return None
+            block[0] = start + count
+            return start
+        return None
+
+    def prefetch_ids(self):
+        """Заказ блоков id всех типов, чтобы и первая новая запись не ждала файла счетчиков"""
+        for kind in KINDS:
+            self._refill_ids(kind)
+
+    def _refill_ids(self, kind):
+        """Заказ следующего блока id потоку записи, когда свободных id остается мало"""
+        with self._cond:
+            left = sum(stop - start for start, stop in self._id_blocks[kind])
+            if left >= ID_BLOCK // 2 or kind in self._ids_pending:
+                return
+            self._ids_pending.add(kind)
+        self._enqueue(("ids", kind))
+
+    def _reserve_block(self, kind):
+        """Занятие блока id в файле счетчиков (в потоке записи)"""
+        try:
+            with self.id_lock.exclusive() as state:
+                start = state.next_ids.get(kind, 1)
+                state.next_ids[kind] = start + ID_BLOCK
+                state.save()
+        finally:
+            with self._cond:
+                self._ids_pending.discard(kind)
+        with self._cond:
+            self._id_blocks[kind].append([start, start + ID_BLOCK])
+
+    def _release_ids(self):
+        """Возврат невыданных id, если после них другие процессы ничего не занимали"""
+        with self._cond:
+            blocks = {kind: [block for block in blocks if block[0] < block[1]]
+                      for kind, blocks in self._id_blocks.items()}
+            self._id_blocks = {kind: [] for kind in KINDS}
+        if not any(blocks.values()):
+            return
+        with self.id_lock.exclusive() as state:
+            for kind, kind_blocks in blocks.items():
+                for start, stop in sorted(kind_blocks, key=lambda block: block[1], reverse=True):
+                    if state.next_ids.get(kind) == stop:
+                        state.next_ids[kind] = start
+            state.save()
+
+    def _replay(self, snapshot_records, entries):
+        """Применение изменений из журнала к записям одного типа из снимка"""
+        if not entries:
+            return snapshot_records
+        records = {record.get("id"): record for record in snapshot_records}
+        for entry in entries:
+            if entry["op"] == "put":
+                records[entry["record"]["id"]] = entry["record"]
+            else:
+                records.pop(entry["id"], None)
+        return list(records.values())
+
+    def append(self, op, kind, payload):
+        """Постановка изменения в очередь фоновой записи журнала"""
+        self.append_many(((op, kind, payload),))
+
+    def append_many(self, changes):
+        """Постановка серии изменений (op, kind, payload) в очередь одним заданием"""
+        entries = []
+        for op, kind, payload in changes:
+            if op == "put":
+                entries.append({"op": op, "kind": kind, "record": payload})
+            else:
+                entries.append({"op": op, "kind": kind, "id": payload})
+        with self._cond:
+            for entry in entries:
+                self._own_pending[entry_key(entry)] += 1
+        self._enqueue(("entries", entries))
+        self._entries += len(entries)
+
+    def put_blob(self, text):
+        """Постановка текста в очередь записи; возвращает его хеш. Повторный текст не пишется"""
+        digest = content_hash(text)
+        with self._cond:
+            if digest in self._known_blobs or digest in self._pending_blobs:
+                return digest
+        if self.blobs.exists(digest):
+            with self._cond:
+                self._known_blobs.add(digest)
+            return digest
+        with self._cond:
+            self._pending_blobs[digest] = text
+        # Блок встает в очередь раньше строки журнала, которая на него сошлется
+        self._enqueue(("blob", digest, text))
+        return digest
+
+    def get_blob(self, digest):
+        """Текст по хешу, в том числе еще не записанный на диск"""
+        with self._cond:
+            text = self._pending_blobs.get(digest)
+        if text is not None:
+            return text
+        return self.blobs.read(digest)
+
+    def collect_blobs(self, live):
+        """Удаление давно не используемых текстов"""
+        with self._cond:
+            live = set(live) | set(self._pending_blobs)
+        self.blobs.collect(live)
+
+    def _enqueue(self, item):
+        """Передача задания потоку записи, запускаемому при первом изменении"""
+        with self._cond:
+            if self.error is not None:
+                raise self.error
+            self._pending.append(item)
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop, daemon=True)
+                self._writer.start()
+            self._cond.notify_all()
+
+    def _write_loop(self):
+        """Поток записи: накопившиеся изменения уходят на диск одной записью"""
+        while True:
+            with self._cond:
+                while not self._pending and not self._closing:
+                    self._cond.wait()
+                if not self._pending:
+                    self._writer = None
+                    return
+                closing = self._closing
+
+            # Короткая пауза собирает серию быстрых изменений в одну запись
+            if self.coalesce_delay and not closing:
+                time.sleep(self.coalesce_delay)
+
+            with self._cond:
+                items = self._pending
+                self._pending = []
+                self._writing = True
+            try:
+                self._process(items)
+            except OSError as e:
+                with self._cond:
+                    # Незаписанное возвращается в очередь, ошибка передается вызывающему коду;
+                    # повтор уже записанных строк журнала при загрузке безвреден
+                    self._pending = items + self._pending
+                    self.error = e
+                    self._writing = False
+                    self._writer = None
+                    self._cond.notify_all()
+                return
+            with self._cond:
+                self._writing = False
+                self._cond.notify_all()
+
+    def _process(self, items):
+        """Запись строк журнала и выполнение сжатий в порядке постановки в очередь"""
+        lines = []
+        for item in items:
+            if item[0] == "entries":
+                lines.extend(item[1])
+            elif item[0] == "ids":
+                self._reserve_block(item[1])
+            elif item[0] == "blob":
+                digest, text = item[1:]
+                self.blobs.write(digest, text)
+                with self._cond:
+                    self._pending_blobs.pop(digest, None)
+                    self._known_blobs.add(digest)
+            else:
+                self._write_lines(lines)
+                lines = []
+                try:
+                    self._compact_shared(*item[1:])
+                finally:
+                    with self._cond:
+                        self._compact_pending -= 1
+        self._write_lines(lines)
+
+    def _write_lines(self, entries):
+        """Дозапись изменений в журнал с fsync под блокировкой; каждое получает следующую версию"""
+        if not entries:
+            return
+        with span("save.journal"), self.file_lock.exclusive() as state:
+            self._reopen_if_replaced()
+            if self._journal is None:
+                self._journal = self._open_journal()
+            version = self._last_version(state)
+
+            lines = []
+            written = {}
+            for entry in entries:
+                version += 1
+                lines.append(json.dumps(dict(entry, v=version, w=self.writer_id), ensure_ascii=False) + "\n")
+                written[entry_key(entry)] = version
+            self._journal.write("".join(lines))
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+
+        with self._cond:
+            for entry in entries:
+                key = entry_key(entry)
+                self._own_pending[key] -= 1
+                if not self._own_pending[key]:
+                    del self._own_pending[key]
+            self._own.update(written)
+
+    def _reopen_if_replaced(self):
+        """Другой процесс мог сжать журнал: дозапись должна идти в новый файл"""
+        if self._journal is not None and os.fstat(self._journal.fileno()).st_ino != self._journal_inode():
+            self._journal.close()
+            self._journal = None
+
+    def _last_version(self, state):
+        """Версия последней строки журнала, кем бы она ни была записана"""
+        version = state.version
+        size = os.path.getsize(self.journal_file)
+        if not size:
+            return version
+        with open(self.journal_file, "rb") as f:
+            f.seek(max(0, size - 65536))
+            for line in reversed(f.read().splitlines()):
+                try:
+                    return max(version, json.loads(line).get("v", 0))
+                except ValueError:
+                    continue
+        return version
+
+    def _compact_shared(self, snapshot, next_ids, serialize, position):
+        """Сжатие под блокировкой, если снимок из памяти учитывает все чужие изменения журнала"""
+        inode, offset, version, base = position
+        with span("save.snapshot"), self.file_lock.exclusive() as state:
+            # Оптимистичная проверка: после копирования данных в журнале не должно быть
+            # чужих строк, которые этот процесс еще не принял; иначе сжатие откладывается
+            current = self._journal_inode()
+            if state.version != base or (inode is not None and current != inode):
+                return
+            # Журнал, созданный уже после чтения, проверяется с начала: в нем могут быть только свои строки
+            if current is not None:
+                for entry in self._entries_from(self.journal_file, offset if inode is not None else 0):
+                    if entry.get("w") != self.writer_id:
+                        return
+                    version = max(version, entry.get("v", 0))
+
+            self._rotate_journal()
+            self._write_snapshot(snapshot, next_ids, serialize)
+            state.version = version
+            state.save(durable=True)
+
+        with self._sync:
+            # Непрочитанными остались только собственные строки сжатого журнала
+            if self._inode == inode:
+                self._inode = None
+                self._offset = 0
+                self._base = version
+                self.version = max(self.version, version)
+
+    def _open_journal(self):
+        """Открытие журнала на дозапись с отделением оборванной строки"""
+        torn = False
+        if os.path.exists(self.journal_file) and os.path.getsize(self.journal_file) > 0:
+            with open(self.journal_file, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                torn = f.read(1) != b"\n"
+
+        journal = open(self.journal_file, "a", encoding="utf-8")
+        if torn:
+            journal.write("\n")
+        return journal
+
+    def needs_compaction(self):
+        """Проверка, пора ли свернуть журнал в снимок"""
+        return self._entries >= self.compact_threshold and not self.is_compacting()
+
+    def is_compacting(self):
+        """Ожидает ли сжатие своей очереди в потоке записи"""
+        return self._compact_pending > 0
+
+    def compact(self, data, next_ids=None, serialize=None, background=True):
+        """Сворачивание журнала в новый снимок"""
+        # Копия делается в вызывающем потоке, чтобы дальнейшие правки ее не задели.
+        # Словари копируются целиком, неизменяемые записи преобразует serialize в фоне
+        if serialize is None:
+            snapshot = {kind: [dict(r) for r in data.get(kind, [])] for kind in KINDS}
+        else:
+            snapshot = {kind: list(data.get(kind, [])) for kind in KINDS}
+
+        with self._cond:
+            self._compact_pending += 1
+        self._entries = 0
+        # Прочитанная к моменту копирования часть журнала: все до нее уже есть в копии
+        with self._sync:
+            position = (self._inode, self._offset, self.version, self._base)
+        self._enqueue(("compact", snapshot, next_ids, serialize, position))
+        if not background:
+            self.flush()
+
+    def _rotate_journal(self):
+        """Перенос журнала в .old: его записи войдут в снимок, который сейчас будет записан"""
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+        if os.path.exists(self.journal_file):
+            if os.path.exists(self.old_journal_file):
+                # Остаток прерванного сжатия еще не попал в снимок
+                with open(self.journal_file, "r", encoding="utf-8") as src, \
+                        open(self.old_journal_file, "a", encoding="utf-8") as dst:
+                    dst.write("\n" + src.read())
+                    dst.flush()
+                    os.fsync(dst.fileno())
+                os.remove(self.journal_file)
+            else:
+                os.replace(self.journal_file, self.old_journal_file)
+
+    def _write_snapshot(self, snapshot, next_ids=None, serialize=None):
+        """Запись снимка во временный файл и атомарная замена основного"""
+        if serialize is not None:
+            snapshot = {kind: [serialize(r) for r in records] for kind, records in snapshot.items()}
+        if next_ids:
+            # Счетчики идут первыми, чтобы потоковая загрузка получила их до записей
+            snapshot = {"next_ids": dict(next_ids), **snapshot}
+
+        write_file(self.db_file, snapshot, self.serializer)
+
+        if os.path.exists(self.old_journal_file):
+            os.remove(self.old_journal_file)
+
+    def flush(self):
+        """Ожидание записи на диск всех поставленных в очередь изменений"""
+        with self._cond:
+            while (self._pending or self._writing) and self.error is None:
+                self._cond.wait()
+            if self.error is not None:
+                raise self.error
+
+    def close(self):
+        """Запись очереди, остановка потока записи и закрытие журнала"""
+        with self._cond:
+            self._closing = True
+            self._cond.notify_all()
+            writer = self._writer
+        if writer is not None:
+            writer.join()
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+        if self.error is None:
+            self._release_ids()
+        self.file_lock.close()
+        self.id_lock.close()
+        if self.error is not None:
+            raise self.error
+
+
+def entry_key(entry):
+    """Тип и id записи, к которой относится строка журнала"""
+    return entry["kind"], entry["record"]["id"] if entry["op"] == "put" else entry["id"]
+
+
+def write_file(path, snapshot, serializer):
+    """Запись снимка во временный файл с fsync и атомарная замена основного"""
+    tmp_file = path + ".tmp"
+    with open(tmp_file, "wb") as f:
+        serializer.dump(snapshot, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_file, path)
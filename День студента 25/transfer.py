@@ -0,0 +1,361 @@
+import csv
+import os
+import re
+from datetime import date, datetime, timedelta, timezone
+
+from models import TIMESTAMP_FORMAT, parse_datetime
+from recurrence import REPEATS, nth_day
+
+
+# Столбцы CSV каждого типа; при чтении неизвестные столбцы пропускаются, а id назначаются заново
+CSV_FIELDS = {
+    "tasks": ("id", "title", "description", "priority", "due_date", "completed", "created_at", "updated_at"),
+    "events": ("id", "title", "description", "date", "time", "duration", "reminder", "repeat", "repeat_interval",
+               "repeat_until", "repeat_except", "created_at", "updated_at"),
+    "notes": ("id", "title", "content", "created_at", "updated_at"),
+}
+
+# Компоненты iCalendar для типов записей
+ICS_COMPONENTS = {
+    "VTODO": "tasks",
+    "VEVENT": "events",
+    "VJOURNAL": "notes",
+}
+ICS_KINDS = {kind: component for component, kind in ICS_COMPONENTS.items()}
+
+# Приоритет iCalendar: 1-4 высокий, 5 средний, 6-9 низкий, 0 не задан
+ICS_PRIORITIES = {"Высокий": 1, "Средний": 5, "Низкий": 9}
+
+# Частоты RRULE для правил повторения; YEARLY читается как повтор каждые 12 месяцев
+ICS_FREQUENCIES = dict(zip(REPEATS, ("DAILY", "WEEKLY", "MONTHLY")))
+ICS_REPEATS = {frequency: repeat for repeat, frequency in ICS_FREQUENCIES.items()}
+
+DURATION_PATTERN = re.compile(r"^[-+]?P(?:(\d+)W)?(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?)?$")
+
+
+def detect_format(path):
+    """Формат файла обмена по расширению: csv, ics или None для выгрузок JSON и двоичных"""
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".csv":
+        return "csv"
+    if extension in (".ics", ".ical", ".ifb"):
+        return "ics"
+    return None
+
+
+def read_csv(path, kind):
+    """Построчное чтение CSV: по словарю на строку, файл целиком в память не загружается"""
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        reader = csv.DictReader(f)
+        if reader.fieldnames is None or "title" not in reader.fieldnames:
+            raise ValueError(f"в заголовке CSV нет столбца title: {path}")
+        for row in reader:
+            yield kind, {name: row[name] for name in CSV_FIELDS[kind] if name != "id" and row.get(name) is not None}
+
+
+def write_csv(path, kind, rows):
+    """Запись словарей записей в CSV по одной строке"""
+    tmp_file = path + ".tmp"
+    with open(tmp_file, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, CSV_FIELDS[kind], extrasaction="ignore")
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(row)
+    os.replace(tmp_file, path)
+
+
+def unfolded_lines(f):
+    """Логические строки iCalendar: строки продолжения, начинающиеся с пробела, присоединяются"""
+    current = None
+    for line in f:
+        line = line.rstrip("\r\n")
+        if line[:1] in (" ", "\t"):
+            if current is not None:
+                current += line[1:]
+            continue
+        if current is not None:
+            yield current
+        current = line
+    if current:
+        yield current
+
+
+def parse_property(line):
+    """Имя, параметры и значение свойства ИМЯ;ПАРАМЕТР=...:ЗНАЧЕНИЕ"""
+    head, _, value = line.partition(":")
+    name, *params = head.split(";")
+    return name.upper(), {k.upper(): v for k, _, v in (p.partition("=") for p in params)}, value
+
+
+def unescape_text(value):
+    """Снятие экранирования текстового значения"""
+    return re.sub(r"\\([\\;,nN])", lambda m: "\n" if m.group(1) in "nN" else m.group(1), value)
+
+
+def escape_text(value):
+    """Экранирование текстового значения"""
+    return value.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,").replace("\n", "\\n")
+
+
+def parse_ics_datetime(value, params):
+    """Дата или дата со временем iCalendar; время в UTC переводится в местное"""
+    if params.get("VALUE") == "DATE" or len(value) == 8:
+        return datetime.strptime(value[:8], "%Y%m%d").date()
+    if value.endswith("Z"):
+        moment = datetime.strptime(value[:-1], "%Y%m%dT%H%M%S").replace(tzinfo=timezone.utc)
+        return moment.astimezone().replace(tzinfo=None)
+    return datetime.strptime(value[:15], "%Y%m%dT%H%M%S")
+
+
+def ics_moment(props, name):
+    """Значение свойства даты; неразборчивое возвращается строкой, чтобы его отклонила проверка записи"""
+    value, params = props[name]
+    try:
+        return parse_ics_datetime(value, params)
+    except ValueError:
+        return value
+
+
+def ics_date(value, params):
+    """День значения даты строкой ГГГГ-ММ-ДД; неразборчивое значение возвращается как есть для проверки записи"""
+    try:
+        return parse_ics_datetime(value, params).strftime("%Y-%m-%d")
+    except ValueError:
+        return value
+
+
+def parse_duration(value):
+    """Длительность вида PT1H30M в минутах без учета знака; None для непонятного значения"""
+    match = DURATION_PATTERN.match(value.strip())
+    if not match:
+        return None
+    weeks, days, hours, minutes, seconds = (int(part or 0) for part in match.groups())
+    return ((weeks * 7 + days) * 24 + hours) * 60 + minutes + seconds // 60
+
+
+def parse_trigger(value):
+    """Минуты до события из смещения напоминания вида -PT15M; None для непонятного значения"""
+    if not value.strip().startswith("-"):
+        return None
+    return parse_duration(value)
+
+
+def ics_duration(props, start):
+    """Длительность события со временем в минутах по DTEND или DURATION; None, если ее нет"""
+    minutes = None
+    if "DTEND" in props:
+        end = ics_moment(props, "DTEND")
+        if isinstance(end, datetime):
+            minutes = int((end - start).total_seconds() // 60)
+    elif "DURATION" in props:
+        minutes = parse_duration(props["DURATION"][0])
+    return minutes if minutes and minutes > 0 else None
+
+
+def parse_rrule(value, start):
+    """Поля повторения события из RRULE; None для правила, которое не выражается повтором записи"""
+    rule = {k.upper(): v for k, _, v in (part.partition("=") for part in value.split(";"))}
+    frequency = rule.get("FREQ", "").upper()
+    interval = rule.get("INTERVAL", "1")
+    if not interval.isdigit() or not int(interval):
+        return None
+    interval = int(interval)
+    if frequency == "YEARLY":
+        frequency, interval = "MONTHLY", interval * 12
+    # Правила с BYDAY, BYMONTHDAY и подобными дают дни, которых нет в простом повторе
+    if frequency not in ICS_REPEATS or any(key.startswith("BY") for key in rule):
+        return None
+    repeat = ICS_REPEATS[frequency]
+    fields = {"repeat": repeat, "repeat_interval": interval if interval > 1 else None}
+    if "UNTIL" in rule:
+        fields["repeat_until"] = ics_date(rule["UNTIL"], {})
+    elif "COUNT" in rule and rule["COUNT"].isdigit() and int(rule["COUNT"]):
+        # Число повторений переводится в последний день; исключенные даты по RFC 5545 тоже входят в число
+        number, day = int(rule["COUNT"]) - 1, None
+        while day is None:
+            day = nth_day(start, repeat, interval, number)
+            number += 1
+        fields["repeat_until"] = day.strftime("%Y-%m-%d")
+    return fields
+
+
+def ics_row(kind, props):
+    """Словарь записи из свойств компонента iCalendar"""
+    row = {
+        "title": props.get("SUMMARY", ("", {}))[0],
+        "description": props.get("DESCRIPTION", ("", {}))[0],
+    }
+    for name, field in (("CREATED", "created_at"), ("LAST-MODIFIED", "updated_at")):
+        if name in props:
+            moment = ics_moment(props, name)
+            if isinstance(moment, datetime):
+                row[field] = moment.strftime(TIMESTAMP_FORMAT)
+
+    if kind == "tasks":
+        if "DUE" in props:
+            due = ics_moment(props, "DUE")
+            row["due_date"] = due if isinstance(due, str) else due.strftime("%Y-%m-%d")
+        priority = props.get("PRIORITY", ("0", {}))[0].strip()
+        if priority.isdigit() and int(priority):
+            priority = int(priority)
+            row["priority"] = "Высокий" if priority < 5 else "Средний" if priority == 5 else "Низкий"
+        row["completed"] = props.get("STATUS", ("", {}))[0].upper() == "COMPLETED"
+    elif kind == "events":
+        if "DTSTART" in props:
+            start = ics_moment(props, "DTSTART")
+            if isinstance(start, str):
+                row["date"] = start
+            else:
+                row["date"] = start.strftime("%Y-%m-%d")
+                if isinstance(start, datetime):
+                    row["time"] = start.strftime("%H:%M")
+                    duration = ics_duration(props, start)
+                    if duration:
+                        row["duration"] = duration
+                if "RRULE" in props:
+                    fields = parse_rrule(props["RRULE"][0], start if not isinstance(start, datetime) else start.date())
+                    if fields is not None:
+                        row.update(fields)
+                        if "EXDATE" in props:
+                            row["repeat_except"] = ",".join(ics_date(value, props["EXDATE"][1])
+                                                            for value in props["EXDATE"][0].split(",") if value)
+        if "TRIGGER" in props:
+            row["reminder"] = parse_trigger(props["TRIGGER"][0])
+    else:
+        row["content"] = row.pop("description")
+    return row
+
+
+def read_ics(path):
+    """Потоковое чтение iCalendar: задачи (VTODO), события (VEVENT) и заметки (VJOURNAL) по одной"""
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        kind = None
+        props = {}
+        nested = 0
+        for line in unfolded_lines(f):
+            if not line:
+                continue
+            name, params, value = parse_property(line)
+            if name == "BEGIN":
+                value = value.upper()
+                if kind is None and value in ICS_COMPONENTS:
+                    kind = ICS_COMPONENTS[value]
+                    props = {}
+                elif kind is not None:
+                    # Вложенный компонент, например VALARM: из него берется только смещение напоминания
+                    nested += 1
+            elif name == "END":
+                if nested:
+                    nested -= 1
+                elif kind is not None and value.upper() == ICS_KINDS[kind]:
+                    yield kind, ics_row(kind, props)
+                    kind = None
+            elif kind is not None:
+                if nested and name != "TRIGGER":
+                    continue
+                if name in ("SUMMARY", "DESCRIPTION"):
+                    value = unescape_text(value)
+                if name == "EXDATE" and name in props:
+                    # Исключенные даты могут идти несколькими свойствами
+                    props[name] = (props[name][0] + "," + value, props[name][1])
+                    continue
+                # Из повторяющихся свойств учитывается первое
+                props.setdefault(name, (value, params))
+
+
+def fold(line):
+    """Перенос строки iCalendar длиннее 75 байт"""
+    raw = line.encode("utf-8")
+    if len(raw) <= 75:
+        return line + "\r\n"
+    parts = []
+    while raw:
+        limit = 75 if not parts else 74
+        cut = min(limit, len(raw))
+        # Многобайтовый символ не разрезается
+        while cut < len(raw) and (raw[cut] & 0xC0) == 0x80:
+            cut -= 1
+        parts.append(raw[:cut].decode("utf-8"))
+        raw = raw[cut:]
+    return "\r\n ".join(parts) + "\r\n"
+
+
+def format_timestamp(value):
+    """Отметка времени хранения в виде iCalendar; None для пустой или неверной"""
+    moment = parse_datetime(value)
+    return moment.strftime("%Y%m%dT%H%M%S") if moment else None
+
+
+def ics_lines(kind, row, stamp):
+    """Строки компонента iCalendar для словаря записи"""
+    component = ICS_KINDS[kind]
+    yield f"BEGIN:{component}"
+    yield f"UID:{kind}-{row['id']}@student-day-25"
+    yield f"DTSTAMP:{stamp}"
+    yield f"SUMMARY:{escape_text(row.get('title') or '')}"
+    text = row.get("content" if kind == "notes" else "description")
+    if text:
+        yield f"DESCRIPTION:{escape_text(text)}"
+    for name, field in (("CREATED", "created_at"), ("LAST-MODIFIED", "updated_at")):
+        moment = format_timestamp(row.get(field))
+        if moment:
+            yield f"{name}:{moment}"
+
+    if kind == "tasks":
+        if row.get("due_date"):
+            yield f"DUE;VALUE=DATE:{row['due_date'].replace('-', '')}"
+        yield f"PRIORITY:{ICS_PRIORITIES.get(row.get('priority'), 0)}"
+        yield f"STATUS:{'COMPLETED' if row.get('completed') else 'NEEDS-ACTION'}"
+    elif kind == "events":
+        day = date.fromisoformat(row["date"])
+        if row.get("time"):
+            start = datetime.combine(day, datetime.strptime(row["time"], "%H:%M").time())
+            yield f"DTSTART:{start.strftime('%Y%m%dT%H%M%S')}"
+            if row.get("duration"):
+                yield f"DTEND:{(start + timedelta(minutes=int(row['duration']))).strftime('%Y%m%dT%H%M%S')}"
+        else:
+            start = None
+            yield f"DTSTART;VALUE=DATE:{day.strftime('%Y%m%d')}"
+            yield f"DTEND;VALUE=DATE:{(day + timedelta(days=1)).strftime('%Y%m%d')}"
+        if row.get("repeat") in ICS_FREQUENCIES:
+            yield from rrule_lines(row, start)
+        if row.get("reminder"):
+            yield "BEGIN:VALARM"
+            yield "ACTION:DISPLAY"
+            yield f"DESCRIPTION:{escape_text(row.get('title') or '')}"
+            yield f"TRIGGER:-PT{int(row['reminder'])}M"
+            yield "END:VALARM"
+    yield f"END:{component}"
+
+
+def rrule_lines(row, start):
+    """RRULE и EXDATE серии; у события со временем даты пишутся вместе со временем начала, как требует RFC 5545"""
+    def moment(value):
+        day = date.fromisoformat(value)
+        if start is None:
+            return day.strftime("%Y%m%d")
+        return datetime.combine(day, start.time()).strftime("%Y%m%dT%H%M%S")
+
+    rule = f"RRULE:FREQ={ICS_FREQUENCIES[row['repeat']]}"
+    if row.get("repeat_interval") and int(row["repeat_interval"]) > 1:
+        rule += f";INTERVAL={int(row['repeat_interval'])}"
+    if row.get("repeat_until"):
+        rule += f";UNTIL={moment(row['repeat_until'])}"
+    yield rule
+    skipped = [part.strip() for part in (row.get("repeat_except") or "").split(",") if part.strip()]
+    if skipped:
+        prefix = "EXDATE;VALUE=DATE" if start is None else "EXDATE"
+        yield f"{prefix}:{','.join(moment(value) for value in skipped)}"
+
+
+def write_ics(path, items):
+    """Запись пар (тип, словарь записи) в календарь iCalendar по одному компоненту"""
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    tmp_file = path + ".tmp"
+    with open(tmp_file, "w", encoding="utf-8", newline="") as f:
+        f.write("BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:-//День студента 25//RU\r\n")
+        for kind, row in items:
+            for line in ics_lines(kind, row, stamp):
+                f.write(fold(line))
+        f.write("END:VCALENDAR\r\n")
+    os.replace(tmp_file, path)
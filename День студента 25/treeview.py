@@ -0,0 +1,210 @@
+from bisect import bisect_left
+
+
+# Биты Shift и Control в поле state событий Tk
+SHIFT_MASK = 0x0001
+CONTROL_MASK = 0x0004
+
+
+def stable_items(items, position):
+    """Наибольшая подпоследовательность элементов, уже стоящих в нужном порядке"""
+    tails = []
+    tail_items = []
+    previous = {}
+    for item in items:
+        pos = position[item]
+        i = bisect_left(tails, pos)
+        previous[item] = tail_items[i - 1] if i else None
+        if i == len(tails):
+            tails.append(pos)
+            tail_items.append(item)
+        else:
+            tails[i] = pos
+            tail_items[i] = item
+
+    stable = set()
+    item = tail_items[-1] if tail_items else None
+    while item is not None:
+        stable.add(item)
+        item = previous[item]
+    return stable
+
+
+class TreeViewModel:
+    """Строки Treeview с id записи в качестве iid, обновляемые по разнице"""
+
+    def __init__(self, tree):
+        self.tree = tree
+        self.order = []
+        self.values = {}
+
+    def apply(self, rows):
+        """Приведение дерева к новому списку строк минимальным числом вызовов Tk"""
+        new_order = [str(values[0]) for values in rows]
+        new_values = dict(zip(new_order, rows))
+
+        removed = [iid for iid in self.order if iid not in new_values]
+        if removed:
+            self.tree.delete(*removed)
+
+        # Строки вне наибольшей упорядоченной подпоследовательности временно отцепляются,
+        # после этого позиции в дереве совпадают с позициями в новом списке
+        kept = [iid for iid in self.order if iid in new_values]
+        position = {iid: i for i, iid in enumerate(new_order)}
+        stable = stable_items(kept, position)
+        moved = [iid for iid in kept if iid not in stable]
+        if moved:
+            self.tree.detach(*moved)
+
+        for index, (iid, values) in enumerate(zip(new_order, rows)):
+            old_values = self.values.get(iid)
+            if old_values is None:
+                self.tree.insert("", index, iid=iid, values=values)
+                continue
+            if iid not in stable:
+                self.tree.move(iid, "", index)
+            if old_values != values:
+                self.tree.item(iid, values=values)
+
+        self.order = new_order
+        self.values = new_values
+
+
+class VirtualTreeView:
+    """Виртуальный список: в Treeview создаются только строки около видимой области"""
+
+    def __init__(self, tree, scrollbar, row_factory, window=150):
+        self.tree = tree
+        self.scrollbar = scrollbar
+        self.row_factory = row_factory
+        self.window = window
+
+        self.model = TreeViewModel(tree)
+        self.items = []
+        self.first = 0
+        self.selected = set()
+        self.focused = ""
+
+        self.tree.configure(yscrollcommand=self._on_tree_scroll)
+        self.scrollbar.configure(command=self._on_scrollbar)
+        self.tree.bind("<<TreeviewSelect>>", self._on_select, add="+")
+        self.tree.bind("<Home>", lambda event: self.jump(0))
+        self.tree.bind("<End>", lambda event: self.jump(len(self.items) - 1))
+        self.tree.bind("<Control-a>", lambda event: self.select_all())
+        for sequence in ("<ButtonPress-1>", "<Up>", "<Down>"):
+            self.tree.bind(sequence, self._on_new_selection, add="+")
+
+    def set_items(self, items):
+        """Новый отсортированный и отфильтрованный результат"""
+        self.items = items
+        ids = {str(item.id) for item in items}
+        self.selected &= ids
+        if self.focused not in ids:
+            self.focused = ""
+        self._render(self.first)
+
+    def focus(self):
+        """iid строки в фокусе, даже если она сейчас не создана в Treeview"""
+        return self.tree.focus() or self.focused
+
+    def selection(self):
+        """iid всех выбранных строк, включая прокрученные за пределы окна"""
+        return tuple(self.selected)
+
+    def select_all(self):
+        """Выделение всех строк результата, в том числе еще не созданных в Treeview"""
+        self.selected = {str(item.id) for item in self.items}
+        self.tree.selection_set(self.model.order)
+        return "break"
+
+    def _on_new_selection(self, event):
+        """Щелчок или стрелка без Shift и Control начинают новый выбор: строки за окном с него снимаются"""
+        if not event.state & (SHIFT_MASK | CONTROL_MASK):
+            self.selected = set()
+
+    def _on_select(self, event=None):
+        """Запоминание выбора с учетом строк за пределами окна"""
+        materialized = self.model.values
+        self.selected = {iid for iid in self.selected if iid not in materialized} | set(self.tree.selection())
+        focus = self.tree.focus()
+        if focus:
+            self.focused = focus
+
+    def _render(self, first, top=None):
+        """Создание строк окна, начинающегося с позиции first"""
+        total = len(self.items)
+        first = max(0, min(first, total - self.window))
+        self.first = first
+
+        window = self.items[first:first + self.window]
+        self.model.apply([self.row_factory(item) for item in window])
+
+        self.tree.selection_set([iid for iid in self.model.order if iid in self.selected])
+        if self.focused in self.model.values:
+            self.tree.focus(self.focused)
+        if top is not None and window:
+            self.tree.yview_moveto((top - first) / len(window))
+        self._update_scrollbar(*self.tree.yview())
+
+    def _update_scrollbar(self, lo, hi):
+        """Положение ползунка относительно всего результата, а не только окна"""
+        total = len(self.items)
+        count = len(self.model.order)
+        if not total or not count:
+            self.scrollbar.set(0.0, 1.0)
+            return
+        lo = (self.first + float(lo) * count) / total
+        hi = (self.first + float(hi) * count) / total
+        self.scrollbar.set(min(lo, 1.0), min(hi, 1.0))
+
+    def _on_tree_scroll(self, lo, hi):
+        """Сдвиг окна, когда видимая область подходит к его краю"""
+        count = len(self.model.order)
+        if count:
+            top = self.first + int(float(lo) * count + 0.5)
+            visible = max(1, int((float(hi) - float(lo)) * count + 0.5))
+            margin = max(1, (self.window - visible) // 4)
+            near_start = self.first > 0 and top - self.first < margin
+            near_end = (self.first + count < len(self.items)
+                        and self.first + count - (top + visible) < margin)
+            if near_start or near_end:
+                self._render(top - (self.window - visible) // 2, top)
+                return
+        self._update_scrollbar(lo, hi)
+
+    def _on_scrollbar(self, *args):
+        """Прокрутка полосой: перемещение окна к нужной позиции результата"""
+        total = len(self.items)
+        count = len(self.model.order)
+        if not total or not count:
+            return
+
+        lo, hi = self.tree.yview()
+        top = self.first + float(lo) * count
+        visible = max(1, (float(hi) - float(lo)) * count)
+        if args[0] == "moveto":
+            target = float(args[1]) * total
+        else:
+            step = int(args[1])
+            target = top + (step * visible if args[2] == "pages" else step)
+        target = int(max(0, min(target, total - visible)))
+
+        if self.first <= target and target + visible <= self.first + count:
+            self.tree.yview_moveto((target - self.first) / count)
+        else:
+            self._render(target - (self.window - int(visible)) // 2, target)
+
+    def jump(self, index):
+        """Переход к строке результата по ее номеру с выделением"""
+        if not self.items:
+            return "break"
+        index = max(0, min(index, len(self.items) - 1))
+        self._render(index - self.window // 2)
+
+        iid = str(self.items[index].id)
+        self.focused = iid
+        self.selected = {iid}
+        self.tree.focus(iid)
+        self.tree.selection_set(iid)
+        self.tree.see(iid)
+        return "break"